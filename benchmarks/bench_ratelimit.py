@@ -0,0 +1,34 @@
+"""
+刷屏限制基准测试：高消息速率下 SlidingWindowLimiter 的单次耗时与内存占用
+用法: python -m benchmarks.bench_ratelimit
+"""
+import random
+import time
+from telegram_monitoring.src.ratelimit import SlidingWindowLimiter
+
+HITS = 1_000_000
+RATE = 5_000  # 模拟每秒消息数
+SENDERS = [10, 1_000, 100_000]
+MAX_KEYS = 10_000
+rng = random.Random(42)
+
+def main():
+    for senders in SENDERS:
+        limiter = SlidingWindowLimiter(4.0, MAX_KEYS)
+        keys = [(uid, uid) for uid in (rng.randint(1, senders) for _ in range(HITS))]
+        now = 0.0
+        peak = 0
+        start = time.perf_counter()
+        for key in keys:
+            now += 1 / RATE
+            limiter.hit(key, now)
+            if len(limiter) > peak:
+                peak = len(limiter)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{senders:>7} senders: {elapsed / HITS * 1e9:>7.0f} ns/hit, "
+            f"{HITS / elapsed:>10.0f} hits/s, peak keys {peak}"
+        )
+
+if __name__ == "__main__":
+    main()
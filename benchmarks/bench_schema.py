@@ -0,0 +1,72 @@
+"""
+数据库结构基准测试：在 10 万用户的数据库上比较迁移前后的单点查询与列表联表耗时
+用法（需在项目根目录且已有 config.yaml）: python -m benchmarks.bench_schema
+"""
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from telegram_monitoring.src.sql import migrations
+
+USERS = 100_000
+LOOKUPS = 20_000
+JOINS = 20
+rng = random.Random(42)
+
+LOOKUP_SQL = "SELECT user_id FROM ban_users WHERE user_id = ?"
+JOIN_SQL = (
+    "SELECT allow_users.user_id, users.username, users.full_name FROM allow_users "
+    "INNER JOIN users ON allow_users.user_id = users.user_id"
+)
+
+def populate(con: sqlite3.Connection) -> None:
+    con.executescript(migrations[0])
+    ids = rng.sample(range(10_000_000, 9_000_000_000), USERS)
+    con.executemany(
+        "INSERT INTO users (user_id, username, full_name) VALUES (?, ?, ?)",
+        ((uid, f"@user{uid}", f"User {uid}") for uid in ids)
+    )
+    con.executemany("INSERT INTO allow_users (user_id) VALUES (?)", ((uid,) for uid in rng.sample(ids, USERS // 10)))
+    con.executemany("INSERT INTO ban_users (user_id) VALUES (?)", ((uid,) for uid in rng.sample(ids, USERS // 10)))
+    con.execute("PRAGMA user_version = 1")
+    con.commit()
+
+def measure(path: Path, label: str) -> None:
+    # 每次重新打开连接，避免语句缓存沿用旧结构的查询计划
+    con = sqlite3.connect(path)
+    ids = [row[0] for row in con.execute("SELECT user_id FROM users")]
+    probes = [rng.choice(ids) for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for uid in probes:
+        con.execute(LOOKUP_SQL, (uid,)).fetchone()
+    lookup = (time.perf_counter() - start) / LOOKUPS * 1e6
+    start = time.perf_counter()
+    for _ in range(JOINS):
+        con.execute(JOIN_SQL).fetchall()
+    join = (time.perf_counter() - start) / JOINS * 1000
+    print(f"{label}:")
+    for row in con.execute("EXPLAIN QUERY PLAN " + JOIN_SQL):
+        print(f"  plan: {row[-1]}")
+    print(f"  ban lookup {lookup:>8.2f} us/query")
+    print(f"  allow join {join:>8.2f} ms/query ({USERS // 10} rows)")
+    con.close()
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        con = sqlite3.connect(path)
+        con.execute("PRAGMA journal_mode=WAL")
+        populate(con)
+        con.close()
+        measure(path, "before (v1)")
+        con = sqlite3.connect(path)
+        start = time.perf_counter()
+        for target in range(2, len(migrations) + 1):
+            con.executescript(f"BEGIN;\n{migrations[target - 1]}\nPRAGMA user_version = {target};\nCOMMIT;")
+        print(f"migration: {(time.perf_counter() - start) * 1000:.1f} ms")
+        con.close()
+        measure(path, f"after (v{len(migrations)})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Socket.IO 序列化基准测试：比较各类事件在 JSON 与 msgpack 下的编码/解码耗时和传输字节数
+用法（需要安装 msgpack）: python -m benchmarks.bench_serializer
+"""
+import json
+import random
+import time
+from socketio import packet
+from telegram_monitoring.src.serializer import NegotiatedPacket, msgpack_available
+
+ROUNDS = 2_000
+WINDOWS = 10
+USERS = 1_000
+SCREENSHOT = 512 * 1024
+rng = random.Random(42)
+
+def window_data() -> dict:
+    now = int(time.time())
+    window_list = [
+        {"title": f"窗口 {i} - Visual Studio Code", "switch_window_time": now - (WINDOWS - i) * 60}
+        for i in range(WINDOWS)
+    ]
+    return {
+        "now_window": window_list[-1]["title"],
+        "switch_window_time": window_list[-1]["switch_window_time"],
+        "window_list": window_list,
+    }
+
+def events() -> list[tuple[str, int, list]]:
+    """(名称, 数据包类型, 数据)，ACK 的数据是回调的返回值"""
+    windows = window_data()
+    hard_info = {
+        "cpu_info": {"name": "AMD Ryzen 7 5800H with Radeon Graphics", "base_speed": "3.20 GHz", "cores": 8, "threads": 16, "usage": 12.5},
+        "memory": {"total_mb": 16_088, "available_mb": 7_311},
+        "battery": {"percent": 87, "is_charging": True},
+        "uptime": 123_456,
+        "gpu_info": [
+            {"name": "NVIDIA GeForce RTX 3060 Laptop GPU", "memory": 6144, "refresh_rate": 144, "resolution": "2560 x 1600"},
+            {"name": "AMD Radeon(TM) Graphics", "memory": 512, "refresh_rate": None, "resolution": None},
+        ],
+    }
+    upserts = [[rng.randint(10_000_000, 9_000_000_000), f"@user{i}", f"用户 {i}"] for i in range(USERS)]
+    return [
+        # 完整协议发送的是带缩进的 JSON 字符串
+        ("get_window", packet.EVENT, ["get_window", json.dumps(windows, ensure_ascii=False, indent=2)]),
+        ("window_snapshot", packet.EVENT, ["window_snapshot", {"seq": 42, "data": windows}]),
+        ("window_delta", packet.EVENT, ["window_delta", {"seq": 43, "append": windows["window_list"][-1], "evict": True}]),
+        ("get_hard_info", packet.ACK, [hard_info]),
+        ("get_user_list_delta", packet.ACK, [{"version": 1_000, "full": True, "upserts": upserts, "deletes": []}]),
+        ("get_user_msg", packet.EVENT, ["get_user_msg", "用户 1(12345678)", "你好，在吗？" * 4]),
+        ("screenshot", packet.ACK, [rng.randbytes(SCREENSHOT)]),
+    ]
+
+def bench(fn) -> float:
+    """返回单次耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn()
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+def json_size(encoded) -> int:
+    if isinstance(encoded, list):
+        return len(encoded[0].encode("utf-8")) + sum(len(attachment) for attachment in encoded[1:])
+    return len(encoded.encode("utf-8"))
+
+def json_decode(encoded) -> None:
+    if isinstance(encoded, list):
+        pkt = packet.Packet(encoded_packet=encoded[0])
+        for attachment in encoded[1:]:
+            pkt.add_attachment(attachment)
+    else:
+        packet.Packet(encoded_packet=encoded)
+
+def main():
+    if not msgpack_available():
+        print("msgpack is not installed")
+        return
+    print(f"{'event':<20} {'json B':>9} {'msgpack B':>10} {'json enc':>9} {'mp enc':>8} {'json dec':>9} {'mp dec':>8}  (us)")
+    for name, packet_type, data in events():
+        def json_encode():
+            return packet.Packet(packet_type, data=data, id=1 if packet_type == packet.ACK else None).encode()
+
+        def msgpack_encode():
+            return NegotiatedPacket(packet_type, data=data, id=1 if packet_type == packet.ACK else None).encode_msgpack()
+
+        encoded_json = json_encode()
+        encoded_msgpack = msgpack_encode()
+        print(
+            f"{name:<20} {json_size(encoded_json):>9} {len(encoded_msgpack):>10} "
+            f"{bench(json_encode):>9.1f} {bench(msgpack_encode):>8.1f} "
+            f"{bench(lambda: json_decode(encoded_json)):>9.1f} "
+            f"{bench(lambda: NegotiatedPacket(encoded_packet=encoded_msgpack)):>8.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
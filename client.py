@@ -12,7 +12,8 @@ from ctypes import CFUNCTYPE, c_void_p, c_int
 import pythoncom
 from ctypes import windll
 import yaml
-from pydantic import BaseModel, ValidationError
+from typing import Literal
+from pydantic import BaseModel, ValidationError, field_validator
 import mss
 from io import BytesIO
 from win11toast import toast_async as toast
@@ -159,12 +160,16 @@ handler.setFormatter(colorlog.ColoredFormatter(
 config_path = "client_config.yaml"
 window_get_started = False
 input_loop: asyncio.Task | None = None
+# 本地用户列表缓存，只向服务器请求 user_version 之后的变更
+user_cache: dict[int, tuple[str, str]] = {}
+user_version: int = 0
 default_config: dict[str, str | bool | list[str]] = {
     "lang": "zh-CN",
     "log_level": "INFO",
     "server_url": "http://localhost:5000",
     "chat_mode": False,
     "token": "",
+    "serializer": "default",
     "pass_window": ["任务切换", "新通知"]
 }
 log_level_dict = {
@@ -181,8 +186,16 @@ class Config(BaseModel):
     server_url: str
     chat_mode: bool
     token: str
+    # default（JSON）或 msgpack，msgpack 需要安装 msgpack，服务端会自动识别
+    serializer: Literal["default", "msgpack"] = "default"
     pass_window: list[str]
 
+    @field_validator("serializer", mode="before")
+    @classmethod
+    def _json_is_default(cls, value):
+        # python-socketio 把 default 和 msgpack 以外的值当作数据包类，json 需要换成 default
+        return "default" if value == "json" else value
+
 try:
     with open(config_path, "r", encoding="utf-8") as f:
         config = yaml.safe_load(f)
@@ -214,10 +227,11 @@ if config.log_level == "DEBUG":
         reconnection=False,
         engineio_logger=logger,
         logger=logger,  # type: ignore
-        handle_sigint=False
+        handle_sigint=False,
+        serializer=config.serializer,
     )
 else:
-    sio = socketio.AsyncClient(reconnection=False)
+    sio = socketio.AsyncClient(reconnection=False, serializer=config.serializer)
 
 try:
     itr = I18n.model_validate(i18n_dict[config.lang.lower()], extra="forbid")
@@ -521,12 +535,25 @@ async def ainput(prompt: str = "") -> str:
     loop = asyncio.get_running_loop()
     return await loop.run_in_executor(None, input, prompt)
 
+async def sync_user_list() -> list[tuple[int, str, str]]:
+    """增量同步用户列表"""
+    global user_version
+    delta: dict = await sio.call("get_user_list_delta", user_version) # type: ignore
+    if delta["full"]:
+        user_cache.clear()
+    for user_id, username, fullname in delta["upserts"]:
+        user_cache[user_id] = (username, fullname)
+    for user_id in delta["deletes"]:
+        user_cache.pop(user_id, None)
+    user_version = delta["version"]
+    return [(user_id, username, fullname) for user_id, (username, fullname) in user_cache.items()]
+
 async def input_msg():
     while True:
         if not sio.connected:
             await asyncio.sleep(1)
             continue
-        user_list: list[tuple[int, str, str]] | None = await sio.call("get_user_list")
+        user_list: list[tuple[int, str, str]] = await sync_user_list()
         if not user_list:
             print(itr.no_users)
             print(itr.list_users)
@@ -1,16 +1,32 @@
 import argparse
+import asyncio
 import uvicorn
-from telegram_monitoring.src.socket_route import app
 from telegram_monitoring.src.config import config
+from telegram_monitoring.src.backup import backup_db, restore_db
+from telegram_monitoring.src.workers import run_workers
 
 def main():
     parser = argparse.ArgumentParser(description="Telegram Monitoring Bot")
     parser.add_argument("--nobot", action="store_true", help="Disable Telegram bot, only run http and socketio server")
+    parser.add_argument("--backup", metavar="PATH", help="Back up the database to PATH and exit (safe while another instance is running)")
+    parser.add_argument("--restore", metavar="PATH", help="Restore the database from the backup at PATH before starting")
+    parser.add_argument("--workers", type=int, default=1, metavar="N", help="Run N worker processes on consecutive ports starting at the configured port (needs a load balancer with sticky sessions)")
     args = parser.parse_args()
-    
+
+    if args.backup:
+        asyncio.run(backup_db(args.backup))
+        return
+    if args.restore:
+        restore_db(args.restore)
+
+    if args.workers > 1:
+        run_workers(args.workers, not args.nobot)
+        return
+
+    from telegram_monitoring.src.socket_route import app
     app.state.need_start_bot = not args.nobot
 
     uvicorn.run(app, host=config.bind, port=config.port, log_config=None)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
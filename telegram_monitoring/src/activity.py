@@ -0,0 +1,210 @@
+import asyncio
+import json
+from collections import OrderedDict
+from telegram_monitoring.src.log import sql_log
+from telegram_monitoring.src.sql import get_con, read_con, savepoint
+
+__all__ = [
+    "WINDOW",
+    "APP",
+    "record_activity",
+    "flush_activity",
+    "query_activity",
+    "intern_titles",
+    "reset_title_cache",
+]
+
+# 活动类型
+WINDOW = 0
+APP = 1
+
+# 写入缓冲，按时间间隔或数量阈值打包为一个数据块写入
+flush_interval = 30.0
+flush_size = 256
+# (设备 id, 类型) -> 待写入的记录
+_pending: dict[tuple[int, int], list[tuple[int, str]]] = {}
+_flush_task: asyncio.Task | None = None
+_flush_lock = asyncio.Lock()
+
+# 标题 -> 字典表 id 的缓存，限制大小避免窗口标题过多时占用内存
+title_cache_size = 1024
+_title_ids: OrderedDict[str, int] = OrderedDict()
+
+# 数据块格式，每条记录依次为：
+#   zigzag varint(时间戳 - 上一条时间戳)，第一条相对于块的 start_time
+#   varint(标题 id)
+
+def _write_varint(buf: bytearray, value: int) -> None:
+    while value > 0x7F:
+        buf.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+def encode_block(start_time: int, records: list[tuple[int, int]]) -> bytes:
+    """将 (时间戳, 标题 id) 列表编码为数据块"""
+    buf = bytearray()
+    prev = start_time
+    for timestamp, title_id in records:
+        delta = timestamp - prev
+        _write_varint(buf, (delta << 1) ^ (delta >> 63))
+        _write_varint(buf, title_id)
+        prev = timestamp
+    return bytes(buf)
+
+def decode_block(start_time: int, data: bytes) -> list[tuple[int, int]]:
+    """解码数据块为 (时间戳, 标题 id) 列表"""
+    records: list[tuple[int, int]] = []
+    prev = start_time
+    pos = 0
+    while pos < len(data):
+        zigzag, pos = _read_varint(data, pos)
+        title_id, pos = _read_varint(data, pos)
+        prev += (zigzag >> 1) ^ -(zigzag & 1)
+        records.append((prev, title_id))
+    return records
+
+def record_activity(kind: int, title: str, timestamp: int, device: int = 0) -> None:
+    """记录一次窗口/应用切换，实际写入由后台批量完成"""
+    global _flush_task
+    pending = _pending.setdefault((device, kind), [])
+    pending.append((timestamp, title))
+    if len(pending) >= flush_size or _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_delayed_flush(0 if len(pending) >= flush_size else flush_interval))
+
+async def _delayed_flush(delay: float) -> None:
+    await asyncio.sleep(delay)
+    # 关闭时任务会被取消，已开始的写入不能被打断
+    await asyncio.shield(flush_activity())
+
+async def intern_titles(con, titles: list[str]) -> dict[str, int]:
+    """查询或插入标题字典表，返回标题对应的 id"""
+    ids: dict[str, int] = {}
+    missing: list[str] = []
+    for title in dict.fromkeys(titles):
+        title_id = _title_ids.get(title)
+        if title_id is None:
+            missing.append(title)
+        else:
+            _title_ids.move_to_end(title)
+            ids[title] = title_id
+    if missing:
+        await con.executemany(
+            "INSERT OR IGNORE INTO activity_titles (title) VALUES (?)",
+            [(title,) for title in missing]
+        )
+        cur = await con.execute(
+            "SELECT title, id FROM activity_titles WHERE title IN (SELECT value FROM json_each(?))",
+            (json.dumps(missing, ensure_ascii=False),)
+        )
+        for title, title_id in await cur.fetchall():
+            ids[title] = title_id
+            _title_ids[title] = title_id
+        while len(_title_ids) > title_cache_size:
+            _title_ids.popitem(last=False)
+    return ids
+
+def reset_title_cache() -> None:
+    """回滚后字典表中新插入的标题也被撤销，缓存中的 id 不再可信"""
+    _title_ids.clear()
+
+async def flush_activity() -> None:
+    """将缓冲中的记录写入数据库，每个设备的每种类型一个数据块，在一个事务中完成"""
+    async with _flush_lock:
+        batches = {key: records for key, records in _pending.items() if records}
+        if not batches:
+            return
+        for key in batches:
+            _pending[key] = []
+        con = await get_con()
+        try:
+            async with savepoint(con, "flush_activity"):
+                ids = await intern_titles(con, [title for records in batches.values() for _, title in records])
+                rows = []
+                for (device, kind), records in batches.items():
+                    encoded = [(timestamp, ids[title]) for timestamp, title in records]
+                    start_time = encoded[0][0]
+                    rows.append({
+                        "device": device,
+                        "kind": kind,
+                        "start_time": start_time,
+                        "end_time": max(timestamp for timestamp, _ in encoded),
+                        "count": len(encoded),
+                        "data": encode_block(start_time, encoded),
+                    })
+                await con.executemany(
+                    """
+                    INSERT INTO activity_blocks (device, kind, start_time, end_time, count, data)
+                    VALUES (:device, :kind, :start_time, :end_time, :count, :data)
+                    """,
+                    rows
+                )
+        except Exception:
+            reset_title_cache()
+            for key, records in batches.items():
+                _pending[key][:0] = records
+            raise
+        # 提交失败时记录仍在写连接的事务中，随下一次提交写入，不能再放回缓冲
+        await con.commit()
+    sql_log.debug(f"Flushed {sum(len(r) for r in batches.values())} activity records")
+
+async def query_activity(
+    kind: int,
+    start: int | None = None,
+    end: int | None = None,
+    limit: int | None = None,
+    device: int = 0
+) -> list[tuple[str, int]]:
+    """
+    查询 [start, end] 时间范围内的记录，按时间升序返回 (标题, 时间戳)
+    指定 limit 时只返回最近的 limit 条，从最新的数据块开始读取，读够即停止
+    """
+    lo = start if start is not None else -(1 << 62)
+    hi = end if end is not None else 1 << 62
+    records: list[tuple[int, str | int]] = [
+        (timestamp, title) for timestamp, title in _pending.get((device, kind), []) if lo <= timestamp <= hi
+    ]
+    async with read_con() as con:
+        cur = await con.execute(
+            """
+            SELECT start_time, data FROM activity_blocks
+            WHERE device = :device AND kind = :kind AND end_time >= :lo AND start_time <= :hi
+            ORDER BY end_time DESC
+            """,
+            {"device": device, "kind": kind, "lo": lo, "hi": hi}
+        )
+        while limit is None or len(records) < limit:
+            block = await cur.fetchone()
+            if block is None:
+                break
+            records.extend(
+                (timestamp, title_id)
+                for timestamp, title_id in decode_block(block[0], block[1])
+                if lo <= timestamp <= hi
+            )
+        await cur.close()
+        records.sort(key=lambda record: record[0])
+        if limit is not None:
+            records = records[-limit:]
+        title_ids = {title for _, title in records if isinstance(title, int)}
+        titles: dict[int, str] = {}
+        if title_ids:
+            cur = await con.execute(
+                "SELECT id, title FROM activity_titles WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(title_ids)),)
+            )
+            titles = dict(await cur.fetchall())  # type: ignore
+    return [
+        (titles.get(title, "") if isinstance(title, int) else title, timestamp)
+        for timestamp, title in records
+    ]
@@ -0,0 +1,425 @@
+import asyncio
+import base64
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable, Hashable
+from pathlib import Path
+import aiosqlite
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from telegram_monitoring.src.config import config
+from telegram_monitoring.src.log import socketio_log
+from telegram_monitoring.src.ratelimit import SlidingWindowLimiter
+
+__all__ = [
+    "StateBackend",
+    "MemoryBackend",
+    "SqliteBackend",
+    "SqliteManager",
+    "use_backend",
+    "get_backend",
+    "reset_bus",
+]
+
+# 多进程共享的消息总线，与 data.db 分开，避免高频的总线写入与业务写入互相等待
+bus_file = "bus.db"
+# 没有本进程的写入唤醒时，轮询总线的间隔
+poll_interval = 0.05
+# leader 租约每 lease_renew 秒续期一次，超过 lease_ttl 秒未续期由其他进程接管
+lease_renew = 2.0
+lease_ttl = 6.0
+# 总线消息保留的秒数，新启动的进程从 leader 保存的状态快照之后继续读取
+bus_retention = 60.0
+
+_schema = """
+CREATE TABLE IF NOT EXISTS bus (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clients (
+    device TEXT PRIMARY KEY,
+    sid TEXT NOT NULL,
+    pid INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leader (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    pid INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS states (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_id INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+def _encode_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode()}
+    raise TypeError(f"Object of type {type(value).__name__} cannot be sent over the state bus")
+
+def _decode_bytes(value: dict):
+    if len(value) == 1 and "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+def _dumps(data) -> str:
+    """
+    总线消息使用 JSON，bytes（例如跨进程返回的截图）转为 base64，元组读出后为列表
+    不使用 pickle，能写入 bus.db 的人也无法在各进程中执行任意代码
+    """
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_encode_bytes)
+
+def _loads(data: str | bytes):
+    return json.loads(data, object_hook=_decode_bytes)
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class StateBackend(ABC):
+    """
+    设备状态（窗口/应用快照、电脑客户端 sid）和刷屏计数的存放位置
+    接收端不直接修改设备状态，而是 publish 一条变更，由 attach 注册的 apply 在每个进程中按相同的顺序应用
+    历史记录、使用时长、机器人和数据库维护只需运行一份，只在 leader 进程中运行
+    """
+
+    is_leader = True
+
+    def __init__(self) -> None:
+        self._apply: Callable[[dict], Awaitable[None]] | None = None
+        self._dump: Callable[[], dict] | None = None
+        self._load: Callable[[dict], Awaitable[None]] | None = None
+        self._on_leader: Callable[[bool], Awaitable[None]] | None = None
+        # 只有 leader 接收 Telegram 更新，刷屏计数保存在 leader 进程内即可
+        self.flood = SlidingWindowLimiter(config.telegram.flood.window, config.telegram.flood.max_users)
+
+    def attach(
+        self,
+        apply: Callable[[dict], Awaitable[None]],
+        dump: Callable[[], dict],
+        load: Callable[[dict], Awaitable[None]],
+        on_leader: Callable[[bool], Awaitable[None]]
+    ) -> None:
+        """注册应用变更、导出/导入设备状态以及成为/失去 leader 时的回调"""
+        self._apply = apply
+        self._dump = dump
+        self._load = load
+        self._on_leader = on_leader
+
+    def client_manager(self) -> socketio.AsyncManager | None:
+        """创建 Socket.IO 服务端使用的客户端管理器，None 为默认的单进程管理器"""
+        return None
+
+    @abstractmethod
+    async def start(self) -> None:
+        ...
+
+    @abstractmethod
+    async def stop(self) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, op: dict) -> None:
+        """发布一条状态变更，返回时本进程已应用该变更"""
+
+    @abstractmethod
+    async def claim_client(self, device: str, sid: str) -> bool:
+        """登记设备的电脑客户端，该设备已有在线的电脑客户端时返回 False"""
+
+    @abstractmethod
+    async def release_client(self, device: str, sid: str) -> None:
+        ...
+
+    def flood_hit(self, key: Hashable) -> int:
+        return self.flood.hit(key)
+
+class MemoryBackend(StateBackend):
+    """单进程后端，变更直接在本进程应用"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._clients: dict[str, str] = {}
+
+    async def start(self) -> None:
+        if self._on_leader is not None:
+            await self._on_leader(True)
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, op: dict) -> None:
+        if self._apply is not None:
+            await self._apply(op)
+
+    async def claim_client(self, device: str, sid: str) -> bool:
+        if self._clients.get(device):
+            return False
+        self._clients[device] = sid
+        return True
+
+    async def release_client(self, device: str, sid: str) -> None:
+        if self._clients.get(device) == sid:
+            del self._clients[device]
+
+class SqliteBackend(StateBackend):
+    """
+    同一台机器上多进程共享的后端，所有进程通过 bus.db 中自增的消息表交换变更和 Socket.IO 消息
+    每个进程按消息 id 的顺序应用变更，因此各进程的设备状态一致
+    leader 通过租约选出，负责清理过期消息、回收已退出进程的电脑客户端，并定期保存设备状态快照
+    """
+
+    def __init__(self, path: str = bus_file) -> None:
+        super().__init__()
+        self.is_leader = False
+        self.path = path
+        self._con: aiosqlite.Connection | None = None
+        # 同一连接上的事务与单条写入不能交错
+        self._write_lock = asyncio.Lock()
+        self._last_id = 0
+        self._changed = False
+        # 本进程发布的变更 id -> 应用完成的通知
+        self._waiters: dict[int, asyncio.Future] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._manager: SqliteManager | None = None
+
+    def client_manager(self) -> socketio.AsyncManager:
+        if self._manager is None:
+            self._manager = SqliteManager(self)
+        return self._manager
+
+    async def start(self) -> None:
+        # 自动提交模式，事务由 BEGIN IMMEDIATE 显式开启
+        self._con = await aiosqlite.connect(self.path, timeout=10, isolation_level=None)
+        await self._con.execute("PRAGMA journal_mode=WAL")
+        await self._con.execute("PRAGMA synchronous=NORMAL")
+        await self._con.executescript(_schema)
+        cur = await self._con.execute("SELECT last_id, data FROM states WHERE id = 1")
+        row = await cur.fetchone()
+        if row is not None and self._load is not None:
+            await self._load(_loads(row[1]))
+            self._last_id = row[0]
+        await self._drain()
+        socketio_log.info(f"Joined state bus {self.path} at message {self._last_id} (pid {os.getpid()})")
+        await self._renew()
+        self._tasks = [asyncio.create_task(self._poll()), asyncio.create_task(self._lease())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        for waiter in self._waiters.values():
+            waiter.cancel()
+        self._waiters.clear()
+        if self._con is None:
+            return
+        if self.is_leader:
+            await self._checkpoint()
+            # 主动放弃租约，其他进程不必等到过期
+            await self._con.execute("DELETE FROM leader WHERE pid = ?", (os.getpid(),))
+            self.is_leader = False
+        await self._con.close()
+        self._con = None
+
+    async def publish(self, op: dict, channel: str = "state") -> None:
+        """发布一条消息；状态变更会等到本进程按总线顺序应用之后才返回"""
+        assert self._con is not None
+        async with self._write_lock:
+            cur = await self._con.execute(
+                "INSERT INTO bus (channel, data, created) VALUES (?, ?, ?)",
+                (channel, _dumps(op), time.time())
+            )
+        self._wakeup.set()
+        if channel != "state":
+            return
+        message_id = cur.lastrowid
+        # 等待写入期间轮询任务可能已经应用了这条变更
+        if message_id is None or message_id <= self._last_id:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[message_id] = waiter
+        await waiter
+
+    async def claim_client(self, device: str, sid: str) -> bool:
+        assert self._con is not None
+        async with self._write_lock:
+            await self._con.execute("BEGIN IMMEDIATE")
+            try:
+                cur = await self._con.execute("SELECT sid, pid FROM clients WHERE device = ?", (device,))
+                row = await cur.fetchone()
+                if row is not None and row[0] and _alive(row[1]):
+                    await self._con.execute("ROLLBACK")
+                    return False
+                await self._con.execute(
+                    "INSERT OR REPLACE INTO clients (device, sid, pid) VALUES (?, ?, ?)",
+                    (device, sid, os.getpid())
+                )
+                await self._con.execute("COMMIT")
+            except Exception:
+                await self._con.execute("ROLLBACK")
+                raise
+        return True
+
+    async def release_client(self, device: str, sid: str) -> None:
+        assert self._con is not None
+        async with self._write_lock:
+            await self._con.execute("DELETE FROM clients WHERE device = ? AND sid = ?", (device, sid))
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._drain()
+            except Exception as e:
+                socketio_log.error(f"Failed to read state bus: {e}")
+                await asyncio.sleep(1)
+
+    async def _drain(self) -> None:
+        """按 id 顺序处理上次之后的所有消息"""
+        assert self._con is not None
+        cur = await self._con.execute(
+            "SELECT id, channel, data FROM bus WHERE id > ? ORDER BY id",
+            (self._last_id,)
+        )
+        rows = await cur.fetchall()
+        if rows and self._last_id and rows[0][0] != self._last_id + 1:
+            socketio_log.warning(f"Missed state bus messages {self._last_id + 1}..{rows[0][0] - 1}")
+        for message_id, channel, data in rows:
+            self._last_id = message_id
+            message = _loads(data)
+            if channel == "socketio":
+                if self._manager is not None:
+                    self._manager.queue.put_nowait(message)
+            elif self._apply is not None:
+                try:
+                    await self._apply(message)
+                except Exception as e:
+                    socketio_log.error(f"Failed to apply state change {message_id}: {e}")
+                self._changed = True
+            waiter = self._waiters.pop(message_id, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+    async def _lease(self) -> None:
+        while True:
+            await asyncio.sleep(lease_renew)
+            try:
+                await self._renew()
+                if self.is_leader:
+                    await self._reap_clients()
+                    await self._checkpoint()
+                    assert self._con is not None
+                    async with self._write_lock:
+                        await self._con.execute("DELETE FROM bus WHERE created < ?", (time.time() - bus_retention,))
+            except Exception as e:
+                socketio_log.error(f"State bus housekeeping failed: {e}")
+
+    async def _renew(self) -> None:
+        """续期或争取 leader 租约，leader 身份变化时调用回调"""
+        assert self._con is not None
+        now = time.time()
+        pid = os.getpid()
+        async with self._write_lock:
+            await self._con.execute("BEGIN IMMEDIATE")
+            try:
+                cur = await self._con.execute("SELECT pid, expires FROM leader WHERE id = 1")
+                row = await cur.fetchone()
+                leader = row is None or row[0] == pid or row[1] < now
+                if leader:
+                    await self._con.execute(
+                        "INSERT OR REPLACE INTO leader (id, pid, expires) VALUES (1, ?, ?)",
+                        (pid, now + lease_ttl)
+                    )
+                await self._con.execute("COMMIT")
+            except Exception:
+                await self._con.execute("ROLLBACK")
+                raise
+        if leader != self.is_leader:
+            self.is_leader = leader
+            if leader:
+                socketio_log.info(f"Process {pid} is now the leader")
+            else:
+                socketio_log.warning(f"Process {pid} lost the leader lease")
+            if self._on_leader is not None:
+                await self._on_leader(leader)
+
+    async def _reap_clients(self) -> None:
+        """已退出的进程无法处理断开事件，由 leader 代为发布断开"""
+        assert self._con is not None
+        cur = await self._con.execute("SELECT device, sid, pid FROM clients")
+        for device, sid, pid in await cur.fetchall():
+            if _alive(pid):
+                continue
+            socketio_log.warning(f"Worker {pid} exited, releasing client {sid} of device {device}")
+            await self.publish({"op": "disconnect", "device": device, "sid": sid, "time": int(time.time())})
+            await self.release_client(device, sid)
+
+    async def _checkpoint(self) -> None:
+        """保存设备状态和对应的消息 id，新启动的进程从这里继续"""
+        if not self._changed or self._dump is None or self._con is None:
+            return
+        self._changed = False
+        last_id, data = self._last_id, _dumps(self._dump())
+        async with self._write_lock:
+            await self._con.execute(
+                "INSERT OR REPLACE INTO states (id, last_id, data) VALUES (1, ?, ?)",
+                (last_id, data)
+            )
+
+class SqliteManager(AsyncPubSubManager):
+    """通过 SqliteBackend 的消息总线在进程之间转发 Socket.IO 的 emit、房间操作和回调"""
+
+    name = "sqlite"
+
+    def __init__(self, backend: SqliteBackend) -> None:
+        super().__init__(channel="socketio")
+        self.backend = backend
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def _publish(self, data):
+        await self.backend.publish(data, "socketio")
+
+    async def _listen(self):
+        while True:
+            yield await self.queue.get()
+
+_backends: dict[str, type[StateBackend]] = {
+    "memory": MemoryBackend,
+    "sqlite": SqliteBackend,
+}
+_backend_name = "memory"
+_backend: StateBackend | None = None
+
+def use_backend(name: str) -> None:
+    """选择状态后端，需要在导入 socket_route 之前调用"""
+    global _backend_name
+    if name not in _backends:
+        raise ValueError(f"Unknown state backend: {name!r}")
+    if _backend is not None:
+        raise RuntimeError("State backend is already in use")
+    _backend_name = name
+
+def get_backend() -> StateBackend:
+    global _backend
+    if _backend is None:
+        _backend = _backends[_backend_name]()
+    return _backend
+
+def reset_bus(path: str = bus_file) -> None:
+    """清空上次运行留下的总线，需要在启动各进程之前调用"""
+    for suffix in ("", "-wal", "-shm"):
+        Path(path + suffix).unlink(missing_ok=True)
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sqlite3
+import time
+import aiosqlite
+from pathlib import Path
+from telegram_monitoring.src.log import sql_log
+from telegram_monitoring.src.i18n import itr
+from telegram_monitoring.src import sql
+
+__all__ = [
+    "backup_db",
+    "restore_db",
+]
+
+backup_dir = "backups"
+# 每一步复制的页数，步与步之间释放源库的读锁，写连接不会被长时间阻塞
+backup_pages = 256
+_backup_lock = asyncio.Lock()
+
+def _default_path() -> Path:
+    return Path(backup_dir) / f"data-{time.strftime('%Y%m%d-%H%M%S')}.db"
+
+async def backup_db(path: str | Path | None = None) -> tuple[Path, int, float]:
+    """
+    使用 SQLite backup API 在线备份数据库，返回 (备份文件路径, 页数, 耗时秒)
+    备份在独立连接的后台线程中分步进行，不会阻塞事件循环；先写入临时文件，完成后再改名
+    """
+    path = Path(path) if path is not None else _default_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    pages = 0
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        nonlocal pages
+        pages = total
+
+    async with _backup_lock:
+        # 写后队列中的用户资料更新也一并备份
+        await sql.flush_user_updates()
+        start = time.perf_counter()
+        try:
+            async with aiosqlite.connect(f"file:{sql.db_file}?mode=ro", uri=True) as src, aiosqlite.connect(tmp) as dst:
+                await src.backup(dst, pages=backup_pages, progress=progress)
+                # 备份会沿用源库的 WAL 模式，改回单文件方便拷贝
+                await dst.execute("PRAGMA journal_mode=DELETE")
+            os.replace(tmp, path)
+        except Exception:
+            tmp.unlink(missing_ok=True)
+            raise
+        elapsed = time.perf_counter() - start
+    sql_log.info(itr.sqlite.backup.format(db=sql.db_file, path=path, pages=pages, time=f"{elapsed:.2f}"))
+    return path, pages, elapsed
+
+def restore_db(path: str | Path) -> None:
+    """从备份文件恢复数据库，需要在打开数据库之前调用"""
+    path = Path(path)
+    if not path.is_file():
+        raise FileNotFoundError(path)
+    src = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        row = src.execute("PRAGMA quick_check").fetchone()
+        if not row or row[0] != "ok":
+            raise sqlite3.DatabaseError(f"{path} failed integrity check: {row[0] if row else 'unknown'}")
+        dst = sqlite3.connect(sql.db_file)
+        try:
+            src.backup(dst, pages=backup_pages)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    sql_log.info(itr.sqlite.restore.format(db=sql.db_file, path=path))
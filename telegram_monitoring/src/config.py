@@ -1,5 +1,6 @@
 from pydantic import BaseModel, ValidationError, ConfigDict
 import yaml
+import os
 import sys
 import secrets
 from pathlib import Path
@@ -11,12 +12,23 @@ default_config = {
     "port": 5000,
     "token": secrets.token_urlsafe(32),
     "max_window": 5,
+    "window_settle": 0,
+    "trace": {
+        "slow": 2000,
+        "buffer": 200
+    },
     "telegram": {
         "token": "",
         "admins": [],
         "screenshot": {
             "allow": True,
             "delete_time": 3
+        },
+        "flood": {
+            "window": 4.0,
+            "warn": 7,
+            "ban": 10,
+            "max_users": 10000
         }
     }
 }
@@ -26,10 +38,25 @@ class ScreenshotConfig(BaseModel):
     delete_time: int
     model_config = ConfigDict(extra="forbid")
 
+class FloodConfig(BaseModel):
+    window: float = 4.0
+    warn: int = 7
+    ban: int = 10
+    max_users: int = 10000
+    model_config = ConfigDict(extra="forbid")
+
 class TelegramConfig(BaseModel):
     token: str
     admins: list[int]
     screenshot: ScreenshotConfig
+    flood: FloodConfig = FloodConfig()
+    model_config = ConfigDict(extra="forbid")
+
+class TraceConfig(BaseModel):
+    # 超过该耗时（毫秒）的 trace 记录到日志
+    slow: int = 2000
+    # 保留最近多少条 trace 供 /traces 查询
+    buffer: int = 200
     model_config = ConfigDict(extra="forbid")
 
 class Config(BaseModel):
@@ -39,10 +66,15 @@ class Config(BaseModel):
     port: int
     token: str
     max_window: int
+    window_settle: int = 0
+    trace: TraceConfig = TraceConfig()
     telegram: TelegramConfig
     model_config = ConfigDict(extra="forbid")
 
-def load_config(config_path = Path(__file__).parents[2] / "config.yaml") -> Config:
+# 可用环境变量指定配置文件，例如测试时使用临时配置
+config_file = Path(os.environ.get("TELEGRAM_MONITORING_CONFIG") or Path(__file__).parents[2] / "config.yaml")
+
+def load_config(config_path = config_file) -> Config:
     try:
         with open(config_path, "r", encoding="utf-8") as f:
             config = yaml.safe_load(f)
@@ -0,0 +1,152 @@
+import asyncio
+import re
+from collections import deque
+from telegram_monitoring.src.log import socketio_log
+from telegram_monitoring.src.sql import get_con, read_con
+from telegram_monitoring.src.stream import Snapshot, Broadcaster
+
+__all__ = [
+    "DEFAULT_DEVICE",
+    "Device",
+    "Listener",
+    "valid_device_name",
+    "load_devices",
+    "get_device",
+    "find_device",
+    "list_devices",
+]
+
+# 未指定设备时使用的默认设备，数据库中的 id 固定为 0
+DEFAULT_DEVICE = "default"
+_name_re = re.compile(r"[A-Za-z0-9_.-]{1,32}")
+
+class Listener:
+    """
+    一个监听客户端的有界发送队列，由后台任务逐条发送，接收端不会等待任何监听客户端
+    完整协议每种事件只保留最新的一条；增量协议积压超过 max_pending 条时丢弃积压，改为发送快照
+    """
+
+    __slots__ = ("sid", "delta", "latest", "deltas", "snapshots", "wakeup", "task")
+
+    max_pending = 64
+
+    def __init__(self, sid: str, delta: bool) -> None:
+        self.sid = sid
+        self.delta = delta
+        # 完整协议：事件名 -> 最新的数据
+        self.latest: dict[str, str] = {}
+        # 增量协议：待发送的 (类型, 事件名, 数据)
+        self.deltas: deque[tuple[str, str, dict]] = deque()
+        # 需要改为发送快照的类型
+        self.snapshots: set[str] = set()
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def push(self, event: str, data: str) -> None:
+        self.latest[event] = data
+        self.wakeup.set()
+
+    def push_delta(self, kind: str, event: str, data: dict) -> None:
+        if kind in self.snapshots:
+            # 即将发送的快照已包含这次变化
+            return
+        if len(self.deltas) >= self.max_pending:
+            self.deltas.clear()
+            self.snapshots.update(("window", "app"))
+        else:
+            self.deltas.append((kind, event, data))
+        self.wakeup.set()
+
+    def resync(self, kinds: tuple[str, ...] = ("window", "app")) -> None:
+        """改为发送这些类型的快照，丢弃它们尚未发送的增量"""
+        self.deltas = deque(item for item in self.deltas if item[0] not in kinds)
+        self.snapshots.update(kinds)
+        self.wakeup.set()
+
+class Device:
+    """
+    一台被监控的设备：一个电脑客户端和一部手机
+    每台设备有独立的窗口/应用历史、快照和推送
+    """
+
+    __slots__ = (
+        "name", "key", "client_sid", "listeners", "pending_window", "settle_task",
+        "window_list", "app_list", "phone_app", "window_snapshot", "app_snapshot", "changes",
+    )
+
+    def __init__(self, name: str, key: int) -> None:
+        self.name = name
+        # 数据库中的设备 id，历史记录和使用时长按它区分
+        self.key = key
+        self.client_sid = ""
+        # 监听客户端 sid -> 发送队列
+        self.listeners: dict[str, Listener] = {}
+        # 尚未稳定的前台窗口 (标题, 切换时间, 收到的时间) 及等待它稳定的任务
+        self.pending_window: tuple[str, int, float] | None = None
+        self.settle_task: asyncio.Task | None = None
+        self.window_list: deque[tuple[str, int]] = deque()
+        self.app_list: deque[tuple[str, int]] = deque()
+        self.phone_app: dict = {}
+        self.window_snapshot = Snapshot(self.window_data, f"{key}w")
+        self.app_snapshot = Snapshot(lambda: self.phone_app, f"{key}a")
+        # 推送给 /stream 和 /poll 的窗口/应用变化
+        self.changes = Broadcaster()
+
+    def window_data(self) -> dict:
+        if not self.window_list:
+            return {}
+
+        now_window, switch_window_time = self.window_list[-1]
+        window_list: list[dict[str, str | int]] = [
+            {"title": window, "switch_window_time": time}
+            for window, time in self.window_list
+        ]
+
+        return {
+            "now_window": now_window,
+            "switch_window_time": switch_window_time,
+            "window_list": window_list
+        }
+
+_devices: dict[str, Device] = {DEFAULT_DEVICE: Device(DEFAULT_DEVICE, 0)}
+
+def valid_device_name(name: str) -> bool:
+    return bool(_name_re.fullmatch(name))
+
+async def load_devices() -> None:
+    """加载数据库中已登记的设备"""
+    async with read_con() as con:
+        cur = await con.execute("SELECT id, name FROM devices")
+        rows = await cur.fetchall()
+    for key, name in rows:
+        if name not in _devices:
+            _devices[name] = Device(name, key)
+    socketio_log.debug(f"Loaded {len(rows)} devices")
+
+async def get_device(name: str | None) -> Device:
+    """按名称获取设备，不存在时登记到数据库；名称为空时返回默认设备"""
+    name = name or DEFAULT_DEVICE
+    device = _devices.get(name)
+    if device is not None:
+        return device
+    if not valid_device_name(name):
+        raise ValueError(f"Invalid device name: {name!r}")
+    con = await get_con()
+    await con.execute("INSERT OR IGNORE INTO devices (name) VALUES (?)", (name,))
+    await con.commit()
+    cur = await con.execute("SELECT id FROM devices WHERE name = ?", (name,))
+    row = await cur.fetchone()
+    # 等待数据库时可能已被并发的请求登记
+    device = _devices.get(name)
+    if device is None:
+        device = Device(name, row[0])  # type: ignore
+        _devices[name] = device
+        socketio_log.info(f"Registered device {name}")
+    return device
+
+def find_device(name: str | None) -> Device | None:
+    """按名称查找已登记的设备，名称为空时返回默认设备"""
+    return _devices.get(name or DEFAULT_DEVICE)
+
+def list_devices() -> list[Device]:
+    return list(_devices.values())
@@ -25,6 +25,7 @@ default_en = {
     },
     "sqlite": {
         "connected": "Database connected",
+        "migrated": "Database schema upgraded to version {version}",
         "add_user": "User {user} added to database",
         "update_user": "User {user} updated in database",
         "del_user": "User {user} removed from database",
@@ -32,6 +33,10 @@ default_en = {
         "add_ban_user": "Banned user {user} added to database",
         "del_allow_user": "Allowed user {user} removed from database",
         "del_ban_user": "Banned user {user} removed from database",
+        "backup": "Backed up {db} to {path} ({pages} pages) in {time} s",
+        "restore": "Restored {db} from {path}",
+        "maintenance": "Database maintenance: {steps} ({pages} free pages)",
+        "maintenance_busy": "Database maintenance: {steps} ({pages} free pages, checkpoint busy)",
         "close": "Database closed"
     },
     "telegram": {
@@ -41,6 +46,8 @@ default_en = {
         "command_screenshot": "Request screenshot",
         "command_info": "Get client hardware info",
         "command_phone_info": "Get phone info",
+        "command_devices": "List monitored devices",
+        "command_stats": "Show window/app usage time",
         "command_ban": "Ban user",
         "command_unban": "Unban user",
         "command_add": "Add allowed user",
@@ -48,6 +55,8 @@ default_en = {
         "command_allowlist": "List allowed users",
         "command_banlist": "List banned users",
         "command_del": "Remove allowed user",
+        "command_reload": "Reload prohibited words",
+        "command_backup": "Back up the database",
         "command_help": "Show help info",
         "no_admin": "You do not have admin privileges",
         "banned_user": "You are banned and cannot use this bot",
@@ -63,6 +72,8 @@ default_en = {
             "/screenshot - Request screenshot\n"
             "/info - Get client hardware info\n"
             "/phone_info - Get phone info\n"
+            "/devices - List monitored devices\n"
+            "/stats - Show window/app usage time (today, 24h, week, month)\n"
             "/ban - Ban user\n"
             "/unban - Unban user\n"
             "/add - Add allowed user\n"
@@ -70,7 +81,10 @@ default_en = {
             "/allowlist - List allowed users\n"
             "/banlist - List banned users\n"
             "/del - Remove allowed user\n"
+            "/reload - Reload prohibited words\n"
+            "/backup - Back up the database\n"
             "/help - Show this message\n\n"
+            "/ping, /screenshot, /info, /phone_info and /stats accept a device name as the first argument, e.g. /ping laptop\n"
             "To notify the client, send a message to this bot. Only plain text messages are supported.\n"
             "Spamming or advertising behavior will be banned."
         ),
@@ -118,6 +132,14 @@ default_en = {
             "Android version: {android_version}\n"
             "Uptime: {uptime}"
         ),
+        "stats_usage": "Usage: /stats [device] [today|24h|week|month]",
+        "stats_msg": "Usage time ({period}):\n",
+        "stats_pc": "PC windows:\n",
+        "stats_phone": "Phone apps:\n",
+        "duration": "{hours}h {minutes}m {seconds}s",
+        "unknown_device": "Unknown device {device}, use /devices to list devices",
+        "devices_msg": "Devices:\n",
+        "device_status": "{name}\n  PC: {window}\n  Phone: {app}\n",
         "input_user_id": "Please enter user ID",
         "input_user_id_error": "Please enter a valid user ID",
         "no_user": "No user",
@@ -129,10 +151,23 @@ default_en = {
         "del_user_success": "User {user} removed from allow list",
         "ban_user_success": "User {user} banned",
         "unban_user_success": "User {user} unbanned",
+        "bulk_result": (
+            "Applied: {applied}\n"
+            "Skipped (no change): {skipped}\n"
+            "Not registered: {missing}\n"
+            "Invalid: {invalid}"
+        ),
+        "empty_list": "None",
         "none_text": "Only text messages are supported",
         "ban_success": "You have been banned",
         "ready_flood_message": "Please do not send too many messages or you will be banned",
         "flood_message": "You have been banned for sending too many messages",
+        "reload_words_success": "Reloaded {count} prohibited words in {time} ms",
+        "reload_words_failed": "Failed to reload prohibited words: {error}",
+        "words_reloaded": "Reloaded {count} prohibited words from {path} in {time} ms",
+        "backup_start": "Backing up the database...",
+        "backup_success": "Backup finished: {pages} pages in {time} s",
+        "backup_failed": "Failed to back up the database: {error}",
         "command_register_success": "Registered {commands} commands",
         "started": "Telegram bot started"
     }
@@ -157,6 +192,7 @@ class i18n_socketio(BaseModel):
 class i18n_sqlite(BaseModel):
     model_config = ConfigDict(extra="forbid")
     connected: str
+    migrated: str
     add_user: str
     update_user: str
     del_user: str
@@ -164,6 +200,10 @@ class i18n_sqlite(BaseModel):
     add_ban_user: str
     del_allow_user: str
     del_ban_user: str
+    backup: str
+    restore: str
+    maintenance: str
+    maintenance_busy: str
     close: str
 
 class i18n_telegram(BaseModel):
@@ -174,6 +214,8 @@ class i18n_telegram(BaseModel):
     command_screenshot: str
     command_info: str
     command_phone_info: str
+    command_devices: str
+    command_stats: str
     command_ban: str
     command_unban: str
     command_add: str
@@ -181,6 +223,8 @@ class i18n_telegram(BaseModel):
     command_allowlist: str
     command_banlist: str
     command_del: str
+    command_reload: str
+    command_backup: str
     command_help: str
     no_admin: str
     banned_user: str
@@ -205,6 +249,14 @@ class i18n_telegram(BaseModel):
     hardware_info: str
     gpu_info: str
     phone_info: str
+    stats_usage: str
+    stats_msg: str
+    stats_pc: str
+    stats_phone: str
+    duration: str
+    unknown_device: str
+    devices_msg: str
+    device_status: str
     input_user_id: str
     input_user_id_error: str
     no_user: str
@@ -216,10 +268,18 @@ class i18n_telegram(BaseModel):
     del_user_success: str
     ban_user_success: str
     unban_user_success: str
+    bulk_result: str
+    empty_list: str
     none_text: str
     ban_success: str
     ready_flood_message: str
     flood_message: str
+    reload_words_success: str
+    reload_words_failed: str
+    words_reloaded: str
+    backup_start: str
+    backup_success: str
+    backup_failed: str
     command_register_success: str
     started: str
 
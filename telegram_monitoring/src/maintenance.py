@@ -0,0 +1,95 @@
+import asyncio
+import time
+from telegram_monitoring.src.log import sql_log
+from telegram_monitoring.src.i18n import itr
+from telegram_monitoring.src.sql import idle_time_db, in_transaction_db, maintenance_con
+from telegram_monitoring.src.metrics import Gauge
+
+__all__ = [
+    "maintain_db",
+    "maintenance_stats",
+    "run_maintenance",
+]
+
+# 两次维护之间至少间隔 idle_interval，且写连接空闲超过 idle_after 秒才执行
+# 一直有写入时，超过 max_interval 也会强制执行一次，此时跳过会阻塞写入的步骤
+check_interval = 30.0
+idle_after = 60.0
+idle_interval = 30 * 60.0
+max_interval = 6 * 3600.0
+# 每次增量回收的最大页数，避免一次持有写锁太久
+vacuum_pages = 1024
+
+# 最近一次维护的时间及每一步的耗时（毫秒）
+_stats: dict[str, float] = {}
+
+async def _step(con, name: str, sql: str) -> list:
+    start = time.perf_counter()
+    cur = await con.execute(sql)
+    # incremental_vacuum 每取一行回收一页，需要读完所有结果
+    rows = await cur.fetchall()
+    await cur.close()
+    _stats[name] = (time.perf_counter() - start) * 1000
+    return list(rows)
+
+async def maintain_db(idle: bool = True) -> dict[str, float]:
+    """
+    在单独的维护连接上执行一次 WAL 检查点、PRAGMA optimize 和增量回收，返回每一步的耗时（毫秒）
+    VACUUM 和截断 WAL 期间写入需要等待，只在 idle 为真（写连接空闲）时执行，否则只做不阻塞写入的被动检查点
+    """
+    if in_transaction_db():
+        # 有未提交的写入，下次再试
+        sql_log.debug("Skipped database maintenance: write transaction in progress")
+        return {}
+    _stats.clear()
+    async with maintenance_con() as con:
+        cur = await con.execute("PRAGMA auto_vacuum")
+        row = await cur.fetchone()
+        if idle and row and row[0] != 2:
+            # 旧库未开启增量回收模式，修改后需要 VACUUM 一次才会生效
+            await _step(con, "auto_vacuum", "PRAGMA auto_vacuum = INCREMENTAL")
+            await _step(con, "vacuum", "VACUUM")
+        # 有读连接正在读取时无法截断，busy 为 1，下次维护时再截断
+        mode = "TRUNCATE" if idle else "PASSIVE"
+        busy = (await _step(con, "wal_checkpoint", f"PRAGMA wal_checkpoint({mode})"))[0][0]
+        await _step(con, "optimize", "PRAGMA optimize")
+        cur = await con.execute("PRAGMA freelist_count")
+        row = await cur.fetchone()
+        free_pages: int = row[0] if row else 0
+        if free_pages:
+            await _step(con, "incremental_vacuum", f"PRAGMA incremental_vacuum({vacuum_pages})")
+    _stats["last_run"] = time.time()
+    steps = ", ".join(f"{name} {ms:.1f} ms" for name, ms in _stats.items() if name != "last_run")
+    message = itr.sqlite.maintenance_busy if busy else itr.sqlite.maintenance
+    sql_log.info(message.format(steps=steps, pages=free_pages))
+    return dict(_stats)
+
+def maintenance_stats() -> dict[str, float]:
+    """最近一次维护的时间戳（last_run）及每一步的耗时（毫秒）"""
+    return dict(_stats)
+
+def _step_seconds() -> dict[tuple[str, ...], float]:
+    return {(name,): ms / 1000 for name, ms in _stats.items() if name != "last_run"}
+
+def _last_run() -> dict[tuple[str, ...], float]:
+    return {(): _stats["last_run"]} if "last_run" in _stats else {}
+
+Gauge("db_maintenance_step_seconds", "Duration of each step of the last database maintenance", _step_seconds, ("step",))
+Gauge("db_maintenance_last_run_timestamp_seconds", "Unix time of the last database maintenance", _last_run)
+
+async def run_maintenance() -> None:
+    """后台定期维护数据库，优先在空闲时执行"""
+    last_run = time.monotonic()
+    while True:
+        await asyncio.sleep(check_interval)
+        elapsed = time.monotonic() - last_run
+        idle = idle_time_db() >= idle_after
+        if elapsed < max_interval and (elapsed < idle_interval or not idle):
+            continue
+        try:
+            # 关闭时任务会被取消，VACUUM 等操作不能被打断
+            if not await asyncio.shield(maintain_db(idle)):
+                continue
+        except Exception as e:
+            sql_log.error(f"Database maintenance failed: {e}")
+        last_run = time.monotonic()
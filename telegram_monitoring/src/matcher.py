@@ -0,0 +1,84 @@
+from pathlib import Path
+
+__all__ = [
+    "PatternMatcher",
+]
+
+class PatternMatcher:
+    """Aho-Corasick 多模式匹配自动机，构建一次后单次扫描文本即可找出所有命中的词"""
+
+    __slots__ = ("_goto", "_fail", "_out", "_terms")
+
+    def __init__(self, terms: list[str]) -> None:
+        # 去重并忽略空行，空字符串会匹配任何文本
+        self._terms: tuple[str, ...] = tuple(dict.fromkeys(t for t in terms if t))
+        goto: list[dict[str, int]] = [{}]
+        out: list[tuple[int, ...]] = [()]
+
+        # 构建 trie
+        for index, term in enumerate(self._terms):
+            state = 0
+            for ch in term:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] = (*out[state], index)
+
+        # 广度优先计算失败指针，并把失败链上的输出合并到当前状态
+        fail: list[int] = [0] * len(goto)
+        queue: list[int] = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if out[fail[nxt]]:
+                    out[nxt] = (*out[nxt], *out[fail[nxt]])
+                queue.append(nxt)
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    @classmethod
+    def from_file(cls, path: str | Path) -> "PatternMatcher":
+        """从每行一个词的文件构建"""
+        with open(path, encoding="utf-8") as f:
+            return cls([line.rstrip("\r\n") for line in f])
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    @property
+    def terms(self) -> tuple[str, ...]:
+        return self._terms
+
+    def search(self, text: str) -> list[str]:
+        """返回文本中命中的所有词（按词表顺序去重）"""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits: set[int] = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits.update(out[state])
+        return [self._terms[i] for i in sorted(hits)]
+
+    def contains(self, text: str) -> bool:
+        """文本中是否命中任意一个词，命中即返回"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                return True
+        return False
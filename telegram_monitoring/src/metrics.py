@@ -0,0 +1,155 @@
+import time
+from bisect import bisect_left
+from collections.abc import Callable
+from functools import wraps
+from telegram_monitoring.src.tracing import begin_trace, end_trace, enter_span, exit_span
+
+__all__ = [
+    "Counter",
+    "Histogram",
+    "Gauge",
+    "instrument",
+    "render_metrics",
+    "db_seconds",
+    "socketio_call_seconds",
+    "telegram_handler_seconds",
+    "telegram_api_seconds",
+    "errors_total",
+    "socketio_connects_total",
+    "socketio_emits_total",
+]
+
+# 延迟直方图的桶上界（秒），覆盖 SQLite 查询到客户端截图
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "telegram_monitoring_"
+
+_metrics: list["Counter | Histogram | Gauge"] = []
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    items = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        items.append(extra)
+    return "{" + ",".join(items) + "}" if items else ""
+
+class Counter:
+    """只增不减的计数器，按标签值分别计数"""
+
+    __slots__ = ("name", "help", "labelnames", "values")
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: dict[tuple[str, ...], float] = {}
+        _metrics.append(self)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+class Gauge:
+    """抓取时才调用 collect 读取当前值，平时没有任何开销；collect 返回 {标签值: 数值}"""
+
+    __slots__ = ("name", "help", "labelnames", "collect")
+
+    def __init__(self, name: str, help: str, collect: Callable[[], dict[tuple[str, ...], float]], labelnames: tuple[str, ...] = ()) -> None:
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = labelnames
+        self.collect = collect
+        _metrics.append(self)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+class Histogram:
+    """
+    延迟直方图，observe 只做一次二分查找和两次加法
+    每组标签值保存各桶（非累计）的计数，抓取时再累加成 Prometheus 的累计桶
+    """
+
+    __slots__ = ("name", "help", "labelnames", "buckets", "values")
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # 标签值 -> [各桶计数..., +Inf 桶计数, 总和]
+        self.values: dict[tuple[str, ...], list[float]] = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self.values.items()):
+            total = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                le = bound if isinstance(bound, str) else f"{bound:g}"
+                bucket_labels = _labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {counts[-1]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {total}")
+        return lines
+
+def instrument(histogram: Histogram, name: str | None = None, root: bool = False):
+    """
+    统计异步函数耗时的装饰器，标签值默认为函数名
+    抛出异常时同时计入 errors_total；同时把调用记为当前 trace 中的一个 span，root 为真时开始新的 trace
+    """
+    def decorator(func):
+        label = name or func.__name__
+        scope = histogram.name[len(PREFIX):].removesuffix("_seconds")
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            handle = begin_trace(label) if root else enter_span(label)
+            error = None
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                error = e
+                errors_total.inc(scope, label)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, label)
+                if root:
+                    end_trace(handle, error)  # type: ignore
+                elif handle is not None:
+                    exit_span(handle, error)
+        return wrapper
+    return decorator
+
+def render_metrics() -> str:
+    """Prometheus 文本格式"""
+    lines: list[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+db_seconds = Histogram("db_seconds", "Time spent in database functions", ("function",))
+socketio_call_seconds = Histogram("socketio_call_seconds", "Time spent in requests to Socket.IO clients", ("function",))
+telegram_handler_seconds = Histogram("telegram_handler_seconds", "Time spent handling Telegram updates", ("handler",))
+telegram_api_seconds = Histogram("telegram_api_seconds", "Time spent in Telegram Bot API calls", ("method",))
+errors_total = Counter("errors_total", "Exceptions raised by instrumented functions", ("scope", "name"))
+socketio_connects_total = Counter("socketio_connects_total", "Accepted and rejected Socket.IO connections", ("type", "result"))
+socketio_emits_total = Counter("socketio_emits_total", "Events sent to listen clients", ("event",))
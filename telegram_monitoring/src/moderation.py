@@ -0,0 +1,60 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from telegram_monitoring.src.log import telegram_log
+from telegram_monitoring.src.i18n import itr
+from telegram_monitoring.src.matcher import PatternMatcher
+
+__all__ = [
+    "WordList",
+]
+
+class WordList:
+    """可热重载的违禁词表，文件变化时在线程中重建自动机并整体替换"""
+
+    def __init__(self, path: str | Path, interval: float = 5.0) -> None:
+        self.path = Path(path)
+        self.interval = interval
+        self.build_time: float = 0.0
+        self._mtime: int = self._stat()
+        self._lock = asyncio.Lock()
+        start = time.perf_counter()
+        self.matcher: PatternMatcher = PatternMatcher.from_file(self.path)
+        self.build_time = time.perf_counter() - start
+
+    def _stat(self) -> int:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _build(self) -> tuple[PatternMatcher, float]:
+        start = time.perf_counter()
+        matcher = PatternMatcher.from_file(self.path)
+        return matcher, time.perf_counter() - start
+
+    async def reload(self) -> tuple[int, float]:
+        """重建自动机，返回 (词数, 构建耗时秒)；失败时保留旧词表并抛出异常"""
+        async with self._lock:
+            mtime = self._stat()
+            matcher, build_time = await asyncio.to_thread(self._build)
+            # 单次属性赋值，正在执行的 search 仍持有旧自动机的引用
+            self.matcher = matcher
+            self.build_time = build_time
+            self._mtime = mtime
+        telegram_log.info(itr.telegram.words_reloaded.format(count=len(matcher), path=self.path, time=f"{build_time * 1000:.1f}"))
+        return len(matcher), build_time
+
+    async def watch(self) -> None:
+        """轮询文件修改时间，变化时自动重载"""
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._stat() == self._mtime:
+                continue
+            try:
+                await self.reload()
+            except Exception as e:
+                telegram_log.error(f"Failed to reload {self.path}: {e}")
+                # 避免对同一个损坏的文件反复重试
+                self._mtime = self._stat()
@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+
+__all__ = [
+    "SlidingWindowLimiter",
+]
+
+class SlidingWindowLimiter:
+    """
+    按 key 统计的滑动窗口计数器
+    每个 key 只保存 当前窗口起点/上一窗口计数/当前窗口计数，单次操作 O(1)
+    使用 LRU 淘汰，超过 max_keys 或空闲超过两个窗口的 key 会被移除
+    """
+
+    __slots__ = ("window", "max_keys", "_entries")
+
+    def __init__(self, window: float, max_keys: int = 10000) -> None:
+        self.window = window
+        self.max_keys = max_keys
+        # key -> [当前窗口起点, 上一窗口计数, 当前窗口计数]
+        self._entries: OrderedDict[Hashable, list] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit(self, key: Hashable, now: float | None = None) -> int:
+        """记录一次消息，返回该 key 在最近一个窗口内的估算消息数"""
+        if now is None:
+            now = time.monotonic()
+        window = self.window
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is None:
+            entry = [now, 0, 0]
+            entries[key] = entry
+        else:
+            entries.move_to_end(key)
+            elapsed = now - entry[0]
+            if elapsed >= window:
+                # 刚好过了一个窗口时当前计数变为上一窗口计数，否则两个窗口都已过期
+                entry[1] = entry[2] if elapsed < 2 * window else 0
+                entry[2] = 0
+                entry[0] += (elapsed // window) * window
+        entry[2] += 1
+        self._evict(now)
+        weight = 1.0 - (now - entry[0]) / window
+        return int(entry[1] * weight) + entry[2]
+
+    def reset(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def _evict(self, now: float) -> None:
+        entries = self._entries
+        expire = now - 2 * self.window
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if len(entries) <= self.max_keys and entry[0] >= expire:
+                break
+            del entries[key]
@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import time
+from collections import Counter
+from telegram_monitoring.src.log import sql_log
+from telegram_monitoring.src.sql import get_con, read_con, savepoint
+from telegram_monitoring.src.activity import intern_titles, reset_title_cache
+
+__all__ = [
+    "switch_usage",
+    "close_usage",
+    "top_usage",
+    "load_usage",
+    "persist_usage",
+    "reset_usage",
+    "run_usage_persist",
+]
+
+HOUR = 3600
+DAY = 86400
+
+# 内存中保留的桶，更早的数据只保存在数据库中
+hour_retention = 2 * DAY
+day_retention = 400 * DAY
+persist_interval = 60.0
+# 每次定期持久化最多写入的桶数，积压的留到下一次，避免一次写入长时间占用写连接
+persist_batch = 500
+
+# (设备 id, kind) -> (当前标题, 开始时间)
+_current: dict[tuple[int, int], tuple[str, int]] = {}
+# (设备 id, kind, 桶起点) -> {标题: 秒数}，小时桶按整点对齐，天桶按本地时间零点对齐
+_hours: dict[tuple[int, int, int], Counter[str]] = {}
+_days: dict[tuple[int, int, int], Counter[str]] = {}
+# 尚未写入数据库的桶 (设备 id, kind, 粒度, 桶起点)
+_dirty: set[tuple[int, int, int, int]] = set()
+_persist_lock = asyncio.Lock()
+
+def local_day(timestamp: int) -> int:
+    """timestamp 所在本地日期零点的时间戳"""
+    t = time.localtime(timestamp)
+    return int(time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1)))
+
+def _next_day(day: int) -> int:
+    # 加上几小时再取零点，兼容夏令时切换当天不是 24 小时的情况
+    return local_day(day + DAY + 3 * HOUR)
+
+def _add(key: tuple[int, int], title: str, start: int, end: int) -> None:
+    """
+    把 [start, end) 按小时和本地日期边界拆分后累加到对应的桶
+    超出保留期的部分直接丢弃，否则错误的时间戳会生成大量马上又被清理的桶
+    """
+    now = int(time.time())
+    start = max(start, now - day_retention)
+    hour_from = now - hour_retention
+    while start < end:
+        hour = start - start % HOUR
+        day = local_day(start)
+        stop = min(end, hour + HOUR, _next_day(day))
+        seconds = stop - start
+        if hour >= hour_from:
+            _hours.setdefault((*key, hour), Counter())[title] += seconds
+            _dirty.add((*key, HOUR, hour))
+        _days.setdefault((*key, day), Counter())[title] += seconds
+        _dirty.add((*key, DAY, day))
+        start = stop
+
+def switch_usage(kind: int, title: str, timestamp: int, device: int = 0) -> None:
+    """前台窗口/应用切换：结束上一段并开始新的一段"""
+    key = (device, kind)
+    current = _current.get(key)
+    if current is not None:
+        current_title, start = current
+        if current_title == title:
+            return
+        timestamp = max(timestamp, start)
+        _add(key, current_title, start, timestamp)
+    _current[key] = (title, timestamp)
+
+def close_usage(kind: int, timestamp: int, device: int = 0) -> None:
+    """客户端断开或熄屏：结束当前这一段"""
+    key = (device, kind)
+    current = _current.pop(key, None)
+    if current is not None:
+        current_title, start = current
+        _add(key, current_title, start, max(timestamp, start))
+
+def _checkpoint(timestamp: int) -> None:
+    """把进行中的一段累加到当前时间，之后从当前时间继续计时"""
+    for key, (title, start) in list(_current.items()):
+        if timestamp > start:
+            _add(key, title, start, timestamp)
+            _current[key] = (title, timestamp)
+
+def top_usage(kind: int, start: int, n: int = 10, device: int = 0) -> list[tuple[str, int]]:
+    """
+    从 start 到现在使用时长最多的 n 个标题，返回 (标题, 秒数)
+    start 为本地零点时整天使用天桶，否则使用小时桶，只遍历范围内的桶
+    start 不在整点时，第一个小时桶只按落在范围内的比例计入
+    """
+    now = int(time.time())
+    totals: Counter[str] = Counter()
+    t = start - start % HOUR if start != local_day(start) else start
+    if t < start:
+        bucket = _hours.get((device, kind, t))
+        t += HOUR
+        if bucket:
+            # 桶内没有更细的时间信息，按比例估算，并且不超过范围内的秒数
+            covered = t - start
+            for title, seconds in bucket.items():
+                totals[title] += min(seconds * covered // HOUR, covered)
+    while t <= now:
+        if t == local_day(t):
+            bucket = _days.get((device, kind, t))
+            step = _next_day(t)
+        else:
+            bucket = _hours.get((device, kind, t))
+            step = t + HOUR
+        if bucket:
+            totals.update(bucket)
+        t = step
+    current = _current.get((device, kind))
+    if current is not None:
+        title, begin = current
+        totals[title] += max(0, now - max(begin, start))
+    return [(title, seconds) for title, seconds in totals.most_common(n) if seconds > 0]
+
+async def load_usage() -> None:
+    """从数据库加载保留期内的桶"""
+    now = int(time.time())
+    async with read_con() as con:
+        cur = await con.execute(
+            """
+            SELECT usage_rollup.device, usage_rollup.kind, usage_rollup.granularity, usage_rollup.bucket,
+                activity_titles.title, usage_rollup.seconds
+            FROM usage_rollup
+            INNER JOIN activity_titles ON usage_rollup.title_id = activity_titles.id
+            WHERE (usage_rollup.granularity = :hour AND usage_rollup.bucket >= :hour_from)
+                OR (usage_rollup.granularity = :day AND usage_rollup.bucket >= :day_from)
+            """,
+            {"hour": HOUR, "day": DAY, "hour_from": now - hour_retention, "day_from": now - day_retention}
+        )
+        rows = await cur.fetchall()
+    for device, kind, granularity, bucket, title, seconds in rows:
+        buckets = _hours if granularity == HOUR else _days
+        buckets.setdefault((device, kind, bucket), Counter())[title] = seconds
+    sql_log.debug(f"Loaded {len(rows)} usage rollup rows")
+
+async def persist_usage(limit: int | None = None) -> None:
+    """
+    把有变化的桶写入数据库，并清理内存中超出保留期的桶
+    limit 为本次最多写入的桶数，先写较早的桶；为 None 时分批写完全部
+    """
+    async with _persist_lock:
+        if limit is not None:
+            await _persist_usage(limit)
+            return
+        await _persist_usage(persist_batch)
+        while _dirty:
+            await _persist_usage(persist_batch)
+
+async def _persist_usage(limit: int) -> None:
+    now = int(time.time())
+    _checkpoint(now)
+    if len(_dirty) > limit:
+        dirty = heapq.nsmallest(limit, _dirty, key=lambda key: key[3])
+        _dirty.difference_update(dirty)
+    else:
+        dirty = list(_dirty)
+        _dirty.clear()
+    rows: list[tuple[int, int, int, int, str, int]] = []
+    for device, kind, granularity, bucket in dirty:
+        counter = (_hours if granularity == HOUR else _days).get((device, kind, bucket))
+        if counter:
+            rows.extend((device, kind, granularity, bucket, title, seconds) for title, seconds in counter.items())
+    if rows:
+        con = await get_con()
+        try:
+            async with savepoint(con, "persist_usage"):
+                ids = await intern_titles(con, [row[4] for row in rows])
+                await con.executemany(
+                    """
+                    INSERT INTO usage_rollup (device, kind, granularity, bucket, title_id, seconds)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (device, kind, granularity, bucket, title_id) DO UPDATE SET seconds = excluded.seconds
+                    """,
+                    [
+                        (device, kind, granularity, bucket, ids[title], seconds)
+                        for device, kind, granularity, bucket, title, seconds in rows
+                    ]
+                )
+        except Exception:
+            reset_title_cache()
+            _dirty.update(dirty)
+            raise
+        await con.commit()
+    for key in [key for key in _hours if key[2] < now - hour_retention]:
+        del _hours[key]
+    for key in [key for key in _days if key[2] < now - day_retention]:
+        del _days[key]
+
+def reset_usage() -> None:
+    """
+    失去 leader 后清空内存中的统计，之后由新的 leader 计时
+    不清空的话，重新成为 leader 时进行中的一段会从失去 leader 时算起，期间断开的设备也会一直计时
+    """
+    _current.clear()
+    _hours.clear()
+    _days.clear()
+    _dirty.clear()
+
+async def run_usage_persist() -> None:
+    """定期持久化使用时长统计"""
+    while True:
+        await asyncio.sleep(persist_interval)
+        try:
+            # 关闭时任务会被取消，已开始的写入不能被打断
+            await asyncio.shield(persist_usage(persist_batch))
+        except Exception as e:
+            sql_log.error(f"Failed to persist usage rollup: {e}")
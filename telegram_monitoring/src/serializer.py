@@ -0,0 +1,111 @@
+import socketio
+from engineio import packet as eio_packet
+from socketio import packet
+from telegram_monitoring.src.log import socketio_log
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+__all__ = [
+    "msgpack_available",
+    "NegotiatedPacket",
+    "NegotiatedServer",
+]
+
+# 二进制事件在 msgpack 中直接携带字节，不需要附件
+_plain_type = {packet.BINARY_EVENT: packet.EVENT, packet.BINARY_ACK: packet.ACK}
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+class _Encoded(str):
+    """JSON 编码结果，附带原始数据包，发给 msgpack 客户端时再转换"""
+
+    packet: "NegotiatedPacket"
+
+class _Attachment(bytes):
+    """JSON 二进制事件的附件，msgpack 客户端不需要"""
+
+class NegotiatedPacket(packet.Packet):
+    """
+    同时支持 JSON 和 msgpack 的数据包
+    解码时按类型区分：文本是 JSON，字节是 msgpack（JSON 的二进制附件不经过 decode）
+    编码时总是先得到 JSON，msgpack 编码在第一次需要时生成并缓存，广播时每种格式只编码一次
+    """
+
+    def encode(self):
+        encoded = super().encode()
+        if isinstance(encoded, list):
+            head = _Encoded(encoded[0])
+            head.packet = self
+            return [head, *(_Attachment(attachment) for attachment in encoded[1:])]
+        result = _Encoded(encoded)
+        result.packet = self
+        return result
+
+    def encode_msgpack(self) -> bytes:
+        cached = self.__dict__.get("_msgpack")
+        if cached is None:
+            data = {"type": _plain_type.get(self.packet_type, self.packet_type), "nsp": self.namespace or "/"}
+            if self.data is not None:
+                data["data"] = self.data
+            if self.id is not None:
+                data["id"] = self.id
+            cached = self._msgpack = msgpack.dumps(data)  # type: ignore
+        return cached
+
+    def decode(self, encoded_packet):
+        if not isinstance(encoded_packet, bytes):
+            return super().decode(encoded_packet)
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        decoded = msgpack.loads(encoded_packet)
+        self.packet_type = decoded["type"]
+        self.data = decoded.get("data")
+        self.id = decoded.get("id")
+        self.namespace = decoded["nsp"]
+        return 0
+
+class NegotiatedServer(socketio.AsyncServer):
+    """
+    按连接协商序列化格式的 Socket.IO 服务端
+    客户端使用 msgpack 序列化时，它的 CONNECT 包就是字节，此后发给它的数据包都用 msgpack 编码
+    其余客户端照常使用 JSON，旧客户端不受影响
+    这里覆盖了 AsyncServer 的私有方法，因此 requirements 中固定了 python-socketio/python-engineio 的版本，
+    升级前需运行 tests/test_serializer.py 确认握手和广播仍然正常
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(serializer=NegotiatedPacket, **kwargs)
+        # 使用 msgpack 的 Engine.IO 连接
+        self._msgpack_sids: set[str] = set()
+
+    async def _send_packet(self, eio_sid, pkt):
+        if eio_sid in self._msgpack_sids:
+            await self.eio.send(eio_sid, pkt.encode_msgpack())
+        else:
+            await super()._send_packet(eio_sid, pkt)
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        # 广播时管理器把同一份 JSON 编码发给所有参与者，这里为 msgpack 客户端换成 msgpack 编码
+        if eio_sid in self._msgpack_sids:
+            if isinstance(eio_pkt.data, _Attachment):
+                return
+            if isinstance(eio_pkt.data, _Encoded):
+                eio_pkt = eio_packet.Packet(eio_packet.MESSAGE, eio_pkt.data.packet.encode_msgpack())
+        await super()._send_eio_packet(eio_sid, eio_pkt)
+
+    async def _handle_eio_message(self, eio_sid, data):
+        if isinstance(data, bytes) and eio_sid not in self._binary_packet and eio_sid not in self._msgpack_sids:
+            if msgpack is None:
+                socketio_log.warning(f"Client {eio_sid} sent a msgpack packet but msgpack is not installed")
+                return
+            self._msgpack_sids.add(eio_sid)
+            socketio_log.debug(f"Client {eio_sid} uses msgpack")
+        await super()._handle_eio_message(eio_sid, data)
+
+    async def _handle_eio_disconnect(self, eio_sid, reason):
+        await super()._handle_eio_disconnect(eio_sid, reason)
+        self._msgpack_sids.discard(eio_sid)
@@ -3,6 +3,8 @@ from telegram_monitoring.src.socket_route import sio, get_client_sid
 from telegram_monitoring.src.sql import *
 from telegram_monitoring.src.log import socketio_log
 from telegram_monitoring.src.i18n import itr
+from telegram_monitoring.src.metrics import socketio_call_seconds, instrument
+from telegram_monitoring.src.tracing import span
 
 __all__ = [
     "client_toast",
@@ -33,16 +35,23 @@ class client_hardwareinfo(BaseModel):
     uptime: int
     gpu_info: list[dict[str, str | int | None]]
 
-async def client_toast(title: str, body: str):
-    client_sid: str = get_client_sid()
+async def _call(event: str, **kwargs):
+    """向客户端发起请求并等待回复，往返时间记为当前 trace 中的 span"""
+    with span(f"sio.call {event}"):
+        return await sio.call(event, **kwargs)
+
+@instrument(socketio_call_seconds)
+async def client_toast(title: str, body: str, device: str | None = None):
+    client_sid: str = get_client_sid(device)
     await sio.emit(
         "client_toast",
         data={"title": title, "body": body},
         to=client_sid
         )
 
-async def client_toast_with_input(title: str, body: str) -> str | None:
-    client_sid: str = get_client_sid()
+@instrument(socketio_call_seconds)
+async def client_toast_with_input(title: str, body: str, device: str | None = None) -> str | None:
+    client_sid: str = get_client_sid(device)
     data: dict[str, str | dict[str, str]] = {
         "title": title,
         "body": body,
@@ -55,7 +64,7 @@ async def client_toast_with_input(title: str, body: str) -> str | None:
         }
     }
     try:
-        reply_text: str | None = await sio.call(
+        reply_text: str | None = await _call(
             "client_toast_reply",
             data=data,
             to=client_sid,
@@ -68,14 +77,15 @@ async def client_toast_with_input(title: str, body: str) -> str | None:
     except Exception:
         return None
 
-async def client_screenshot_on_click(userfullname: str, userid: int) -> bytes:
-    client_sid: str = get_client_sid()
+@instrument(socketio_call_seconds)
+async def client_screenshot_on_click(userfullname: str, userid: int, device: str | None = None) -> bytes:
+    client_sid: str = get_client_sid(device)
     data: dict[str, str] = {
         "title": itr.socketio.please_screenshot.format(user=f"{userfullname}({userid})"),
         "body": itr.socketio.click_allow
     }
     try:
-        photo_data: bytes | None = await sio.call(
+        photo_data: bytes | None = await _call(
             "client_toast_on_click",
             data=data,
             to=client_sid,
@@ -90,20 +100,22 @@ async def client_screenshot_on_click(userfullname: str, userid: int) -> bytes:
     socketio_log.debug(f"Received screenshot from client {client_sid}")
     return photo_data
 
-async def client_screenshot(userfullname: str, userid: int) -> tuple[bytes, bool]:
-    client_sid: str = get_client_sid()
+@instrument(socketio_call_seconds)
+async def client_screenshot(userfullname: str, userid: int, device: str | None = None) -> tuple[bytes, bool]:
+    client_sid: str = get_client_sid(device)
     allow: bool = await check_allow_user_db(userid)
     if not allow:
         socketio_log.debug(f"User {userfullname}({userid}) is not allowed user")
-        png_byte: bytes = await client_screenshot_on_click(userfullname, userid)
+        png_byte: bytes = await client_screenshot_on_click(userfullname, userid, device)
         return png_byte, allow
     await client_toast(
         itr.socketio.is_screenshot,
-        itr.socketio.screenshot_from.format(user=f"{userfullname}({userid})")
+        itr.socketio.screenshot_from.format(user=f"{userfullname}({userid})"),
+        device
         )
     socketio_log.debug(f"User {userfullname}({userid}) is allowed user")
     try:
-        png_bytes: bytes | None = await sio.call("screenshot", to=client_sid, timeout=5)
+        png_bytes: bytes | None = await _call("screenshot", to=client_sid, timeout=5)
         if png_bytes is None:
             socketio_log.debug(f"Received empty screenshot from client {client_sid}")
             return b"", allow
@@ -113,11 +125,12 @@ async def client_screenshot(userfullname: str, userid: int) -> tuple[bytes, bool
         socketio_log.error(f"Error in client_screenshot: {e}")
         return b"", allow
 
-async def client_get_hard_info() -> dict | None:
-    client_sid: str = get_client_sid()
+@instrument(socketio_call_seconds)
+async def client_get_hard_info(device: str | None = None) -> dict | None:
+    client_sid: str = get_client_sid(device)
     try:
         socketio_log.debug(f"Already get hard info from client {client_sid}")
-        hard_info: dict | None = await sio.call("get_hard_info", to=client_sid, timeout=5)
+        hard_info: dict | None = await _call("get_hard_info", to=client_sid, timeout=5)
         if hard_info is None:
             socketio_log.debug(f"Received empty hard info from client {client_sid}")
             return None
@@ -136,3 +149,15 @@ async def client_get_hard_info() -> dict | None:
 async def get_user_list(sid) -> list[tuple[int, str, str]]:
     socketio_log.debug(f"Received get_user_list request from client {sid}")
     return await get_all_user_db()
+
+@sio.event
+async def get_user_list_delta(sid, since: int) -> dict[str, int | bool | list]:
+    """增量同步用户列表，客户端传入上次得到的版本号，只返回之后的变更"""
+    socketio_log.debug(f"Received get_user_list_delta request from client {sid} since version {since}")
+    version, full, upserts, deletes = await get_user_changes_db(int(since or 0))
+    return {
+        "version": version,
+        "full": full,
+        "upserts": upserts,
+        "deletes": deletes,
+    }
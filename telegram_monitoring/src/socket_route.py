@@ -1,56 +1,127 @@
 import socketio
 import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Header, Depends, Response
+from functools import partial
+from fastapi import FastAPI, HTTPException, Header, Depends, Response, Request
+from fastapi.responses import StreamingResponse
 import json
+import os
 import time
-from collections import deque
+from urllib.parse import parse_qs
 from pydantic import BaseModel
 import hmac
 from telegram_monitoring.src.config import config
 from telegram_monitoring.src.log import socketio_log
 from telegram_monitoring.src.i18n import itr
+from telegram_monitoring.src.sql import init_db, close_con, load_cache
+from telegram_monitoring.src.activity import WINDOW, APP, record_activity, flush_activity, query_activity
+from telegram_monitoring.src.maintenance import run_maintenance
+from telegram_monitoring.src.devices import Device, Listener, get_device, find_device, list_devices, load_devices
+from telegram_monitoring.src.rollup import switch_usage, close_usage, load_usage, persist_usage, reset_usage, run_usage_persist, day_retention
+from telegram_monitoring.src.backend import get_backend
+from telegram_monitoring.src.serializer import NegotiatedServer
+from telegram_monitoring.src.metrics import Gauge, render_metrics, socketio_connects_total, socketio_emits_total
+from telegram_monitoring.src.tracing import recent_traces
+
+# 设备状态的共享后端，多进程部署时各进程通过它同步状态
+state = get_backend()
+# 只需运行一份的后台任务，只在 leader 进程中运行
+_leader_tasks: list[asyncio.Task] = []
+
+async def _set_leader(need_start_bot: bool, leader: bool) -> None:
+    """成为 leader 时启动后台任务，失去 leader 时停止并写入未保存的数据"""
+    if not leader:
+        for task in _leader_tasks:
+            task.cancel()
+        _leader_tasks.clear()
+        try:
+            await persist_usage()
+        finally:
+            # 重新成为 leader 时从数据库和设备状态恢复
+            reset_usage()
+        await flush_activity()
+        return
+
+    # 作为非 leader 运行期间可能错过了用户表的变更，接管前重新加载用户缓存
+    await load_cache()
+    await load_usage()
+    # 接管时正在进行的一段从状态中恢复计时
+    now = int(time.time())
+    for device in list_devices():
+        if device.client_sid and device.window_list:
+            switch_usage(WINDOW, device.window_list[-1][0], now, device.key)
+        if device.app_list and device.phone_app.get("name") != "手机已熄屏":
+            switch_usage(APP, device.app_list[-1][0], now, device.key)
+    _leader_tasks.append(asyncio.create_task(run_usage_persist()))
+    _leader_tasks.append(asyncio.create_task(run_maintenance()))
+    if need_start_bot:
+        from telegram_monitoring.src.telegram import bot, commands, word_list
+        await bot.set_my_commands(commands)
+        _leader_tasks.append(asyncio.create_task(bot.polling()))
+        _leader_tasks.append(asyncio.create_task(word_list.watch()))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    if getattr(app.state, "need_start_bot", False):
-        from telegram_monitoring.src.sql import init_db, close_con
-        from telegram_monitoring.src.telegram import bot, commands
-        await init_db()
-        await bot.set_my_commands(commands)
-        asyncio.create_task(bot.polling())
+    # 窗口/应用历史也存放在数据库中，不启动机器人时同样需要
+    await init_db()
+    await load_devices()
+    need_start_bot = getattr(app.state, "need_start_bot", False)
+    if need_start_bot:
+        # 每个进程都要注册客户端调用的事件，只有 leader 接收 Telegram 更新
+        import telegram_monitoring.src.telegram
+    state.attach(apply_change, dump_states, load_states, partial(_set_leader, need_start_bot))
+    await state.start()
+    # 其他进程转发的 emit 和回调需要在本进程第一个连接之前就开始接收
+    if not sio.manager_initialized:
+        sio.manager_initialized = True
+        sio.manager.initialize()
 
     try:
         yield
     finally:
-        if getattr(app.state, "need_start_bot", False):
-            from telegram_monitoring.src.sql import close_con
-            await close_con()
+        if state.is_leader:
+            await _set_leader(need_start_bot, False)
+        await state.stop()
+        await close_con()
 
 app = FastAPI(lifespan=lifespan)
 
 if config.log_level == "DEBUG":
-    sio = socketio.AsyncServer(
+    sio = NegotiatedServer(
         async_mode="asgi",
         cors_allowed_origins="*",
         max_http_buffer_size=10*1024*1024, # 10MB，因为 Telegram 限制了上传图片大小（此项目使用字节流传输）
+        client_manager=state.client_manager(),
         logger=socketio_log, # type: ignore
         engineio_logger=socketio_log,
     )
 else:
-    sio = socketio.AsyncServer(
+    sio = NegotiatedServer(
         async_mode="asgi",
         cors_allowed_origins="*",
-        max_http_buffer_size=10*1024*1024
+        max_http_buffer_size=10*1024*1024,
+        client_manager=state.client_manager()
     )
 
 app.mount("/socket.io", socketio.ASGIApp(sio)) # type: ignore
 
-client_sid: str = ""
-listen_client_sid: str = ""
-now_window_list: deque[tuple[str, int]] = deque()
-phone_now_app: dict = {}
-now_app_list: deque[tuple[str, int]] = deque()
+# Socket.IO 连接 -> 所属设备
+_sid_devices: dict[str, Device] = {}
+# SSE 心跳间隔，避免代理因连接空闲而断开
+stream_keepalive = 15.0
+# 监听客户端的 Engine.IO 发送队列超过该长度时暂停发送，期间的变化在 Listener 中合并
+listener_backlog = 16
+
+def _connection_counts() -> dict[tuple[str, ...], float]:
+    """本进程当前的连接数：电脑客户端、监听客户端以及 /stream 订阅者"""
+    devices = list_devices()
+    return {
+        ("pc",): sum(1 for sid, device in _sid_devices.items() if sid == device.client_sid),
+        ("listen",): sum(len(device.listeners) for device in devices),
+        ("stream",): sum(len(device.changes) for device in devices),
+    }
+
+Gauge("connections", "Open connections of this worker", _connection_counts, ("type",))
 
 class PhoneWebhook(BaseModel):
     name: str
@@ -61,104 +132,294 @@ class PhoneWebhook(BaseModel):
     android_version: str
     uptime: str
 
+class PhoneEvent(PhoneWebhook):
+    # 手机记录该事件时的 Unix 时间戳（秒）
+    time: int
+
+# 批量上报一次最多接受的事件数
+max_phone_batch = 1000
+# 早于该秒数之前的事件直接拒绝，与使用统计的保留时长一致，避免错误的时间戳（例如 0）写入统计
+max_phone_event_age = day_retention
+
+def _client_option(auth: dict | None, environ: dict, name: str) -> str:
+    """连接参数优先从 auth 字典里取，没有再从请求头和查询参数里取"""
+    value = (auth or {}).get(name) if isinstance(auth, dict) else None
+    if value is None:
+        value = environ.get(f"HTTP_{name.upper()}") or parse_qs(environ.get("QUERY_STRING", "")).get(name, [""])[0]
+    return str(value)
+
 @sio.event
 async def connect(sid: str, environ: dict, auth: dict[str, str]) -> bool:
-    global client_sid, listen_client_sid
     async def emit_disconnect():
         await sio.disconnect(sid)
         socketio_log.warning(itr.socketio.no_auth_token.format(sid=sid))
         socketio_log.warning(itr.socketio.auth_token_help)
 
-    # 优先从 auth 字典里取，没有再从 environ 里取
-    client_type = (
-        (auth or {}).get("type")
-        or environ.get("HTTP_TYPE", "")
-        or ("listen_client" if "type=listen_client" in environ.get("QUERY_STRING", "") else "")
-    )
-
-    # 如果已有 client_sid 且新连接不是 listen_client，则拒绝
-    if client_sid and client_type != "listen_client":
-        socketio_log.warning(itr.socketio.reject_connect.format(sid1=sid, sid2=client_sid))
-        return False
-    # 如果已有 listen_client_sid 且新连接是 listen_client，也拒绝
-    if listen_client_sid and client_type == "listen_client":
-        socketio_log.warning(itr.socketio.reject_connect.format(sid1=sid, sid2=listen_client_sid))
-        return False
-
-    if client_type == "listen_client":
-        socketio_log.info(itr.socketio.type_client.format(sid=sid))
-        listen_client_sid = sid
-    else:
-        client_sid = sid
-
     try:
         auth_token = (auth or {}).get("token") or environ.get("HTTP_TOKEN", "")
     except AttributeError:
+        auth_token = ""
         if f"token={config.token}" in environ.get("QUERY_STRING", ""):
             socketio_log.warning(itr.socketio.warning_connect.format(sid=sid).split("\n")[0])
             socketio_log.warning(itr.socketio.warning_connect.split("\n")[1])
-            return True
-        else:
-            await emit_disconnect()
-            return False
+            auth_token = config.token
 
     auth_token_byte = auth_token.encode("utf-8")
     config_token_byte = config.token.encode("utf-8")
     if not hmac.compare_digest(auth_token_byte, config_token_byte):
+        socketio_connects_total.inc("unknown", "unauthorized")
         await emit_disconnect()
         return False
 
+    client_type = _client_option(auth, environ, "type")
+    kind = "listen" if client_type == "listen_client" else "pc"
+    try:
+        device = await get_device(_client_option(auth, environ, "device"))
+    except ValueError as e:
+        socketio_connects_total.inc(kind, "rejected")
+        socketio_log.warning(f"Rejected connection {sid}: {e}")
+        return False
+
+    if client_type == "listen_client":
+        socketio_log.info(itr.socketio.type_client.format(sid=sid))
+        listener = Listener(sid, _client_option(auth, environ, "delta").lower() in ("1", "true"))
+        if listener.delta:
+            # 连接后先发送完整快照
+            listener.resync()
+        listener.task = asyncio.create_task(_listener_sender(device, listener))
+        device.listeners[sid] = listener
+    else:
+        # 每台设备只允许一个被监控的客户端，多进程部署时由状态后端判断
+        if not await state.claim_client(device.name, sid):
+            socketio_connects_total.inc(kind, "rejected")
+            socketio_log.warning(itr.socketio.reject_connect.format(sid1=sid, sid2=device.client_sid))
+            return False
+        await state.publish({"op": "connect", "device": device.name, "sid": sid})
+    _sid_devices[sid] = device
+    socketio_connects_total.inc(kind, "accepted")
+
     socketio_log.info(itr.socketio.connected.format(sid=sid))
+    socketio_log.debug(f"Client {sid} belongs to device {device.name}")
     return True
 
+@sio.event
+async def resync(sid: str) -> None:
+    """增量协议的监听客户端发现序号不连续时请求完整快照"""
+    device = _sid_devices.get(sid)
+    listener = device.listeners.get(sid) if device is not None else None
+    if listener is not None:
+        listener.resync()
+
 @sio.event
 async def disconnect(sid: str):
-    global client_sid, listen_client_sid
-    if sid == client_sid:
-        client_sid = ""
-    elif sid == listen_client_sid:
-        listen_client_sid = ""
-    now_window_list.clear()
+    device = _sid_devices.pop(sid, None)
+    if device is not None:
+        if sid == device.client_sid:
+            # 断开前尚未稳定的窗口不记入历史
+            device.pending_window = None
+            # 先清空状态再释放，释放之后才允许新的电脑客户端连接
+            await state.publish({"op": "disconnect", "device": device.name, "sid": sid, "time": int(time.time())})
+            await state.release_client(device.name, sid)
+        else:
+            listener = device.listeners.pop(sid, None)
+            if listener is not None and listener.task is not None:
+                listener.task.cancel()
     socketio_log.info(itr.socketio.disconnected.format(sid=sid))
 
-async def emit_window_change(emit: bool) -> tuple[str, dict]:
-    if not now_window_list:
-        return "", {}
-
-    now_window, switch_window_time = now_window_list[-1]
-    window_list: list[dict[str, str | int]] = [
-        {"title": window, "switch_window_time": time}
-        for window, time in now_window_list
-    ]
-
-    data_raw: dict= {
-        "now_window": now_window,
-        "switch_window_time": switch_window_time,
-        "window_list": window_list
-    }
-    data = json.dumps(data_raw, ensure_ascii=False, indent=2)
-    if emit and listen_client_sid:
-        await sio.emit("get_window", data, to=listen_client_sid)
-        socketio_log.debug(f"Emitted window change to listen client {listen_client_sid}")
+def _backlog(sid: str) -> int:
+    """监听客户端在 Engine.IO 中尚未发出的数据包数量"""
+    try:
+        socket = sio.eio.sockets.get(sio.manager.eio_sid_from_sid(sid, "/"))
+        return socket.queue.qsize() if socket is not None else 0
+    except Exception:
+        return 0
+
+async def _listener_sender(device: Device, listener: Listener) -> None:
+    """逐条发送监听客户端队列中的事件，客户端接收得慢时等待，期间的变化在队列中合并"""
+    while True:
+        await listener.wakeup.wait()
+        while _backlog(listener.sid) > listener_backlog:
+            await asyncio.sleep(0.1)
+        listener.wakeup.clear()
+        try:
+            while listener.snapshots:
+                kind = listener.snapshots.pop()
+                await emit_snapshot(device, kind, listener.sid)
+            while listener.deltas and not listener.snapshots:
+                _, event, data = listener.deltas.popleft()
+                await sio.emit(event, data, to=listener.sid)
+                socketio_emits_total.inc(event)
+            while listener.latest:
+                event = next(iter(listener.latest))
+                await sio.emit(event, listener.latest.pop(event), to=listener.sid)
+                socketio_emits_total.inc(event)
+        except Exception as e:
+            socketio_log.error(f"Failed to send to listen client {listener.sid}: {e}")
+
+async def emit_snapshot(device: Device, kind: str, sid: str) -> None:
+    """
+    向增量协议的监听客户端发送完整快照，seq 为快照对应的版本号
+    之后的 window_delta/app_delta 的 seq 应依次加一，不连续时客户端发送 resync 重新获取快照
+    """
+    if kind == "window":
+        await sio.emit("window_snapshot", {"seq": device.window_snapshot.version, "data": device.window_data()}, to=sid)
+        socketio_emits_total.inc("window_snapshot")
+    else:
+        await sio.emit("app_snapshot", {"seq": device.app_snapshot.version, "data": device.phone_app}, to=sid)
+        socketio_emits_total.inc("app_snapshot")
 
-    return data, data_raw
+def _listeners(device: Device, delta: bool) -> list[Listener]:
+    return [listener for listener in device.listeners.values() if listener.delta == delta]
 
-async def emit_phone_app(emit: bool) -> tuple[str, dict]:
-    if not phone_now_app:
-        return "", {}
+async def emit_window_change(device: Device, evicted: bool = False) -> None:
+    data_raw = device.window_data()
+    if not data_raw:
+        return
 
-    data: str = json.dumps(phone_now_app, ensure_ascii=False, indent=2)
-    data_raw = phone_now_app
+    device.changes.publish("window", device.window_snapshot.get()[0])
+
+    # 只放入各监听客户端的发送队列，不等待发送完成
+    listeners = _listeners(device, True)
+    if listeners:
+        # 增量协议只发送新追加的一条，以及队列是否丢弃了最旧的一条
+        title, switch_window_time = device.window_list[-1]
+        delta = {
+            "seq": device.window_snapshot.version,
+            "append": {"title": title, "switch_window_time": switch_window_time},
+            "evict": evicted,
+        }
+        for listener in listeners:
+            listener.push_delta("window", "window_delta", delta)
+
+    listeners = _listeners(device, False)
+    if listeners:
+        data = json.dumps(data_raw, ensure_ascii=False, indent=2)
+        for listener in listeners:
+            listener.push("get_window", data)
+    socketio_log.debug(f"Queued window change for {len(device.listeners)} listen clients of {device.name}")
+
+async def emit_phone_app(device: Device, appended: int = 0, evicted: bool = False) -> None:
+    phone_now_app = device.phone_app
+    if not phone_now_app:
+        return
 
-    if emit and listen_client_sid:
-        await sio.emit("get_app", data, to=listen_client_sid)
-        socketio_log.debug(f"Emitted phone app to listen client {listen_client_sid}")
+    device.changes.publish("app", device.app_snapshot.get()[0])
+
+    listeners = _listeners(device, True)
+    if listeners and appended > 1:
+        # 一批事件追加了多条，增量无法表示，改为发送快照
+        for listener in listeners:
+            listener.resync(("app",))
+    elif listeners:
+        # 除 app_list 外的字段数量固定，app_list 只发送新追加的一条
+        delta = {
+            "seq": device.app_snapshot.version,
+            "fields": {key: value for key, value in phone_now_app.items() if key != "app_list"},
+            "append": list(device.app_list[-1]) if appended else None,
+            "evict": evicted,
+        }
+        for listener in listeners:
+            listener.push_delta("app", "app_delta", delta)
+
+    listeners = _listeners(device, False)
+    if listeners:
+        data = json.dumps(phone_now_app, ensure_ascii=False, indent=2)
+        for listener in listeners:
+            listener.push("get_app", data)
+    socketio_log.debug(f"Queued phone app for {len(device.listeners)} listen clients of {device.name}")
+
+async def apply_change(op: dict) -> None:
+    """
+    应用一条状态变更，多进程部署时每个进程都按总线顺序应用同样的变更
+    历史记录和使用时长只由 leader 写入
+    """
+    kind = op["op"]
+    if kind == "users":
+        # 其他进程修改了用户表，本进程修改时缓存已经是最新的
+        if op.get("pid") != os.getpid():
+            await load_cache()
+        return
+    device = await get_device(op["device"])
+    if kind == "connect":
+        device.client_sid = op["sid"]
+    elif kind == "disconnect":
+        if device.client_sid != op["sid"]:
+            return
+        device.client_sid = ""
+        if state.is_leader:
+            close_usage(WINDOW, op["time"], device.key)
+        device.window_list.clear()
+        device.window_snapshot.bump()
+        # 推送空的窗口，/stream 和 /poll 的订阅者随之清空
+        device.changes.publish("window", b"{}")
+    elif kind == "window":
+        await _apply_window(device, op["title"], op["time"])
+    elif kind == "app":
+        await _apply_app(device, op)
+
+def dump_states() -> dict:
+    """导出各设备的状态，供新启动的进程加载"""
+    return {
+        device.name: {
+            "client_sid": device.client_sid,
+            "window_list": list(device.window_list),
+            "app_list": list(device.app_list),
+            "phone_app": dict(device.phone_app),
+        }
+        for device in list_devices()
+    }
 
-    return data, data_raw
+async def load_states(states: dict) -> None:
+    for name, data in states.items():
+        device = await get_device(name)
+        device.client_sid = data["client_sid"]
+        device.window_list.clear()
+        # 经过总线的 JSON 后元组变成了列表
+        device.window_list.extend(map(tuple, data["window_list"]))
+        device.app_list.clear()
+        device.app_list.extend(map(tuple, data["app_list"]))
+        device.phone_app.clear()
+        device.phone_app.update(data["phone_app"])
+        device.window_snapshot.bump()
+        device.app_snapshot.bump()
 
 @sio.event
 async def window_change(sid: str, title: str, switch_window_time: int):
-    global now_window_list
+    device = _sid_devices.get(sid)
+    if device is None or sid != device.client_sid:
+        return
+    socketio_log.debug(f"Received window info from client {sid}: {title} {switch_window_time}")
+    if config.window_settle <= 0:
+        await state.publish({"op": "window", "device": device.name, "title": title, "time": switch_window_time})
+        return
+    if device.window_list and device.window_list[-1][0] == title:
+        # 稳定之前又切回了当前窗口，丢弃中间的切换
+        device.pending_window = None
+        return
+    if device.pending_window is not None and device.pending_window[0] == title:
+        # 重复上报同一窗口，保留第一次的切换时间和稳定计时
+        return
+    device.pending_window = (title, switch_window_time, time.monotonic())
+    if device.settle_task is None or device.settle_task.done():
+        device.settle_task = asyncio.create_task(_settle_window(device))
+
+async def _settle_window(device: Device) -> None:
+    """
+    等待最新的窗口在前台停留 window_settle 毫秒后再发布
+    期间的快速切换（Alt-Tab、最小化再还原）只保留最后一个窗口，合并为一次变更
+    """
+    settle = config.window_settle / 1000
+    while device.pending_window is not None:
+        title, switch_window_time, received = device.pending_window
+        delay = received + settle - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+            continue
+        device.pending_window = None
+        await state.publish({"op": "window", "device": device.name, "title": title, "time": switch_window_time})
+
+async def _apply_window(device: Device, title: str, switch_window_time: int) -> None:
+    now_window_list = device.window_list
     if not now_window_list:
         window_title = ""
     else:
@@ -168,11 +429,14 @@ async def window_change(sid: str, title: str, switch_window_time: int):
         return
 
     now_window_list.append((title, switch_window_time))
-    if len(now_window_list) > config.max_window:
+    evicted = len(now_window_list) > config.max_window
+    if evicted:
         now_window_list.popleft()
-
-    socketio_log.debug(f"Received window info from client {sid}: {title} {switch_window_time}")
-    await emit_window_change(True)
+    device.window_snapshot.bump()
+    if state.is_leader:
+        record_activity(WINDOW, title, switch_window_time, device.key)
+        switch_usage(WINDOW, title, switch_window_time, device.key)
+    await emit_window_change(device, evicted)
 
 async def verify_token(authorization: str = Header(...)) -> None:
     """验证 token"""
@@ -181,7 +445,12 @@ async def verify_token(authorization: str = Header(...)) -> None:
     config_token_byte = config.token.encode("utf-8")
     if not hmac.compare_digest(auth_token_byte, config_token_byte):
         raise HTTPException(status_code=401, detail="Unauthorized")
-    
+
+def _find_device(device: str | None) -> Device:
+    found = find_device(device)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Device Not Found")
+    return found
 
 @app.get("/")
 async def _index() -> Response:
@@ -193,57 +462,209 @@ async def _index() -> Response:
         media_type="text/plain"
     )
 
-@app.get("/now_window", dependencies=[Depends(verify_token)], response_model=None)
-async def _get_now_window() -> dict | Response:
-    """获取当前窗口"""
-    data, data_raw = await emit_window_change(False)
-    if not data:
-        return Response(status_code=204)
+@app.get("/metrics", dependencies=[Depends(verify_token)])
+async def _metrics() -> Response:
+    """Prometheus 文本格式的指标，多进程部署时每个进程各自统计"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/traces", dependencies=[Depends(verify_token)])
+async def _traces(limit: int = 50, min_ms: float = 0) -> dict:
+    """最近结束的 trace，新的在前；min_ms 只返回耗时不少于该值的"""
+    return {"traces": recent_traces(max(1, limit), min_ms)}
+
+@app.get("/devices", dependencies=[Depends(verify_token)])
+async def _get_devices() -> dict:
+    """列出已登记的设备"""
+    return {
+        "devices": [
+            {
+                "name": device.name,
+                "client_connected": bool(device.client_sid),
+                "listen_clients": len(device.listeners),
+                "now_window": device.window_list[-1][0] if device.window_list else None,
+                "now_app": device.phone_app.get("name"),
+            }
+            for device in list_devices()
+        ]
+    }
 
-    return data_raw
+@app.get("/now_window", dependencies=[Depends(verify_token)])
+async def _get_now_window(device: str | None = None, if_none_match: str | None = Header(None)) -> Response:
+    """获取当前窗口"""
+    return _find_device(device).window_snapshot.response(if_none_match)
 
-@app.get("/now_app", dependencies=[Depends(verify_token)], response_model=None)
-async def _get_now_app() -> dict | Response:
+@app.get("/now_app", dependencies=[Depends(verify_token)])
+async def _get_now_app(device: str | None = None, if_none_match: str | None = Header(None)) -> Response:
     """获取当前应用"""
+    return _find_device(device).app_snapshot.response(if_none_match)
+
+@app.get("/stream", dependencies=[Depends(verify_token)])
+async def _stream(
+    request: Request,
+    device: str | None = None,
+    last_event_id: str | None = Header(None)
+) -> StreamingResponse:
+    """以 Server-Sent Events 推送窗口/应用变化，事件 id 为版本号，断线重连时从 Last-Event-ID 之后继续"""
+    changes = _find_device(device).changes
+    since = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+    subscriber = changes.subscribe(since)
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    await asyncio.wait_for(subscriber.event.wait(), stream_keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                for kind, version, data in subscriber.take():
+                    yield b"event: %s\nid: %d\ndata: %s\n\n" % (kind.encode(), version, data)
+        finally:
+            changes.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    data, data_raw = await emit_phone_app(False)
-    if not data:
-        return Response(status_code=204)
+@app.get("/poll", dependencies=[Depends(verify_token)])
+async def _poll(device: str | None = None, since: int = 0, timeout: float = 25.0) -> Response:
+    """长轮询：返回 since 版本之后的窗口/应用变化，没有变化时最多等待 timeout 秒后返回 204"""
+    changes = _find_device(device).changes
+    items = await changes.wait(since, max(0.0, min(timeout, 60.0)))
+    if not items:
+        return Response(status_code=204, headers={"X-Version": str(changes.version)})
+    body = b"".join(b',"%s":%s' % (kind.encode(), data) for kind, _, data in items)
+    return Response(
+        content=b'{"version":%d%s}' % (items[-1][1], body),
+        media_type="application/json"
+    )
 
-    return data_raw
+@app.get("/history/{kind}", dependencies=[Depends(verify_token)], response_model=None)
+async def _get_history(
+    kind: str,
+    device: str | None = None,
+    start: int | None = None,
+    end: int | None = None,
+    limit: int = 100
+) -> dict | Response:
+    """查询窗口（window）或应用（app）切换历史，start/end 为 Unix 时间戳"""
+    kinds = {"window": WINDOW, "app": APP}
+    if kind not in kinds:
+        raise HTTPException(status_code=404, detail="Not Found")
+    history = await query_activity(kinds[kind], start, end, max(1, min(limit, 1000)), _find_device(device).key)
+    if not history:
+        return Response(status_code=204)
+    return {
+        "history": [
+            {"title": title, "switch_time": switch_time}
+            for title, switch_time in history
+        ]
+    }
 
 @app.post("/phone_webhook", dependencies=[Depends(verify_token)])
-async def _push_phone_now_app(request: PhoneWebhook) -> Response:
+async def _push_phone_now_app(request: PhoneWebhook, device: str | None = None) -> Response:
     """接收手机应用变化"""
 
     socketio_log.debug(f"Received phone json: \n{request.model_dump(mode='json')}")
+    try:
+        target = await get_device(device)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    event = request.model_dump()
+    event["time"] = int(time.time())
+    await state.publish({"op": "app", "device": target.name, "events": [event]})
+    socketio_log.debug(f"Received phone now app from client: {target.phone_app}")
+    return Response(status_code=200)
 
-    if not now_app_list or request.name != now_app_list[-1][0]:
-        now_app_list.append((request.name, int(time.time())))
-        if len(now_app_list) > config.max_window:
-            now_app_list.popleft()
-
-    if request.status == "屏幕关闭":
-        phone_now_app["name"] = "手机已熄屏"
-
-    if request.power_status == "打开":
-        phone_now_app["power_status"] = itr.telegram.battery_charging_charge
-    else:
-        phone_now_app["power_status"] = itr.telegram.battery_charging_not
+@app.post("/phone_webhook/batch", dependencies=[Depends(verify_token)])
+async def _push_phone_events(events: list[PhoneEvent], device: str | None = None) -> dict:
+    """
+    批量接收手机缓存的应用变化，使用手机记录的时间
+    按时间排序并去掉重复上报的事件，早于已应用的最新事件的视为重放并跳过，整批只发送一次
+    时间超出保留时长的事件视为时钟错误并拒绝
+    """
+    if len(events) > max_phone_batch:
+        raise HTTPException(status_code=413, detail=f"At most {max_phone_batch} events per batch")
+    try:
+        target = await get_device(device)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    now = int(time.time())
+    oldest = now - max_phone_event_age
+    last = target.phone_app.get("switch_app_time", 0)
+    batch: list[dict] = []
+    seen: set[tuple] = set()
+    duplicates = stale = rejected = 0
+    for event in sorted((event.model_dump() for event in events), key=lambda event: min(event["time"], now)):
+        # 手机时钟超前时按服务器时间记录
+        event["time"] = min(event["time"], now)
+        if event["time"] < oldest:
+            rejected += 1
+            continue
+        key = tuple(event.values())
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        if event["time"] < last:
+            stale += 1
+            continue
+        batch.append(event)
+
+    if batch:
+        await state.publish({"op": "app", "device": target.name, "events": batch})
+    socketio_log.debug(f"Received {len(events)} phone events for {target.name}: {len(batch)} applied, {duplicates} duplicates, {stale} stale, {rejected} rejected")
+    return {"accepted": len(batch), "duplicates": duplicates, "stale": stale, "rejected": rejected}
+
+async def _apply_app(device: Device, op: dict) -> None:
+    """按时间顺序应用一批手机事件，整批只更新一次快照并发送一次"""
+    now_app_list = device.app_list
+    phone_now_app = device.phone_app
+
+    appended = 0
+    evicted = False
+    for event in op["events"]:
+        now = event["time"]
+        if not now_app_list or event["name"] != now_app_list[-1][0]:
+            now_app_list.append((event["name"], now))
+            appended += 1
+            if len(now_app_list) > config.max_window:
+                now_app_list.popleft()
+                evicted = True
+            if state.is_leader:
+                record_activity(APP, event["name"], now, device.key)
+
+        phone_now_app.update({key: event[key] for key in PhoneWebhook.model_fields})
+        if event["status"] == "屏幕关闭":
+            phone_now_app["name"] = "手机已熄屏"
+            if state.is_leader:
+                close_usage(APP, now, device.key)
+        elif state.is_leader:
+            switch_usage(APP, event["name"], now, device.key)
+
+        if event["power_status"] == "打开":
+            phone_now_app["power_status"] = itr.telegram.battery_charging_charge
+        else:
+            phone_now_app["power_status"] = itr.telegram.battery_charging_not
+        phone_now_app["switch_app_time"] = now
 
-    phone_now_app["switch_app_time"] = int(time.time())
     phone_now_app["app_list"] = list(now_app_list)
+    device.app_snapshot.bump()
+
+    await emit_phone_app(device, appended, evicted)
 
-    await emit_phone_app(True)
-    socketio_log.debug(f"Received phone now app from client: {phone_now_app}")
-    return Response(status_code=200)
-    
 
-async def get_now_window() -> list[tuple[str, int]]:
-    return list(now_window_list)
+async def get_now_window(device: str | None = None) -> list[tuple[str, int]]:
+    found = find_device(device)
+    return list(found.window_list) if found else []
 
-def get_client_sid() -> str:
-    return client_sid
+def get_client_sid(device: str | None = None) -> str:
+    found = find_device(device)
+    return found.client_sid if found else ""
 
-async def get_phone_now_app() -> dict[str, str | int | list[tuple[str, int]]]:
-    return phone_now_app
\ No newline at end of file
+async def get_phone_now_app(device: str | None = None) -> dict[str, str | int | list[tuple[str, int]]]:
+    found = find_device(device)
+    return found.phone_app if found else {}
@@ -1,10 +1,16 @@
+import asyncio
+import time
 import aiosqlite
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from telegram_monitoring.src.log import sql_log
 from telegram_monitoring.src.i18n import itr
+from telegram_monitoring.src.metrics import Gauge, db_seconds, instrument
 
 __all__ = [
     "get_user_db",
     "get_all_user_db",
+    "get_user_changes_db",
     "add_user_db",
     "update_user_db",
     "del_user_db",
@@ -16,73 +22,364 @@ __all__ = [
     "list_ban_user_db",
     "del_allow_user_db",
     "del_ban_user_db",
+    "page_user_db",
+    "page_allow_user_db",
+    "page_ban_user_db",
+    "add_allow_users_db",
+    "del_allow_users_db",
+    "add_ban_users_db",
+    "del_ban_users_db",
+    "pool_stats_db",
+    "idle_time_db",
+    "in_transaction_db",
+    "maintenance_con",
+    "savepoint",
 ]
 
 db_file = "data.db"
+# 唯一的写连接，所有写操作都经过它
 _con: aiosqlite.Connection | None = None
 
+# 只读连接池，每个连接各自一个后台线程，WAL 模式下读不会被写阻塞
+read_pool_size = 4
+_readers: list[aiosqlite.Connection] = []
+_reader_busy: list[int] = []
+_pool_stats: dict[str, int] = {"reads": 0, "writes": 0}
+# 最近一次取用写连接的时间，用于判断数据库是否空闲
+_last_write: float = time.monotonic()
+# 维护连接等待写锁的秒数
+maintenance_timeout = 30.0
+
+# 用户、允许用户、封禁用户的内存缓存，init_db 时加载，写操作成功后同步更新
+# 鉴权等热路径直接查缓存，不访问数据库
+_users: dict[int, tuple[str | None, str]] = {}
+_allow_users: set[int] = set()
+_ban_users: set[int] = set()
+
+# 用户资料更新的写后队列，同一用户只保留最后一次，按时间间隔或数量阈值合并为一个事务提交
+flush_interval = 1.0
+flush_size = 100
+_pending_updates: dict[int, tuple[str | None, str]] = {}
+_flush_task: asyncio.Task | None = None
+_flush_lock = asyncio.Lock()
+
 async def get_con() -> aiosqlite.Connection:
-    global _con
+    """获取写连接"""
+    global _con, _last_write
     if _con is None:
         _con = await aiosqlite.connect(db_file)
+        # 只对新建的库立即生效，旧库由 maintenance.py 在空闲时 VACUUM 转换
+        await _con.execute("PRAGMA auto_vacuum=INCREMENTAL")
         await _con.execute("PRAGMA journal_mode=WAL")
         await _con.execute("PRAGMA synchronous=NORMAL")
         sql_log.info(itr.sqlite.connected)
+    _pool_stats["writes"] += 1
+    _last_write = time.monotonic()
     return _con
 
+async def open_readers() -> None:
+    """打开只读连接池，需要在建表之后调用"""
+    while len(_readers) < read_pool_size:
+        reader = await aiosqlite.connect(f"file:{db_file}?mode=ro", uri=True)
+        _readers.append(reader)
+        _reader_busy.append(0)
+
+@asynccontextmanager
+async def read_con() -> AsyncIterator[aiosqlite.Connection]:
+    """借用当前最空闲的只读连接，连接池未打开时退回写连接"""
+    if not _readers:
+        yield await get_con()
+        return
+    index = min(range(len(_readers)), key=_reader_busy.__getitem__)
+    _reader_busy[index] += 1
+    _pool_stats["reads"] += 1
+    try:
+        yield _readers[index]
+    finally:
+        _reader_busy[index] -= 1
+
+def pool_stats_db() -> dict[str, int | list[int]]:
+    """连接池统计：读写次数以及每个只读连接正在执行的查询数"""
+    return {
+        "readers": len(_readers),
+        "reads": _pool_stats["reads"],
+        "writes": _pool_stats["writes"],
+        "in_flight": list(_reader_busy),
+    }
+
+def _pool_acquired() -> dict[tuple[str, ...], float]:
+    return {("read",): _pool_stats["reads"], ("write",): _pool_stats["writes"]}
+
+def _pool_in_flight() -> dict[tuple[str, ...], float]:
+    return {(str(index),): busy for index, busy in enumerate(_reader_busy)}
+
+Gauge("db_pool_readers", "Open read-only connections", lambda: {(): len(_readers)})
+Gauge("db_pool_acquired", "Times a connection was taken from the pool since start", _pool_acquired, ("type",))
+Gauge("db_pool_in_flight", "Queries running on each read-only connection", _pool_in_flight, ("reader",))
+
+def idle_time_db() -> float:
+    """距离最近一次取用写连接经过的秒数"""
+    return time.monotonic() - _last_write
+
+def in_transaction_db() -> bool:
+    """写连接上是否有未提交的写入，不计为一次取用"""
+    return _con is not None and _con.in_transaction
+
+@asynccontextmanager
+async def maintenance_con() -> AsyncIterator[aiosqlite.Connection]:
+    """
+    单独打开的维护连接，用完即关闭
+    VACUUM 等耗时操作在它自己的线程中执行，不会让写连接上排队的写入等待
+    """
+    con = await aiosqlite.connect(db_file, timeout=maintenance_timeout)
+    try:
+        yield con
+    finally:
+        await con.close()
+
+@asynccontextmanager
+async def savepoint(con: aiosqlite.Connection, name: str) -> AsyncIterator[None]:
+    """
+    在写连接上开启保存点，出错时只撤销保存点之后的写入
+    写连接是共享的，整体回滚会把其他协程尚未提交的写入一起丢弃
+    """
+    await con.execute(f"SAVEPOINT {name}")
+    try:
+        yield
+    except Exception:
+        await con.execute(f"ROLLBACK TO {name}")
+        await con.execute(f"RELEASE {name}")
+        raise
+    await con.execute(f"RELEASE {name}")
+
+# 数据库结构迁移，第 n 个脚本执行完后 PRAGMA user_version 即为 n
+# 旧版本的 data.db 没有设置 user_version（为 0），会从第一个脚本开始依次升级
+migrations: list[str] = [
+    # 1: 初始结构
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER UNIQUE NOT NULL,
+        username TEXT,
+        full_name TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS allow_users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER UNIQUE NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS ban_users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER UNIQUE NOT NULL
+    );
+    """,
+    # 2: 去掉自增 id，直接以 user_id 为主键
+    # users 的 user_id 成为 rowid 别名，列表联表时按主键一次查找即可取到 username/full_name
+    # allow_users/ban_users 只有 user_id 一列，使用 WITHOUT ROWID，主键索引即整张表
+    """
+    CREATE TABLE users_v2 (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        full_name TEXT NOT NULL
+    );
+    INSERT INTO users_v2 (user_id, username, full_name) SELECT user_id, username, full_name FROM users;
+    DROP TABLE users;
+    ALTER TABLE users_v2 RENAME TO users;
+
+    CREATE TABLE allow_users_v2 (
+        user_id INTEGER PRIMARY KEY NOT NULL
+    ) WITHOUT ROWID;
+    INSERT INTO allow_users_v2 (user_id) SELECT user_id FROM allow_users;
+    DROP TABLE allow_users;
+    ALTER TABLE allow_users_v2 RENAME TO allow_users;
+
+    CREATE TABLE ban_users_v2 (
+        user_id INTEGER PRIMARY KEY NOT NULL
+    ) WITHOUT ROWID;
+    INSERT INTO ban_users_v2 (user_id) SELECT user_id FROM ban_users;
+    DROP TABLE ban_users;
+    ALTER TABLE ban_users_v2 RENAME TO ban_users;
+    """,
+    # 3: 用户表变更版本号，用于客户端增量同步用户列表
+    # 每次插入/修改/删除用户时 users_sync.version 加一，并记录到对应行或 users_deleted 中
+    """
+    ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+    CREATE INDEX users_version ON users (version);
+
+    CREATE TABLE users_sync (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT INTO users_sync (id, version) VALUES (1, 0);
+
+    CREATE TABLE users_deleted (
+        user_id INTEGER PRIMARY KEY NOT NULL,
+        version INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX users_deleted_version ON users_deleted (version);
+
+    CREATE TRIGGER users_insert_version AFTER INSERT ON users BEGIN
+        UPDATE users_sync SET version = version + 1;
+        UPDATE users SET version = (SELECT version FROM users_sync) WHERE user_id = NEW.user_id;
+        DELETE FROM users_deleted WHERE user_id = NEW.user_id;
+    END;
+    CREATE TRIGGER users_update_version AFTER UPDATE OF username, full_name ON users BEGIN
+        UPDATE users_sync SET version = version + 1;
+        UPDATE users SET version = (SELECT version FROM users_sync) WHERE user_id = NEW.user_id;
+    END;
+    CREATE TRIGGER users_delete_version AFTER DELETE ON users BEGIN
+        UPDATE users_sync SET version = version + 1;
+        INSERT OR REPLACE INTO users_deleted (user_id, version)
+        VALUES (OLD.user_id, (SELECT version FROM users_sync));
+    END;
+    """,
+    # 4: 窗口/应用切换历史，标题存入字典表，记录按批打包为增量编码的数据块，见 activity.py
+    """
+    CREATE TABLE activity_titles (
+        id INTEGER PRIMARY KEY,
+        title TEXT UNIQUE NOT NULL
+    );
+    CREATE TABLE activity_blocks (
+        id INTEGER PRIMARY KEY,
+        kind INTEGER NOT NULL,
+        start_time INTEGER NOT NULL,
+        end_time INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        data BLOB NOT NULL
+    );
+    CREATE INDEX activity_blocks_time ON activity_blocks (kind, end_time, start_time);
+    """,
+    # 5: 按小时/天汇总的窗口/应用使用时长，见 rollup.py
+    """
+    CREATE TABLE usage_rollup (
+        kind INTEGER NOT NULL,
+        granularity INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        title_id INTEGER NOT NULL,
+        seconds INTEGER NOT NULL,
+        PRIMARY KEY (kind, granularity, bucket, title_id)
+    ) WITHOUT ROWID;
+    """,
+    # 6: 多设备，历史记录和使用时长按设备区分，已有数据归入 id 为 0 的默认设备，见 devices.py
+    """
+    CREATE TABLE devices (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    );
+    INSERT INTO devices (id, name) VALUES (0, 'default');
+
+    ALTER TABLE activity_blocks ADD COLUMN device INTEGER NOT NULL DEFAULT 0;
+    DROP INDEX activity_blocks_time;
+    CREATE INDEX activity_blocks_time ON activity_blocks (device, kind, end_time, start_time);
+
+    CREATE TABLE usage_rollup_v2 (
+        device INTEGER NOT NULL,
+        kind INTEGER NOT NULL,
+        granularity INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        title_id INTEGER NOT NULL,
+        seconds INTEGER NOT NULL,
+        PRIMARY KEY (device, kind, granularity, bucket, title_id)
+    ) WITHOUT ROWID;
+    INSERT INTO usage_rollup_v2 (device, kind, granularity, bucket, title_id, seconds)
+    SELECT 0, kind, granularity, bucket, title_id, seconds FROM usage_rollup;
+    DROP TABLE usage_rollup;
+    ALTER TABLE usage_rollup_v2 RENAME TO usage_rollup;
+    """,
+]
+
+async def migrate_db(con: aiosqlite.Connection) -> None:
+    """按 PRAGMA user_version 依次执行未执行过的迁移脚本，每个脚本在一个事务中完成"""
+    cur = await con.execute("PRAGMA user_version")
+    row = await cur.fetchone()
+    version: int = row[0] if row else 0
+    for target in range(version + 1, len(migrations) + 1):
+        try:
+            await con.executescript(
+                f"BEGIN;\n{migrations[target - 1]}\nPRAGMA user_version = {target};\nCOMMIT;"
+            )
+        except Exception:
+            await con.rollback()
+            raise
+        sql_log.info(itr.sqlite.migrated.format(version=target))
+
+@instrument(db_seconds)
 async def init_db() -> None:
     con = await get_con()
-    await con.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE NOT NULL,
-            username TEXT,
-            full_name TEXT NOT NULL
-        )
-        """
-    )
-    await con.execute(
-        """
-        CREATE TABLE IF NOT EXISTS allow_users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE NOT NULL
-        )
-        """
-    )
-    await con.execute(
-        """
-        CREATE TABLE IF NOT EXISTS ban_users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE NOT NULL
-        )
-        """
-    )
-    await con.commit()
+    await migrate_db(con)
+    await load_cache()
+    await open_readers()
     return
 
-async def get_user_db(user_id: int) -> tuple[int, str, str] | None:
+@instrument(db_seconds)
+async def load_cache() -> None:
+    """从数据库加载用户缓存"""
     con = await get_con()
-    cur = await con.execute(
-        """
-        SELECT user_id, username, full_name FROM users WHERE user_id = :user_id
-        """,
-        {"user_id": user_id}
-    )
-    row = await cur.fetchone()
-    if row is None:
+    cur = await con.execute("SELECT user_id, username, full_name FROM users")
+    users = {user_id: (username, full_name) for user_id, username, full_name in await cur.fetchall()}
+    cur = await con.execute("SELECT user_id FROM allow_users")
+    allow_users = {row[0] for row in await cur.fetchall()}
+    cur = await con.execute("SELECT user_id FROM ban_users")
+    ban_users = {row[0] for row in await cur.fetchall()}
+    _users.clear()
+    _users.update(users)
+    _allow_users.clear()
+    _allow_users.update(allow_users)
+    _ban_users.clear()
+    _ban_users.update(ban_users)
+    sql_log.debug(f"Loaded {len(_users)} users, {len(_allow_users)} allowed users, {len(_ban_users)} banned users into cache")
+
+async def get_user_db(user_id: int) -> tuple[int, str, str] | None:
+    user = _users.get(user_id)
+    if user is None:
         return None
-    return row[0], row[1], row[2]
+    return user_id, user[0], user[1]  # type: ignore
 
+@instrument(db_seconds)
 async def get_all_user_db() -> list[tuple[int, str, str]]:
-    con = await get_con()
-    cur = await con.execute(
-        """
-        SELECT user_id, username, full_name FROM users
-        """
-    )
-    return await cur.fetchall()  # type: ignore
+    async with read_con() as con:
+        cur = await con.execute(
+            """
+            SELECT user_id, username, full_name FROM users
+            """
+        )
+        return await cur.fetchall()  # type: ignore
+
+@instrument(db_seconds)
+async def get_user_changes_db(since: int) -> tuple[int, bool, list[tuple[int, str, str]], list[int]]:
+    """
+    返回版本号 since 之后的用户变更 (当前版本, 是否为全量, 新增或修改的用户, 删除的用户 ID)
+    since 为 0 或大于当前版本（数据库被替换过）时返回全量
+    """
+    async with read_con() as con:
+        cur = await con.execute("SELECT version FROM users_sync")
+        row = await cur.fetchone()
+        version: int = row[0] if row else 0
+        if since <= 0 or since > version:
+            cur = await con.execute("SELECT user_id, username, full_name FROM users")
+            return version, True, await cur.fetchall(), []  # type: ignore
+        if since == version:
+            return version, False, [], []
+        # 只取到读取版本号时为止的变更，之后的变更留给下一次同步
+        params = {"since": since, "version": version}
+        cur = await con.execute(
+            """
+            SELECT user_id, username, full_name FROM users
+            WHERE version > :since AND version <= :version
+            """,
+            params
+        )
+        upserts: list[tuple[int, str, str]] = await cur.fetchall()  # type: ignore
+        cur = await con.execute(
+            """
+            SELECT user_id FROM users_deleted
+            WHERE version > :since AND version <= :version
+            """,
+            params
+        )
+        deletes = [row[0] for row in await cur.fetchall()]
+    return version, False, upserts, deletes
 
+@instrument(db_seconds)
 async def add_user_db(user_id: int, username: str | None, full_name: str) -> bool:
     con = await get_con()
     users = await get_user_db(user_id)
@@ -96,28 +393,58 @@ async def add_user_db(user_id: int, username: str | None, full_name: str) -> boo
         {"user_id": user_id, "username": username, "full_name": full_name}
     )
     await con.commit()
+    _users[user_id] = (username, full_name)
     sql_log.info(itr.sqlite.add_user.format(user=user_id))
     return True
 
 async def update_user_db(user_id: int, username: str | None, full_name: str) -> None:
-    con = await get_con()
-    users = await get_user_db(user_id)
-    if users is None:
+    global _flush_task
+    user = _users.get(user_id)
+    if user is None or user == (username, full_name):
         return
-    else:
-        _, old_username, old_full_name = users
-        if username == old_username and full_name == old_full_name:
+    _users[user_id] = (username, full_name)
+    _pending_updates[user_id] = (username, full_name)
+    if len(_pending_updates) >= flush_size:
+        await flush_user_updates()
+    elif _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_delayed_flush())
+    return
+
+async def _delayed_flush() -> None:
+    await asyncio.sleep(flush_interval)
+    # 关闭连接时任务会被取消，已开始的写入不能被打断
+    await asyncio.shield(flush_user_updates())
+
+@instrument(db_seconds)
+async def flush_user_updates() -> None:
+    """将积压的用户资料更新在一个事务中写入数据库"""
+    async with _flush_lock:
+        if not _pending_updates:
             return
-    await con.execute(
-        """
-        UPDATE users SET username = :username, full_name = :full_name WHERE user_id = :user_id
-        """,
-        {"user_id": user_id, "username": username, "full_name": full_name}
-    )
-    await con.commit()
-    sql_log.info(itr.sqlite.update_user.format(user=user_id))
+        pending = dict(_pending_updates)
+        _pending_updates.clear()
+        batch = [
+            {"user_id": user_id, "username": username, "full_name": full_name}
+            for user_id, (username, full_name) in pending.items()
+        ]
+        con = await get_con()
+        try:
+            await con.executemany(
+                """
+                UPDATE users SET username = :username, full_name = :full_name WHERE user_id = :user_id
+                """,
+                batch
+            )
+            await con.commit()
+        except Exception:
+            # 放回队列下次再写，写入期间又有更新的用户保留新的资料
+            for user_id, profile in pending.items():
+                _pending_updates.setdefault(user_id, profile)
+            raise
+    sql_log.info(itr.sqlite.update_user.format(user=", ".join(str(row["user_id"]) for row in batch)))
     return
 
+@instrument(db_seconds)
 async def del_user_db(user_id: int) -> None:
     con = await get_con()
     await con.execute(
@@ -127,22 +454,15 @@ async def del_user_db(user_id: int) -> None:
         {"user_id": user_id}
     )
     await con.commit()
+    _users.pop(user_id, None)
+    _pending_updates.pop(user_id, None)
     sql_log.info(itr.sqlite.del_user.format(user=user_id))
     return
 
 async def check_allow_user_db(user_id: int) -> bool:
-    con = await get_con()
-    cur = await con.execute(
-        """
-        SELECT user_id FROM allow_users WHERE user_id = :user_id
-        """,
-        {"user_id": user_id}
-    )
-    row = await cur.fetchone()
-    if row is None:
-        return False
-    return True
+    return user_id in _allow_users
 
+@instrument(db_seconds)
 async def add_allow_user_db(user_id: int) -> bool:
     con = await get_con()
     users = await get_user_db(user_id)
@@ -156,22 +476,14 @@ async def add_allow_user_db(user_id: int) -> bool:
         {"user_id": user_id}
     )
     await con.commit()
+    _allow_users.add(user_id)
     sql_log.info(itr.sqlite.add_allow_user.format(user=user_id))
     return True
 
 async def check_ban_user_db(user_id: int) -> bool:
-    con = await get_con()
-    cur = await con.execute(
-        """
-        SELECT user_id FROM ban_users WHERE user_id = :user_id
-        """,
-        {"user_id": user_id}
-    )
-    row = await cur.fetchone()
-    if row is None:
-        return False
-    return True
+    return user_id in _ban_users
 
+@instrument(db_seconds)
 async def add_ban_user_db(user_id: int) -> bool:
     con = await get_con()
     users = await get_user_db(user_id)
@@ -185,30 +497,98 @@ async def add_ban_user_db(user_id: int) -> bool:
         {"user_id": user_id}
     )
     await con.commit()
+    _ban_users.add(user_id)
     sql_log.info(itr.sqlite.add_ban_user.format(user=user_id))
     return True
 
+@instrument(db_seconds)
 async def list_allow_user_db() -> list[tuple[int, str, str]]:
-    con = await get_con()
-    cur = await con.execute(
+    async with read_con() as con:
+        cur = await con.execute(
+            """
+            SELECT allow_users.user_id, users.username, users.full_name FROM allow_users
+            INNER JOIN users ON allow_users.user_id = users.user_id
+            """
+        ) # ON 的作用是将 allow_users 表和 users 表连接起来，根据 user_id 进行匹配
+        # 等于 SELECT allow_users.user_id, users.username, users.full_name FROM allow_users, users WHERE allow_users.user_id = users.user_id
+        return await cur.fetchall()  # type: ignore
+
+@instrument(db_seconds)
+async def list_ban_user_db() -> list[tuple[int, str, str]]:
+    async with read_con() as con:
+        cur = await con.execute(
+            """
+            SELECT ban_users.user_id, users.username, users.full_name FROM ban_users
+            INNER JOIN users ON ban_users.user_id = users.user_id
+            """
+        )
+        return await cur.fetchall()  # type: ignore
+
+async def _page_db(
+    base_sql: str,
+    key: str,
+    cursor: int | None,
+    backward: bool,
+    limit: int
+) -> tuple[list[tuple[int, str, str]], bool, bool]:
+    """
+    按 user_id 键集分页，每次只查询一页
+    cursor 为当前页边界的 user_id，向后翻页取大于它的行，向前翻页取小于它的行
+    返回 (本页数据, 是否有上一页, 是否有下一页)
+    """
+    params: dict[str, int] = {"limit": limit + 1}
+    if cursor is None:
+        where = ""
+    else:
+        where = f"WHERE {key} {'<' if backward else '>'} :cursor"
+        params["cursor"] = cursor
+    async with read_con() as con:
+        cur = await con.execute(
+            f"{base_sql} {where} ORDER BY {key} {'DESC' if backward else 'ASC'} LIMIT :limit",
+            params
+        )
+        rows: list[tuple[int, str, str]] = await cur.fetchall()  # type: ignore
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+        return rows, more, True
+    return rows, cursor is not None, more
+
+@instrument(db_seconds)
+async def page_user_db(
+    cursor: int | None = None, backward: bool = False, limit: int = 20
+) -> tuple[list[tuple[int, str, str]], bool, bool]:
+    return await _page_db(
+        "SELECT user_id, username, full_name FROM users",
+        "user_id", cursor, backward, limit
+    )
+
+@instrument(db_seconds)
+async def page_allow_user_db(
+    cursor: int | None = None, backward: bool = False, limit: int = 20
+) -> tuple[list[tuple[int, str, str]], bool, bool]:
+    return await _page_db(
         """
         SELECT allow_users.user_id, users.username, users.full_name FROM allow_users
         INNER JOIN users ON allow_users.user_id = users.user_id
-        """
-    ) # ON 的作用是将 allow_users 表和 users 表连接起来，根据 user_id 进行匹配
-    # 等于 SELECT allow_users.user_id, users.username, users.full_name FROM allow_users, users WHERE allow_users.user_id = users.user_id
-    return await cur.fetchall()  # type: ignore
+        """,
+        "allow_users.user_id", cursor, backward, limit
+    )
 
-async def list_ban_user_db() -> list[tuple[int, str, str]]:
-    con = await get_con()
-    cur = await con.execute(
+@instrument(db_seconds)
+async def page_ban_user_db(
+    cursor: int | None = None, backward: bool = False, limit: int = 20
+) -> tuple[list[tuple[int, str, str]], bool, bool]:
+    return await _page_db(
         """
         SELECT ban_users.user_id, users.username, users.full_name FROM ban_users
         INNER JOIN users ON ban_users.user_id = users.user_id
-        """
+        """,
+        "ban_users.user_id", cursor, backward, limit
     )
-    return await cur.fetchall()  # type: ignore
 
+@instrument(db_seconds)
 async def del_allow_user_db(user_id: int) -> bool:
     con = await get_con()
     users = await get_user_db(user_id)
@@ -221,9 +601,11 @@ async def del_allow_user_db(user_id: int) -> bool:
         {"user_id": user_id}
     )
     await con.commit()
+    _allow_users.discard(user_id)
     sql_log.info(itr.sqlite.del_allow_user.format(user=user_id))
     return True
 
+@instrument(db_seconds)
 async def del_ban_user_db(user_id: int) -> bool:
     con = await get_con()
     users = await get_user_db(user_id)
@@ -236,12 +618,75 @@ async def del_ban_user_db(user_id: int) -> bool:
         {"user_id": user_id}
     )
     await con.commit()
+    _ban_users.discard(user_id)
     sql_log.info(itr.sqlite.del_ban_user.format(user=user_id))
     return True
 
+async def _bulk_apply_db(
+    user_ids: list[int],
+    table: str,
+    cache: set[int],
+    add: bool,
+    log_msg: str
+) -> tuple[list[int], list[int], list[int]]:
+    """
+    批量添加/移除 allow_users 或 ban_users，在一个事务中完成
+    返回 (已应用, 已是目标状态而跳过, 未注册)
+    """
+    applied: list[int] = []
+    skipped: list[int] = []
+    missing: list[int] = []
+    # 注册状态由写穿缓存维护，校验无需查询数据库
+    for user_id in dict.fromkeys(user_ids):
+        if user_id not in _users:
+            missing.append(user_id)
+        elif (user_id in cache) == add:
+            skipped.append(user_id)
+        else:
+            applied.append(user_id)
+    if not applied:
+        return applied, skipped, missing
+    con = await get_con()
+    if add:
+        sql = f"INSERT OR IGNORE INTO {table} (user_id) VALUES (:user_id)"
+    else:
+        sql = f"DELETE FROM {table} WHERE user_id = :user_id"
+    await con.executemany(sql, [{"user_id": user_id} for user_id in applied])
+    await con.commit()
+    if add:
+        cache.update(applied)
+    else:
+        cache.difference_update(applied)
+    sql_log.info(log_msg.format(user=", ".join(map(str, applied))))
+    return applied, skipped, missing
+
+@instrument(db_seconds)
+async def add_allow_users_db(user_ids: list[int]) -> tuple[list[int], list[int], list[int]]:
+    return await _bulk_apply_db(user_ids, "allow_users", _allow_users, True, itr.sqlite.add_allow_user)
+
+@instrument(db_seconds)
+async def del_allow_users_db(user_ids: list[int]) -> tuple[list[int], list[int], list[int]]:
+    return await _bulk_apply_db(user_ids, "allow_users", _allow_users, False, itr.sqlite.del_allow_user)
+
+@instrument(db_seconds)
+async def add_ban_users_db(user_ids: list[int]) -> tuple[list[int], list[int], list[int]]:
+    return await _bulk_apply_db(user_ids, "ban_users", _ban_users, True, itr.sqlite.add_ban_user)
+
+@instrument(db_seconds)
+async def del_ban_users_db(user_ids: list[int]) -> tuple[list[int], list[int], list[int]]:
+    return await _bulk_apply_db(user_ids, "ban_users", _ban_users, False, itr.sqlite.del_ban_user)
+
 async def close_con():
-    global _con
+    global _con, _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    for reader in _readers:
+        await reader.close()
+    _readers.clear()
+    _reader_busy.clear()
     if _con is not None:
+        await flush_user_updates()
         await _con.close()
         _con = None
         sql_log.info(itr.sqlite.close)
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import time
+from fastapi import Response
+
+__all__ = [
+    "Snapshot",
+    "Subscriber",
+    "Broadcaster",
+]
+
+class Snapshot:
+    """
+    HTTP 接口返回的 JSON 快照，状态变化时调用 bump 使版本加一
+    每个版本只在第一次被请求时序列化一次，之后直接返回缓存的字节和 ETag
+    """
+
+    # 进程启动时间作为 ETag 前缀，重启后旧的 ETag 不会误命中
+    _epoch = f"{time.time_ns():x}"
+
+    def __init__(self, build, tag: str = "") -> None:
+        self._build = build
+        # 区分不同快照的 ETag，例如不同设备的同一版本号
+        self._tag = tag
+        self.version = 0
+        self._body: bytes | None = None
+        self._etag = ""
+
+    def bump(self) -> None:
+        self.version += 1
+        self._body = None
+
+    def get(self) -> tuple[bytes, str]:
+        """返回 (JSON 字节, ETag)，没有数据时字节为空"""
+        if self._body is None:
+            data = self._build()
+            self._body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8") if data else b""
+            self._etag = f'"{self._epoch}-{self._tag}-{self.version}"'
+        return self._body, self._etag
+
+    def response(self, if_none_match: str | None) -> Response:
+        body, etag = self.get()
+        if not body:
+            return Response(status_code=204)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if if_none_match and (if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+class Subscriber:
+    """
+    一个订阅者的待发送队列，每种事件只保留最新的一条
+    订阅者处理得慢时中间的变化会被合并，占用的内存不随积压增长
+    """
+
+    __slots__ = ("pending", "event")
+
+    def __init__(self) -> None:
+        # 事件类型 -> (版本号, JSON 字节)
+        self.pending: dict[str, tuple[int, bytes]] = {}
+        self.event = asyncio.Event()
+
+    def take(self) -> list[tuple[str, int, bytes]]:
+        """取出所有待发送的事件，按版本号升序"""
+        items = sorted(((kind, version, data) for kind, (version, data) in self.pending.items()), key=lambda item: item[1])
+        self.pending.clear()
+        self.event.clear()
+        return items
+
+class Broadcaster:
+    """
+    状态变化广播，每次 publish 版本号加一
+    publish 是同步的，只更新各订阅者的待发送队列并唤醒它们，不会等待任何订阅者
+    """
+
+    def __init__(self) -> None:
+        self.version = 0
+        self._latest: dict[str, tuple[int, bytes]] = {}
+        self._subscribers: set[Subscriber] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, kind: str, data: bytes) -> int:
+        self.version += 1
+        item = (self.version, data)
+        self._latest[kind] = item
+        for subscriber in self._subscribers:
+            subscriber.pending[kind] = item
+            subscriber.event.set()
+        return self.version
+
+    def since(self, version: int) -> list[tuple[str, int, bytes]]:
+        """
+        返回版本号大于 version 的各类型最新事件
+        version 比当前版本还大时说明服务端重启过，返回全部事件
+        """
+        if version > self.version:
+            version = 0
+        return sorted(
+            ((kind, v, data) for kind, (v, data) in self._latest.items() if v > version),
+            key=lambda item: item[1]
+        )
+
+    def subscribe(self, since: int | None = None) -> Subscriber:
+        """订阅之后的变化；指定 since 时先放入该版本之后的事件"""
+        subscriber = Subscriber()
+        if since is not None:
+            for kind, version, data in self.since(since):
+                subscriber.pending[kind] = (version, data)
+            if subscriber.pending:
+                subscriber.event.set()
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    async def wait(self, since: int, timeout: float) -> list[tuple[str, int, bytes]]:
+        """长轮询：有 since 之后的事件立即返回，否则最多等待 timeout 秒"""
+        subscriber = self.subscribe(since)
+        try:
+            await asyncio.wait_for(subscriber.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.unsubscribe(subscriber)
+        return subscriber.take()
@@ -1,24 +1,29 @@
+import os
+import re
 import time
 from telebot.async_telebot import AsyncTeleBot
 from telebot.util import extract_arguments
 from telebot import types
-from asyncio import sleep
-from collections import deque
+from asyncio import Task, create_task, sleep
 from telegram_markdown_converter import convert_markdown
 import sys
 from telegram_monitoring.src.config import config
 from telegram_monitoring.src.log import telegram_log
-from telegram_monitoring.src.socket_route import sio, get_now_window, get_client_sid, get_phone_now_app
+from telegram_monitoring.src.socket_route import sio, state, get_now_window, get_client_sid, get_phone_now_app
 from telegram_monitoring.src.socket_command import *
 from telegram_monitoring.src.sql import *
 from telegram_monitoring.src.i18n import itr
-
-_times = deque()
-
-patterns: list[str] = []
-with open('prohibited_words.txt', encoding='utf-8') as f:
-    for line in f:
-        patterns.append(line.rstrip('\n'))
+from telegram_monitoring.src.moderation import WordList
+from telegram_monitoring.src.activity import WINDOW, APP, query_activity
+from telegram_monitoring.src.rollup import top_usage, local_day
+from telegram_monitoring.src.backup import backup_db
+from telegram_monitoring.src.devices import find_device, list_devices
+from telegram_monitoring.src.metrics import telegram_handler_seconds, telegram_api_seconds, instrument
+from telegram_monitoring.src.tracing import annotate, span, traced
+
+word_list = WordList('prohibited_words.txt')
+# 等待删除截图的任务，保留引用避免被回收
+_delete_tasks: set[Task] = set()
 
 try:
     bot = AsyncTeleBot(config.telegram.token)
@@ -26,12 +31,18 @@ except Exception:
     telegram_log.error(itr.telegram.token_empty)
     sys.exit(1)
 
+# 统计用到的 Bot API 调用耗时
+for _method in ("get_me", "send_message", "send_photo", "send_document", "edit_message_text", "delete_message", "answer_callback_query"):
+    setattr(bot, _method, instrument(telegram_api_seconds, _method)(getattr(bot, _method)))
+
 commands = [
     types.BotCommand("/start", itr.telegram.command_start),
     types.BotCommand("/ping", itr.telegram.command_ping),
     types.BotCommand("/screenshot", itr.telegram.command_screenshot),
     types.BotCommand("/info", itr.telegram.command_info),
     types.BotCommand("/phone_info", itr.telegram.command_phone_info),
+    types.BotCommand("/devices", itr.telegram.command_devices),
+    types.BotCommand("/stats", itr.telegram.command_stats),
     types.BotCommand("/ban", itr.telegram.command_ban),
     types.BotCommand("/unban", itr.telegram.command_unban),
     types.BotCommand("/add", itr.telegram.command_add),
@@ -39,23 +50,20 @@ commands = [
     types.BotCommand("/allowlist", itr.telegram.command_allowlist),
     types.BotCommand("/banlist", itr.telegram.command_banlist),
     types.BotCommand("/del", itr.telegram.command_del),
+    types.BotCommand("/reload", itr.telegram.command_reload),
+    types.BotCommand("/backup", itr.telegram.command_backup),
     types.BotCommand("/help", itr.telegram.command_help),
 ]
 
-async def flood_message() -> int:
-    """返回4秒内消息数量"""
-    WINDOW = 4.0
-
-    now = time.time()
-    _times.append(now)
+async def flood_message(message) -> int:
+    """返回该用户在当前会话中一个窗口内的消息数量"""
+    return state.flood_hit((message.chat.id, message.from_user.id))
 
-    # 移除过期的时间
-    while _times[0] < now - WINDOW:
-        _times.popleft()
-    
-    # 返回当前时间内的消息数量
-    return len(_times)
+async def users_changed() -> None:
+    """用户表或允许/封禁名单已修改，通知其他进程重新加载用户缓存（电脑客户端可能连接在其他进程）"""
+    await state.publish({"op": "users", "pid": os.getpid()})
 
+@traced()
 async def judge_should_handle(message) -> bool:
     """判断是否应该处理该消息"""
     if message.from_user.is_bot:
@@ -78,6 +86,13 @@ async def judge_should_handle(message) -> bool:
         return False
     return False
 
+def _handler(func, wrapper):
+    """统计命令的处理耗时，每条更新开始一个 trace"""
+    async def handler(message):
+        annotate(chat_id=message.chat.id, user_id=message.from_user.id)
+        return await wrapper(message)
+    return instrument(telegram_handler_seconds, func.__name__, root=True)(handler)
+
 def admin(func):
     """仅允许管理员使用的装饰器"""
     async def wrapper(message):
@@ -89,7 +104,7 @@ def admin(func):
             )
             return
         return await func(message)
-    return wrapper
+    return _handler(func, wrapper)
 
 def user(func):
     """仅允许注册用户使用的装饰器，若用户被拉黑则无法使用，管理员除外"""
@@ -99,13 +114,15 @@ def user(func):
         user_id = message.from_user.id
         if user_id in config.telegram.admins:
             return await func(message)
-        if await check_ban_user_db(user_id):
+        with span("acl"):
+            banned = await check_ban_user_db(user_id)
+            user_name = None if banned else await get_user_db(user_id)
+        if banned:
             await bot.send_message(
                 message.chat.id,
                 itr.telegram.banned_user
             )
             return
-        user_name = await get_user_db(user_id)
         if user_name is None:
             await bot.send_message(
                 message.chat.id,
@@ -113,7 +130,7 @@ def user(func):
             )
             return
         return await func(message)
-    return wrapper
+    return _handler(func, wrapper)
 
 def should_handle(func):
     """判断是否应该处理该消息的装饰器"""
@@ -121,7 +138,84 @@ def should_handle(func):
         if not await judge_should_handle(message):
             return
         return await func(message)
-    return wrapper
+    return _handler(func, wrapper)
+
+# 只由 ID 和分隔符组成的消息
+_id_list = re.compile(r"[\s,，]*\d+(?:[\s,，]+\d+)*[\s,，]*")
+
+def parse_user_ids(message) -> tuple[list[int], list[str]]:
+    """
+    从命令参数中解析用户 ID，支持空格或逗号分隔的多个 ID
+    没有参数且命令回复了一条消息时：转发的 ID 列表（全文只有 ID）取其中所有 ID，
+    其他转发消息取原发送者 ID，普通消息取该消息的发送者 ID；不会与参数合并
+    返回 (用户 ID 列表, 无法解析的参数)
+    """
+    user_ids: list[int] = []
+    invalid: list[str] = []
+    args = extract_arguments(message.text) or ""
+    for arg in re.split(r"[\s,，]+", args):
+        if not arg:
+            continue
+        try:
+            user_ids.append(int(arg))
+        except ValueError:
+            invalid.append(arg)
+    reply = message.reply_to_message
+    if reply is not None and not user_ids and not invalid:
+        if reply.forward_origin is not None:
+            text = reply.text or ""
+            if _id_list.fullmatch(text):
+                user_ids.extend(int(n) for n in re.findall(r"\d+", text))
+            else:
+                sender = getattr(reply.forward_origin, "sender_user", None)
+                if sender is not None:
+                    user_ids.append(sender.id)
+        elif reply.from_user is not None:
+            user_ids.append(reply.from_user.id)
+    return list(dict.fromkeys(user_ids)), invalid
+
+def parse_device(message) -> tuple[str | None, list[str]]:
+    """
+    解析 /命令 [设备] [参数...] 中可选的设备名，第一个参数是已登记的设备名时视为设备
+    返回 (设备名，未指定时为 None, 其余参数)
+    """
+    args = (extract_arguments(message.text) or "").split()
+    if args and find_device(args[0]) is not None:
+        return args[0], args[1:]
+    return None, args
+
+async def unknown_device(message, name: str) -> None:
+    await bot.send_message(message.chat.id, itr.telegram.unknown_device.format(device=name))
+
+async def bulk_user_command(message, func, success_text: str):
+    """批量处理用户 ID 的管理员命令，单个 ID 时保持原有回复"""
+    user_ids, invalid = parse_user_ids(message)
+    if not user_ids:
+        if invalid:
+            await bot.send_message(message.chat.id, itr.telegram.input_user_id_error)
+        else:
+            await bot.send_message(message.chat.id, itr.telegram.input_user_id)
+        return
+    applied, skipped, missing = await func(user_ids)
+    if applied:
+        await users_changed()
+    if len(user_ids) == 1 and not invalid:
+        if missing:
+            await bot.send_message(message.chat.id, itr.telegram.user_no_register.format(user=user_ids[0]))
+            return
+        await bot.send_message(message.chat.id, success_text.format(user=user_ids[0]))
+        return
+    def _fmt(items: list) -> str:
+        return ", ".join(map(str, items)) if items else itr.telegram.empty_list
+    await bot.send_message(
+        message.chat.id,
+        itr.telegram.bulk_result.format(
+            applied=_fmt(applied),
+            skipped=_fmt(skipped),
+            missing=_fmt(missing),
+            invalid=_fmt(invalid),
+        )
+    )
 
 @bot.message_handler(commands=["start"])
 @should_handle # 仅 start、help 命令使用此装饰器
@@ -136,6 +230,7 @@ async def start(message):
             itr.telegram.register_user_already
         )
         return
+    await users_changed()
     await bot.send_message(
         message.chat.id,
         itr.telegram.register_user.format(user=full_name)
@@ -148,18 +243,30 @@ async def help(message):
     help_msg = itr.telegram.help
     await bot.send_message(message.chat.id, help_msg)
 
+# /ping <n> 时最多从历史记录中读取的条数，避免消息超过 Telegram 长度限制
+PING_HISTORY_MAX = 20
+
 @bot.message_handler(commands=["ping"])
 @user
 async def get_window(message):
-    """获取当前客户端信息"""
-    now_window_list = await get_now_window()
-    phone_app = await get_phone_now_app()
+    """获取当前客户端信息，/ping [设备] [n] 从历史记录中读取最近 n 条"""
+    device, args = parse_device(message)
+    if args and not args[0].isdigit():
+        await unknown_device(message, args[0])
+        return
+    now_window_list = await get_now_window(device)
+    phone_app = await get_phone_now_app(device)
     phone_now_app = phone_app["name"] if phone_app else itr.telegram.no_app
     app_list: list[tuple[str, int]] = (
         phone_app["app_list"]
         if phone_app and isinstance(phone_app["app_list"], list) else []
     )
     now_window: str = now_window_list[-1][0] if now_window_list else itr.telegram.no_client
+    if args:
+        count = max(1, min(int(args[0]), PING_HISTORY_MAX))
+        key = find_device(device).key  # type: ignore
+        now_window_list = await query_activity(WINDOW, limit=count, device=key)
+        app_list = await query_activity(APP, limit=count, device=key)
     now_time = int(time.time())
     def _fmt_delta(dt: int) -> str:
         if dt < 60:
@@ -192,12 +299,16 @@ async def screenshot(message):
     if not config.telegram.screenshot.allow:
         await bot.send_message(message.chat.id, itr.telegram.forbidden_screenshot)
         return
-    client_sid = get_client_sid()
+    device, args = parse_device(message)
+    if args:
+        await unknown_device(message, args[0])
+        return
+    client_sid = get_client_sid(device)
     if not client_sid:
         await bot.send_message(message.chat.id, itr.telegram.no_client)
         return
     wait_msg = await bot.send_message(message.chat.id, itr.telegram.wait_screenshot)
-    img_bytes, allow = await client_screenshot(message.from_user.full_name, message.from_user.id)
+    img_bytes, allow = await client_screenshot(message.from_user.full_name, message.from_user.id, device)
     if not allow and not img_bytes:
         await bot.delete_message(message.chat.id, wait_msg.message_id)
         await bot.send_message(message.chat.id, itr.telegram.no_screenshot)
@@ -211,20 +322,34 @@ async def screenshot(message):
     photo = await bot.send_photo(message.chat.id, img_bytes, protect_content=True)
     delete_time = config.telegram.screenshot.delete_time
     if delete_time > 0:
-        await sleep(delete_time)
-        await bot.delete_message(message.chat.id, photo.message_id)
+        # 在后台等待删除，不计入命令处理的耗时和 trace
+        task = create_task(delete_later(message.chat.id, photo.message_id, delete_time))
+        _delete_tasks.add(task)
+        task.add_done_callback(_delete_tasks.discard)
+
+async def delete_later(chat_id: int, message_id: int, delay: float) -> None:
+    """delay 秒后删除消息"""
+    await sleep(delay)
+    try:
+        await bot.delete_message(chat_id, message_id)
+    except Exception as e:
+        telegram_log.error(f"Failed to delete message {message_id} in chat {chat_id}: {e}")
 
 @bot.message_handler(commands=["info"])
 @user
 async def hard_info(message):
     """获取客户端硬件信息"""
     counter: int = 0
-    client_sid = get_client_sid()
+    device, args = parse_device(message)
+    if args:
+        await unknown_device(message, args[0])
+        return
+    client_sid = get_client_sid(device)
     if not client_sid:
         await bot.send_message(message.chat.id, itr.telegram.no_client)
         return
 
-    hard_info = await client_get_hard_info()
+    hard_info = await client_get_hard_info(device)
     if not hard_info:
         await bot.send_message(message.chat.id, itr.telegram.client_timeout)
         return
@@ -280,7 +405,11 @@ async def hard_info(message):
 @user
 async def phone_info(message):
     """获取手机信息"""
-    phone_now_app = await get_phone_now_app()
+    device, args = parse_device(message)
+    if args:
+        await unknown_device(message, args[0])
+        return
+    phone_now_app = await get_phone_now_app(device)
     if not phone_now_app:
         await bot.send_message(message.chat.id, itr.telegram.no_app)
         return
@@ -294,37 +423,77 @@ async def phone_info(message):
     )
     await bot.send_message(message.chat.id, final_msg)
 
+@bot.message_handler(commands=["devices"])
+@user
+async def devices(message):
+    """列出已登记的设备及其当前窗口/应用"""
+    final_msg = itr.telegram.devices_msg
+    for device in list_devices():
+        final_msg = "".join([
+            final_msg,
+            itr.telegram.device_status.format(
+                name=device.name,
+                window=device.window_list[-1][0] if device.client_sid and device.window_list else itr.telegram.no_client,
+                app=device.phone_app.get("name") or itr.telegram.no_app,
+            )
+        ])
+    await bot.send_message(message.chat.id, final_msg)
+
+@bot.message_handler(commands=["stats"])
+@user
+async def usage_stats(message):
+    """查看窗口/应用使用时长排行，/stats [设备] [today|24h|week|month]"""
+    now = int(time.time())
+    today = local_day(now)
+    periods = {
+        "today": today,
+        "24h": now - 86400,
+        "week": local_day(today - 6 * 86400 + 43200),
+        "month": local_day(today - 29 * 86400 + 43200),
+    }
+    device, args = parse_device(message)
+    period = (args[0] if args else "today").lower()
+    if period not in periods or len(args) > 1:
+        await bot.send_message(message.chat.id, itr.telegram.stats_usage)
+        return
+    start = periods[period]
+    def _fmt_duration(seconds: int) -> str:
+        hours, rem = divmod(seconds, 3600)
+        return itr.telegram.duration.format(hours=hours, minutes=rem // 60, seconds=rem % 60)
+    final_msg = itr.telegram.stats_msg.format(period=period)
+    for header, kind in ((itr.telegram.stats_pc, WINDOW), (itr.telegram.stats_phone, APP)):
+        usage = top_usage(kind, start, 10, find_device(device).key)  # type: ignore
+        final_msg = "".join([final_msg, header])
+        if not usage:
+            final_msg = "".join([final_msg, f"> {itr.telegram.no_app}\n"])
+        for title, seconds in usage:
+            final_msg = "".join([final_msg, f"> {title} - {_fmt_duration(seconds)}\n"])
+    final_msg = convert_markdown(final_msg)
+    await bot.send_message(message.chat.id, final_msg, parse_mode="MarkdownV2")
+
 @bot.message_handler(commands=["add"])
 @admin
 async def add_allow_user(message):
     """添加允许用户"""
-    args = extract_arguments(message.text)
-    if not args:
-        await bot.send_message(message.chat.id, itr.telegram.input_user_id)
-        return
-    try:
-        user_id = int(args)
-    except ValueError:
-        await bot.send_message(message.chat.id, itr.telegram.input_user_id_error)
-        return
-    if not await add_allow_user_db(user_id):
-        await bot.send_message(message.chat.id, itr.telegram.user_no_register.format(user=user_id))
-        return
-    await bot.send_message(message.chat.id, itr.telegram.add_user_success.format(user=user_id))
-
-@bot.message_handler(commands=["list"])
-@admin
-async def list_user(message):
-    """列出所有允许用户"""
-    users: list[tuple[int, str, str]] = await get_all_user_db()
+    await bulk_user_command(message, add_allow_users_db, itr.telegram.add_user_success)
+
+# 列表分页，callback_data 格式为 page:<列表>:<n 下一页|p 上一页>:<边界 user_id>
+PAGE_SIZE = 20
+page_lists = {
+    "list": (page_user_db, itr.telegram.list_user),
+    "allow": (page_allow_user_db, itr.telegram.list_allow_user),
+    "ban": (page_ban_user_db, itr.telegram.list_ban_user),
+}
+
+async def render_page(kind: str, cursor: int | None = None, backward: bool = False) -> tuple[str, types.InlineKeyboardMarkup | None]:
+    """查询一页用户并生成消息文本与翻页按钮"""
+    page_func, title = page_lists[kind]
+    users, has_prev, has_next = await page_func(cursor, backward, PAGE_SIZE)
     if not users:
-        await bot.send_message(message.chat.id, itr.telegram.no_user)
-        return
-    
-    final_msg = itr.telegram.list_user
+        return itr.telegram.no_user, None
     final_msg = "".join(
         [
-            final_msg,
+            title,
             # 使用 * 号将列表解包为独立的字符串元素，供 "".join 拼接
             *[
                 f"\n{full_name} - {username or user_id}"
@@ -332,123 +501,137 @@ async def list_user(message):
             ]
         ]
     )
-    await bot.send_message(message.chat.id, final_msg)
+    buttons: list[types.InlineKeyboardButton] = []
+    if has_prev:
+        buttons.append(types.InlineKeyboardButton("<", callback_data=f"page:{kind}:p:{users[0][0]}"))
+    if has_next:
+        buttons.append(types.InlineKeyboardButton(">", callback_data=f"page:{kind}:n:{users[-1][0]}"))
+    if not buttons:
+        return final_msg, None
+    return final_msg, types.InlineKeyboardMarkup().row(*buttons)
 
-@bot.message_handler(commands=["del"])
+@bot.message_handler(commands=["list"])
 @admin
-async def del_allow_user(message):
-    """删除允许用户"""
-    args = extract_arguments(message.text)
-    if not args:
-        await bot.send_message(message.chat.id, itr.telegram.input_user_id)
+async def list_user(message):
+    """列出所有注册用户"""
+    final_msg, markup = await render_page("list")
+    await bot.send_message(message.chat.id, final_msg, reply_markup=markup)
+
+@bot.callback_query_handler(func=lambda call: (call.data or "").startswith("page:"))
+@instrument(telegram_handler_seconds, root=True)
+async def turn_page(call):
+    """列表翻页"""
+    if call.from_user.id not in config.telegram.admins:
+        await bot.answer_callback_query(call.id, itr.telegram.no_admin)
         return
     try:
-        user_id = int(args)
+        _, kind, direction, cursor = call.data.split(":")
+        cursor_id = int(cursor)
     except ValueError:
-        await bot.send_message(message.chat.id, itr.telegram.input_user_id_error)
+        await bot.answer_callback_query(call.id)
         return
-    if not await del_allow_user_db(user_id):
-        await bot.send_message(message.chat.id, itr.telegram.user_no_register.format(user=user_id))
+    if kind not in page_lists:
+        await bot.answer_callback_query(call.id)
         return
-    await bot.send_message(message.chat.id, itr.telegram.del_user_success.format(user=user_id))
+    final_msg, markup = await render_page(kind, cursor_id, direction == "p")
+    await bot.answer_callback_query(call.id)
+    await bot.edit_message_text(
+        final_msg,
+        call.message.chat.id,
+        call.message.message_id,
+        reply_markup=markup
+    )
+
+@bot.message_handler(commands=["del"])
+@admin
+async def del_allow_user(message):
+    """删除允许用户"""
+    await bulk_user_command(message, del_allow_users_db, itr.telegram.del_user_success)
 
 @bot.message_handler(commands=["ban"])
 @admin
 async def ban_user(message):
     """添加封禁用户"""
-    args = extract_arguments(message.text)
-    if not args:
-        await bot.send_message(message.chat.id, itr.telegram.input_user_id)
-        return
-    try:
-        user_id = int(args)
-    except ValueError:
-        await bot.send_message(message.chat.id, itr.telegram.input_user_id_error)
-        return
-    if not await add_ban_user_db(user_id):
-        await bot.send_message(message.chat.id, itr.telegram.user_no_register.format(user=user_id))
-        return
-    await bot.send_message(message.chat.id, itr.telegram.ban_user_success.format(user=user_id))
+    await bulk_user_command(message, add_ban_users_db, itr.telegram.ban_user_success)
 
 @bot.message_handler(commands=["allowlist"])
 @admin
 async def list_allow_user(message):
     """列出所有允许用户"""
-    users: list[tuple[int, str, str]] = await list_allow_user_db()
-    if not users:
-        await bot.send_message(message.chat.id, itr.telegram.no_user)
-        return
-    final_msg = itr.telegram.list_allow_user
-    final_msg = "".join(
-        [
-            final_msg,
-            # 使用 * 号将列表解包为独立的字符串元素，供 "".join 拼接
-            *[
-                f"\n{full_name} - {username or user_id}"
-                for user_id, username, full_name in users
-            ]
-        ]
-    )
-    await bot.send_message(message.chat.id, final_msg)
+    final_msg, markup = await render_page("allow")
+    await bot.send_message(message.chat.id, final_msg, reply_markup=markup)
 
 @bot.message_handler(commands=["banlist"])
 @admin
 async def list_ban_user(message):
     """列出所有封禁用户"""
-    users: list[tuple[int, str, str]] = await list_ban_user_db()
-    if not users:
-        await bot.send_message(message.chat.id, itr.telegram.no_user)
-        return
-    
-    final_msg = itr.telegram.list_ban_user
-    final_msg = "".join(
-        [
-            final_msg,
-            # 使用 * 号将列表解包为独立的字符串元素，供 "".join 拼接
-            *[
-                f"\n{full_name} - {username or user_id}"
-                for user_id, username, full_name in users
-            ]
-        ]
-    )
-    await bot.send_message(message.chat.id, final_msg)
+    final_msg, markup = await render_page("ban")
+    await bot.send_message(message.chat.id, final_msg, reply_markup=markup)
 
 @bot.message_handler(commands=["unban"])
 @admin
 async def unban_user(message):
     """删除封禁用户"""
-    args = extract_arguments(message.text)
-    if not args:
-        await bot.send_message(message.chat.id, itr.telegram.input_user_id)
-        return
+    await bulk_user_command(message, del_ban_users_db, itr.telegram.unban_user_success)
+
+@bot.message_handler(commands=["reload"])
+@admin
+async def reload_words(message):
+    """重新加载违禁词表"""
     try:
-        user_id = int(args)
-    except ValueError:
-        await bot.send_message(message.chat.id, itr.telegram.input_user_id_error)
+        count, build_time = await word_list.reload()
+    except Exception as e:
+        telegram_log.error(f"Failed to reload prohibited words: {e}")
+        await bot.send_message(message.chat.id, itr.telegram.reload_words_failed.format(error=e))
         return
-    if not await del_ban_user_db(user_id):
-        await bot.send_message(message.chat.id, itr.telegram.user_no_register.format(user=user_id))
+    await bot.send_message(
+        message.chat.id,
+        itr.telegram.reload_words_success.format(count=count, time=f"{build_time * 1000:.1f}")
+    )
+
+@bot.message_handler(commands=["backup"])
+@admin
+async def backup(message):
+    """在线备份数据库并发送备份文件"""
+    wait_msg = await bot.send_message(message.chat.id, itr.telegram.backup_start)
+    try:
+        path, pages, elapsed = await backup_db()
+    except Exception as e:
+        telegram_log.error(f"Failed to back up database: {e}")
+        await bot.delete_message(message.chat.id, wait_msg.message_id)
+        await bot.send_message(message.chat.id, itr.telegram.backup_failed.format(error=e))
         return
-    await bot.send_message(message.chat.id, itr.telegram.unban_user_success.format(user=user_id))
+    await bot.delete_message(message.chat.id, wait_msg.message_id)
+    with open(path, "rb") as f:
+        await bot.send_document(
+            message.chat.id,
+            types.InputFile(f, path.name),
+            caption=itr.telegram.backup_success.format(pages=pages, time=f"{elapsed:.2f}"),
+            protect_content=True
+        )
 
 @bot.message_handler(func=lambda message: True)
 @user
 async def all_msg(message):
     """监听私聊所有消息以及群聊回复机器人"""
     # 判断是否是刷屏
-    msg_count = await flood_message()
+    msg_count = await flood_message(message)
     telegram_log.debug(f"User {message.from_user.id} sent {msg_count} messages")
-    if msg_count > 10:
+    if msg_count > config.telegram.flood.ban:
         await bot.send_message(message.chat.id, itr.telegram.flood_message)
-        await add_ban_user_db(message.from_user.id)
+        if await add_ban_user_db(message.from_user.id):
+            await users_changed()
         return
-    if msg_count >= 7:
+    if msg_count >= config.telegram.flood.warn:
         await bot.send_message(message.chat.id, itr.telegram.ready_flood_message)
         return
 
-    if any(pattern in message.text for pattern in patterns):
+    hit_words = word_list.matcher.search(message.text)
+    if hit_words:
+        telegram_log.debug(f"User {message.from_user.id} hit prohibited words: {hit_words}")
         await bot.send_message(message.chat.id, itr.telegram.ban_success)
-        await add_ban_user_db(message.from_user.id)
+        if await add_ban_user_db(message.from_user.id):
+            await users_changed()
         return
 
     userfullname = message.from_user.full_name
@@ -462,6 +645,7 @@ async def all_msg(message):
     await bot.send_message(message.chat.id, reply_to_message_id=message.message_id, text=reply_msg)
 
 @sio.event
+@instrument(telegram_handler_seconds, root=True)
 async def send_telegram_message(sid: str, user_id: int, message: str) -> tuple[bool, str]:
     """向指定用户发送消息"""
     telegram_log.debug(f"Received message from {sid} to user {user_id}: {message}")
@@ -471,6 +655,7 @@ async def send_telegram_message(sid: str, user_id: int, message: str) -> tuple[b
         telegram_log.error(f"Failed to send message to user {user_id}: {e}")
         if "bot was blocked by the user" in str(e):
             await del_user_db(user_id)
+            await users_changed()
         return False, str(e)
     return True, ""
 
@@ -0,0 +1,167 @@
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from telegram_monitoring.src.config import config
+from telegram_monitoring.src.log import telegram_log
+
+__all__ = [
+    "Trace",
+    "begin_trace",
+    "end_trace",
+    "enter_span",
+    "exit_span",
+    "span",
+    "traced",
+    "annotate",
+    "recent_traces",
+]
+
+class Span:
+    __slots__ = ("name", "parent", "start", "end", "error")
+
+    def __init__(self, name: str, parent: int, start: float) -> None:
+        self.name = name
+        # 父 span 在 Trace.spans 中的下标，根 span 为 -1
+        self.parent = parent
+        self.start = start
+        self.end = 0.0
+        self.error = ""
+
+class Trace:
+    """
+    一次 Telegram 更新（或客户端请求）的处理过程，spans[0] 是根 span
+    结束后不再接受新的 span，由它派生的后台任务不会改写已经存入缓冲区的记录
+    """
+
+    __slots__ = ("trace_id", "attrs", "wall", "spans", "done")
+
+    def __init__(self, name: str, attrs: dict) -> None:
+        self.trace_id = os.urandom(8).hex()
+        self.attrs = attrs
+        # 开始时的 Unix 时间，span 的时间都是相对 perf_counter 的
+        self.wall = time.time()
+        self.spans = [Span(name, -1, time.perf_counter())]
+        self.done = False
+
+    @property
+    def duration(self) -> float:
+        root = self.spans[0]
+        return root.end - root.start
+
+    def to_dict(self) -> dict:
+        origin = self.spans[0].start
+        return {
+            "trace_id": self.trace_id,
+            "name": self.spans[0].name,
+            "attrs": self.attrs,
+            "start": round(self.wall, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "spans": [
+                {
+                    "name": span.name,
+                    "parent": span.parent,
+                    "offset_ms": round((span.start - origin) * 1000, 3),
+                    "duration_ms": round((span.end - span.start) * 1000, 3) if span.end else None,
+                    "error": span.error or None,
+                }
+                for span in self.spans
+            ],
+        }
+
+    def summary(self) -> str:
+        """各 span 的耗时，嵌套的 span 写成 父>子"""
+        return ", ".join(
+            f"{self._path(i)} {(span.end - span.start) * 1000:.1f}ms"
+            for i, span in enumerate(self.spans) if i and span.end
+        )
+
+    def _path(self, index: int) -> str:
+        names = [self.spans[index].name]
+        while (index := self.spans[index].parent) > 0:
+            names.append(self.spans[index].name)
+        return ">".join(reversed(names))
+
+# 当前任务所在的 (Trace, 当前 span 下标)，asyncio 创建任务时会复制，因此会沿 await 链传递
+_current: ContextVar[tuple[Trace, int] | None] = ContextVar("trace", default=None)
+# 最近结束的 trace
+_finished: deque[Trace] = deque(maxlen=config.trace.buffer)
+
+def begin_trace(name: str, **attrs) -> tuple[Trace, object]:
+    """开始一个新的 trace，返回值交给 end_trace"""
+    trace = Trace(name, attrs)
+    return trace, _current.set((trace, 0))
+
+def end_trace(handle: tuple[Trace, object], error: BaseException | None = None) -> None:
+    trace, token = handle
+    _current.reset(token)  # type: ignore
+    root = trace.spans[0]
+    root.end = time.perf_counter()
+    if error is not None:
+        root.error = repr(error)
+    trace.done = True
+    _finished.append(trace)
+    if trace.duration * 1000 >= config.trace.slow:
+        telegram_log.warning(f"Slow trace {trace.trace_id} {root.name} took {trace.duration * 1000:.0f}ms: {trace.summary()}")
+
+def enter_span(name: str) -> tuple[Span, object] | None:
+    """在当前 trace 中开始一个 span，没有 trace 时返回 None 且不做任何事"""
+    current = _current.get()
+    if current is None:
+        return None
+    trace, parent = current
+    if trace.done:
+        return None
+    span = Span(name, parent, time.perf_counter())
+    trace.spans.append(span)
+    return span, _current.set((trace, len(trace.spans) - 1))
+
+def exit_span(handle: tuple[Span, object], error: BaseException | None = None) -> None:
+    span, token = handle
+    span.end = time.perf_counter()
+    if error is not None:
+        span.error = repr(error)
+    _current.reset(token)  # type: ignore
+
+@contextmanager
+def span(name: str):
+    handle = enter_span(name)
+    if handle is None:
+        yield
+        return
+    try:
+        yield
+    except BaseException as e:
+        exit_span(handle, e)
+        raise
+    exit_span(handle)
+
+def traced(name: str | None = None):
+    """把异步函数记为当前 trace 中的一个 span，名称默认为函数名"""
+    def decorator(func):
+        label = name or func.__name__
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(label):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def annotate(**attrs) -> None:
+    """给当前 trace 添加属性，例如会话和用户 ID"""
+    current = _current.get()
+    if current is not None:
+        current[0].attrs.update(attrs)
+
+def recent_traces(limit: int, min_ms: float = 0) -> list[dict]:
+    """最近结束的 trace，新的在前"""
+    result = []
+    for trace in reversed(_finished):
+        if len(result) >= limit:
+            break
+        if trace.duration * 1000 >= min_ms:
+            result.append(trace.to_dict())
+    return result
@@ -0,0 +1,57 @@
+import asyncio
+import multiprocessing
+import signal
+from multiprocessing.connection import wait
+import uvicorn
+from telegram_monitoring.src.config import config
+from telegram_monitoring.src.log import socketio_log
+
+__all__ = [
+    "run_worker",
+    "run_workers",
+]
+
+def run_worker(port: int, need_start_bot: bool) -> None:
+    """多进程部署时的工作进程，各进程通过 bus.db 共享设备状态"""
+    from telegram_monitoring.src.backend import use_backend
+    use_backend("sqlite")
+    from telegram_monitoring.src.socket_route import app
+    app.state.need_start_bot = need_start_bot
+    uvicorn.run(app, host=config.bind, port=port, log_config=None)
+
+async def _prepare_db() -> None:
+    from telegram_monitoring.src.sql import init_db, close_con
+    await init_db()
+    await close_con()
+
+def run_workers(workers: int, need_start_bot: bool) -> None:
+    """启动 workers 个工作进程，端口从配置的端口开始依次加一"""
+    from telegram_monitoring.src.backend import reset_bus
+    # 先在主进程中完成数据库迁移，避免多个进程同时迁移
+    asyncio.run(_prepare_db())
+    reset_bus()
+    ctx = multiprocessing.get_context("spawn")
+    processes = [
+        ctx.Process(target=run_worker, args=(config.port + i, need_start_bot), name=f"worker-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def terminate(signum, frame) -> None:
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    running = list(processes)
+    while running:
+        try:
+            wait([process.sentinel for process in running])
+        except KeyboardInterrupt:
+            # 终端的 Ctrl+C 同样会发给各工作进程，继续等待它们正常退出
+            continue
+        # 及时回收退出的进程，否则 leader 会把僵尸进程当作仍在运行，不释放它的电脑客户端
+        for process in [process for process in running if not process.is_alive()]:
+            if process.exitcode:
+                socketio_log.error(f"{process.name} exited with code {process.exitcode}")
+            running.remove(process)
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+import pytest
+
+# 模块导入时就会读取配置，必须在导入 telegram_monitoring 之前指定测试用的配置文件
+_config_dir = Path(tempfile.mkdtemp(prefix="tm-test-"))
+(_config_dir / "config.yaml").write_text(
+    """
+lang: en_US
+log_level: WARNING
+bind: 127.0.0.1
+port: 5000
+token: test-token
+max_window: 3
+window_settle: 0
+telegram:
+  token: "123456:TEST"
+  admins: [1]
+  screenshot:
+    allow: true
+    delete_time: 3
+""",
+    encoding="utf-8",
+)
+os.environ["TELEGRAM_MONITORING_CONFIG"] = str(_config_dir / "config.yaml")
+
+from telegram_monitoring.src import activity, sql  # noqa: E402
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch) -> Path:
+    """每个测试使用独立的数据库文件，并清空与上一个数据库相关的模块状态"""
+    path = tmp_path / "data.db"
+    monkeypatch.setattr(sql, "db_file", str(path))
+    activity.reset_title_cache()
+    activity._pending.clear()
+    monkeypatch.setattr(activity, "_flush_task", None)
+    return path
+
+@pytest.fixture
+def run_db(db_file):
+    """
+    在同一个事件循环中初始化数据库、运行协程并关闭连接
+    aiosqlite 的连接绑定创建它的事件循环，不能跨 asyncio.run 使用
+    """
+    def runner(func):
+        async def main():
+            await sql.init_db()
+            try:
+                return await func()
+            finally:
+                await sql.close_con()
+        return asyncio.run(main())
+    return runner
+
+async def _no_leader_change(leader: bool) -> None:
+    pass
+
+@pytest.fixture
+def memory_state():
+    """把 socket_route 的变更处理挂到单进程状态后端上，lifespan 在测试中不会运行"""
+    from telegram_monitoring.src import socket_route
+    socket_route.state.attach(socket_route.apply_change, socket_route.dump_states, socket_route.load_states, _no_leader_change)
+    return socket_route.state
+
+@pytest.fixture
+def run_api(run_db, memory_state):
+    """同 run_db，func 收到一个直接调用 FastAPI 应用的 HTTP 客户端"""
+    import httpx
+    from telegram_monitoring.src.socket_route import app
+
+    def runner(func):
+        async def main():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", headers={"Authorization": "Bearer test-token"}) as client:
+                return await func(client)
+        return run_db(main)
+    return runner
+
+@pytest.fixture
+def run_server(run_db, memory_state):
+    """同 run_db，另外用 uvicorn 在随机端口上运行 FastAPI 应用，func 收到服务地址；用于 SSE 和 Socket.IO"""
+    import uvicorn
+    from telegram_monitoring.src.socket_route import app
+
+    def runner(func):
+        async def main():
+            # lifespan 会启动机器人和后台任务，测试中不运行
+            server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_config=None, log_level="warning"))
+            task = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.01)
+            port = server.servers[0].sockets[0].getsockname()[1]
+            try:
+                return await func(f"http://127.0.0.1:{port}")
+            finally:
+                server.should_exit = True
+                await task
+        return run_db(main)
+    return runner
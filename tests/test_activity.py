@@ -0,0 +1,85 @@
+import asyncio
+import random
+import sqlite3
+import pytest
+from telegram_monitoring.src import activity
+from telegram_monitoring.src.activity import WINDOW, APP, decode_block, encode_block, flush_activity, query_activity, record_activity
+
+def test_block_round_trip():
+    rng = random.Random(3)
+    start = 1_700_000_000
+    records = [(start + rng.randint(-100, 10_000), rng.randint(1, 1 << 20)) for _ in range(500)]
+    data = encode_block(start, records)
+    assert decode_block(start, data) == records
+    # 相邻记录时间接近时每条只需几个字节
+    steady = [(start + i * 5, i % 10 + 1) for i in range(1000)]
+    assert len(encode_block(start, steady)) == 2 * len(steady)
+
+def test_record_flush_and_query(run_db, monkeypatch):
+    monkeypatch.setattr(activity, "flush_interval", 60.0)
+
+    async def main():
+        for i in range(5):
+            record_activity(WINDOW, f"Window {i % 2}", 1000 + i * 10)
+        record_activity(APP, "Maps", 1005)
+        record_activity(WINDOW, "Other device", 1001, device=1)
+        # 未写入的记录也能查到
+        pending = await query_activity(WINDOW, limit=2)
+        await flush_activity()
+        assert not any(activity._pending.values())
+        record_activity(WINDOW, "Window 0", 1100)
+        return (
+            pending,
+            await query_activity(WINDOW),
+            await query_activity(WINDOW, 1010, 1030),
+            await query_activity(WINDOW, limit=2),
+            await query_activity(APP),
+            await query_activity(WINDOW, device=1),
+        )
+
+    pending, everything, ranged, latest, apps, other = run_db(main)
+    assert pending == [("Window 1", 1030), ("Window 0", 1040)]
+    assert everything == [("Window 0", 1000), ("Window 1", 1010), ("Window 0", 1020), ("Window 1", 1030), ("Window 0", 1040), ("Window 0", 1100)]
+    assert ranged == [("Window 1", 1010), ("Window 0", 1020), ("Window 1", 1030)]
+    assert latest == [("Window 0", 1040), ("Window 0", 1100)]
+    assert apps == [("Maps", 1005)]
+    assert other == [("Other device", 1001)]
+
+def test_flush_size_triggers_write(run_db, monkeypatch):
+    monkeypatch.setattr(activity, "flush_interval", 60.0)
+    monkeypatch.setattr(activity, "flush_size", 4)
+
+    async def main():
+        for i in range(4):
+            record_activity(WINDOW, "Editor", 2000 + i)
+        await asyncio.sleep(0.05)
+        con = await activity.get_con()
+        cur = await con.execute("SELECT count, start_time, end_time FROM activity_blocks")
+        return await cur.fetchall()
+
+    assert run_db(main) == [(4, 2000, 2003)]
+
+def test_failed_flush_keeps_other_writes(run_db, monkeypatch):
+    monkeypatch.setattr(activity, "flush_interval", 60.0)
+
+    async def main():
+        con = await activity.get_con()
+        # 其他协程在共享的写连接上尚未提交的写入
+        await con.execute("INSERT INTO ban_users (user_id) VALUES (42)")
+        record_activity(WINDOW, "Editor", 3000)
+        executemany = con.executemany
+
+        async def failing(*args, **kwargs):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        monkeypatch.setattr(con, "executemany", failing)
+        with pytest.raises(sqlite3.OperationalError):
+            await flush_activity()
+        monkeypatch.setattr(con, "executemany", executemany)
+        await con.commit()
+        cur = await con.execute("SELECT user_id FROM ban_users")
+        banned = await cur.fetchall()
+        await flush_activity()
+        return banned, await query_activity(WINDOW)
+
+    assert run_db(main) == ([(42,)], [("Editor", 3000)])
@@ -0,0 +1,131 @@
+import asyncio
+import multiprocessing
+import os
+import pickle
+import time
+import pytest
+from telegram_monitoring.src import backend, socket_route, sql
+from telegram_monitoring.src.backend import StateBackend, SqliteBackend, _dumps, _loads
+
+LEASE_RENEW = 0.1
+LEASE_TTL = 0.5
+
+def test_bus_codec_round_trip():
+    message = {
+        "method": "callback", "host_id": "abc", "sid": "s1", "namespace": "/", "id": 3,
+        "args": (b"\x89PNG\x00", {"title": "编辑器", "list": [("a", 1)]}),
+    }
+    decoded = _loads(_dumps(message))
+    # 元组变成列表，bytes 原样还原
+    assert decoded["args"] == [b"\x89PNG\x00", {"title": "编辑器", "list": [["a", 1]]}]
+    assert _loads(_dumps({"__bytes__": "not bytes", "other": 1})) == {"__bytes__": "not bytes", "other": 1}
+
+def test_bus_codec_rejects_pickle():
+    with pytest.raises(ValueError):
+        _loads(pickle.dumps({"op": "users"}))
+    with pytest.raises(TypeError):
+        _dumps({"op": object()})
+
+def test_state_backend_is_abstract():
+    with pytest.raises(TypeError):
+        StateBackend()  # type: ignore[abstract]
+
+    class Partial(StateBackend):
+        async def start(self) -> None:
+            pass
+
+    # 漏掉任何一个抽象方法都不能实例化
+    with pytest.raises(TypeError):
+        Partial()  # type: ignore[abstract]
+
+def _leader_worker(db_path: str, bus_path: str, ready, ban, banned, ban_silently, banned_silently) -> None:
+    """子进程：先成为 leader，收到通知后封禁用户；第二次封禁不发布变更，模拟错过的消息"""
+    async def main():
+        backend.lease_renew = LEASE_RENEW
+        backend.lease_ttl = LEASE_TTL
+        sql.db_file = db_path
+        await sql.init_db()
+        bus = SqliteBackend(bus_path)
+
+        async def apply(op: dict) -> None:
+            pass
+
+        async def load(states: dict) -> None:
+            pass
+
+        async def on_leader(leader: bool) -> None:
+            pass
+
+        bus.attach(apply, dict, load, on_leader)
+        await bus.start()
+        assert bus.is_leader
+        ready.set()
+        await _wait(ban.is_set)
+        await sql.add_ban_user_db(42)
+        await bus.publish({"op": "users", "pid": os.getpid()})
+        banned.set()
+        await _wait(ban_silently.is_set)
+        await sql.add_ban_user_db(43)
+        banned_silently.set()
+        # 等待被父进程强制结束，不释放租约
+        await asyncio.sleep(60)
+
+    asyncio.run(main())
+
+async def _wait(predicate, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.02)
+
+def test_acl_invalidation_and_leader_failover(run_db, db_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(backend, "lease_renew", LEASE_RENEW)
+    monkeypatch.setattr(backend, "lease_ttl", LEASE_TTL)
+    bus_path = str(tmp_path / "bus.db")
+    context = multiprocessing.get_context("spawn")
+    ready, ban, banned, ban_silently, banned_silently = (context.Event() for _ in range(5))
+    worker = None
+    leader_changes: list[bool] = []
+
+    async def on_leader(leader: bool) -> None:
+        leader_changes.append(leader)
+        await socket_route._set_leader(False, leader)
+
+    async def main():
+        nonlocal worker
+        assert await sql.add_user_db(42, "@a", "A")
+        assert await sql.add_user_db(43, "@b", "B")
+        worker = context.Process(target=_leader_worker, args=(str(db_file), bus_path, ready, ban, banned, ban_silently, banned_silently), daemon=True)
+        worker.start()
+        await _wait(ready.is_set, 60)
+
+        bus = SqliteBackend(bus_path)
+        bus.attach(socket_route.apply_change, socket_route.dump_states, socket_route.load_states, on_leader)
+        await bus.start()
+        try:
+            assert not bus.is_leader
+            ban.set()
+            await _wait(banned.is_set)
+            # leader 发布的失效通知让本进程重新加载缓存
+            await _wait(lambda: 42 in sql._ban_users)
+            ban_silently.set()
+            await _wait(banned_silently.is_set)
+            assert not await sql.check_ban_user_db(43)
+
+            worker.kill()
+            worker.join()
+            await _wait(lambda: bus.is_leader)
+            assert leader_changes == [True]
+            # 接管时重新加载了用户缓存
+            assert await sql.check_ban_user_db(42)
+            assert await sql.check_ban_user_db(43)
+        finally:
+            await bus.stop()
+            await socket_route._set_leader(False, False)
+
+    try:
+        run_db(main)
+    finally:
+        if worker is not None and worker.is_alive():
+            worker.kill()
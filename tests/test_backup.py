@@ -0,0 +1,59 @@
+import asyncio
+import sqlite3
+import pytest
+from telegram_monitoring.src import sql
+from telegram_monitoring.src.backup import backup_db, restore_db
+
+def _users(path) -> list[tuple]:
+    con = sqlite3.connect(path)
+    try:
+        return con.execute("SELECT user_id, full_name FROM users ORDER BY user_id").fetchall()
+    finally:
+        con.close()
+
+def test_backup_while_writing(run_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(sql, "flush_interval", 60.0)
+    target = tmp_path / "backups" / "copy.db"
+
+    async def main():
+        for user_id in range(1, 201):
+            await sql.add_user_db(user_id, None, "x" * 200)
+        # 写后队列中的更新也会写入备份
+        await sql.update_user_db(1, None, "Updated")
+
+        async def writer():
+            for user_id in range(1000, 1020):
+                await sql.add_user_db(user_id, None, "during backup")
+                await asyncio.sleep(0)
+
+        result, _ = await asyncio.gather(backup_db(target), writer())
+        return result
+
+    path, pages, elapsed = run_db(main)
+    assert path == target and pages > 0 and elapsed >= 0
+    assert not target.with_name(target.name + ".tmp").exists()
+    users = _users(target)
+    assert users[0] == (1, "Updated")
+    assert len([row for row in users if row[0] <= 200]) == 200
+    con = sqlite3.connect(target)
+    assert con.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert con.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    con.close()
+
+def test_restore_replaces_database(run_db, db_file, tmp_path):
+    backup = tmp_path / "backup.db"
+    run_db(lambda: sql.add_user_db(1, None, "Saved"))
+    run_db(lambda: backup_db(backup))
+    run_db(lambda: sql.add_user_db(2, None, "Lost"))
+
+    restore_db(backup)
+    assert _users(db_file) == [(1, "Saved")]
+
+def test_restore_rejects_bad_files(db_file, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        restore_db(tmp_path / "missing.db")
+    broken = tmp_path / "broken.db"
+    broken.write_bytes(b"not a database" * 100)
+    with pytest.raises(sqlite3.DatabaseError):
+        restore_db(broken)
+    assert not db_file.exists()
@@ -0,0 +1,83 @@
+import asyncio
+from telegram_monitoring.src import socket_route
+from telegram_monitoring.src.config import config
+from telegram_monitoring.src.devices import get_device
+
+SID = "debounce-sid"
+
+async def _client(monkeypatch, name: str):
+    """不经过 Socket.IO 连接，直接把 SID 登记为该设备的电脑客户端"""
+    device = await get_device(name)
+    device.client_sid = SID
+    monkeypatch.setitem(socket_route._sid_devices, SID, device)
+    return device
+
+def test_rapid_switches_collapse_to_last_window(run_db, memory_state, monkeypatch):
+    monkeypatch.setattr(config, "window_settle", 100)
+
+    async def main():
+        device = await _client(monkeypatch, "debounce-pc")
+        versions = [device.window_snapshot.version]
+        await socket_route.window_change(SID, "Editor", 100)
+        await asyncio.sleep(0.2)
+        versions.append(device.window_snapshot.version)
+        # Alt-Tab 经过两个窗口，停在第三个
+        for index, title in enumerate(("Browser", "Chat", "Terminal")):
+            await socket_route.window_change(SID, title, 110 + index)
+            await asyncio.sleep(0.02)
+        unsettled = list(device.window_list)
+        await device.settle_task
+        versions.append(device.window_snapshot.version)
+        return versions, unsettled, list(device.window_list)
+
+    versions, unsettled, window_list = run_db(main)
+    assert unsettled == [("Editor", 100)]
+    # 快速切换合并为一次变更，保留最后一个窗口的切换时间
+    assert window_list == [("Editor", 100), ("Terminal", 112)]
+    assert versions == [0, 1, 2]
+
+def test_switching_back_discards_pending_window(run_db, memory_state, monkeypatch):
+    monkeypatch.setattr(config, "window_settle", 100)
+
+    async def main():
+        device = await _client(monkeypatch, "debounce-back")
+        await socket_route.window_change(SID, "Editor", 100)
+        await device.settle_task
+        # 最小化再还原
+        await socket_route.window_change(SID, "Desktop", 110)
+        await socket_route.window_change(SID, "Editor", 111)
+        await device.settle_task
+        return list(device.window_list), device.window_snapshot.version
+
+    assert run_db(main) == ([("Editor", 100)], 1)
+
+def test_settle_disabled_publishes_immediately(run_db, memory_state, monkeypatch):
+    async def main():
+        device = await _client(monkeypatch, "debounce-off")
+        await socket_route.window_change(SID, "Editor", 100)
+        await socket_route.window_change(SID, "Browser", 101)
+        # 不是该设备电脑客户端的连接发来的窗口被忽略
+        await socket_route.window_change("other-sid", "Spoofed", 102)
+        return list(device.window_list), device.settle_task
+
+    window_list, settle_task = run_db(main)
+    assert window_list == [("Editor", 100), ("Browser", 101)]
+    assert settle_task is None
+
+def test_repeated_report_keeps_pending_switch(run_db, memory_state, monkeypatch):
+    monkeypatch.setattr(config, "window_settle", 100)
+
+    async def main():
+        device = await _client(monkeypatch, "debounce-repeat")
+        await socket_route.window_change(SID, "Editor", 100)
+        first = device.pending_window
+        await asyncio.sleep(0.02)
+        # 客户端重连后重复上报同一窗口
+        await socket_route.window_change(SID, "Editor", 120)
+        repeated = device.pending_window
+        await device.settle_task
+        return first, repeated, list(device.window_list)
+
+    first, repeated, window_list = run_db(main)
+    assert repeated == first
+    assert window_list == [("Editor", 100)]
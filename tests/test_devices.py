@@ -0,0 +1,69 @@
+import asyncio
+import time
+import httpx
+import pytest
+import socketio
+from telegram_monitoring.src.config import config
+from telegram_monitoring.src.devices import DEFAULT_DEVICE, find_device, valid_device_name
+
+HEADERS = {"Authorization": "Bearer test-token"}
+
+async def _pc(url: str, device: str) -> socketio.AsyncClient:
+    client = socketio.AsyncClient()
+    await client.connect(url, auth={"token": config.token, "device": device}, transports=["websocket"], wait_timeout=5)
+    return client
+
+async def _wait(predicate, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        await asyncio.sleep(0.01)
+
+@pytest.mark.parametrize(("name", "valid"), [
+    ("office-pc", True), ("laptop_2.home", True), ("", False), ("a" * 33, False), ("../etc", False), ("桌面", False),
+])
+def test_valid_device_name(name, valid):
+    assert valid_device_name(name) == valid
+
+def test_devices_keep_separate_state(run_server):
+    async def main(url):
+        office = await _pc(url, "multi-office")
+        home = await _pc(url, "multi-home")
+        try:
+            # 每台设备只允许一个电脑客户端，其他设备不受影响
+            with pytest.raises(socketio.exceptions.ConnectionError):
+                await _pc(url, "multi-office")
+            with pytest.raises(socketio.exceptions.ConnectionError):
+                await _pc(url, "bad/name")
+            await office.emit("window_change", ("Editor", 100))
+            await home.emit("window_change", ("Game", 105))
+            await office.emit("window_change", ("Browser", 110))
+            await _wait(lambda: len(find_device("multi-office").window_list) == 2 and find_device("multi-home").window_list)
+
+            async with httpx.AsyncClient(base_url=url, headers=HEADERS) as client:
+                windows = {
+                    name: (await client.get("/now_window", params={"device": name})).json()["now_window"]
+                    for name in ("multi-office", "multi-home")
+                }
+                history = (await client.get("/history/window", params={"device": "multi-home"})).json()
+                devices = {item["name"]: item for item in (await client.get("/devices")).json()["devices"]}
+                missing = await client.get("/now_window", params={"device": "multi-unknown"})
+        finally:
+            await home.disconnect()
+            await office.disconnect()
+        # 断开后该设备的窗口列表被清空，可以重新连接
+        await _wait(lambda: not find_device("multi-office").window_list)
+        again = await _pc(url, "multi-office")
+        await again.disconnect()
+        return windows, history, devices, missing
+
+    windows, history, devices, missing = run_server(main)
+    assert windows == {"multi-office": "Browser", "multi-home": "Game"}
+    assert [item["title"] for item in history["history"]] == ["Game"]
+    assert devices["multi-office"] == {
+        "name": "multi-office", "client_connected": True, "listen_clients": 0, "now_window": "Browser", "now_app": None,
+    }
+    assert devices["multi-home"]["now_window"] == "Game"
+    assert DEFAULT_DEVICE in devices
+    assert missing.status_code == 404
@@ -0,0 +1,88 @@
+import json
+from telegram_monitoring.src.devices import get_device
+from telegram_monitoring.src.socket_route import state
+
+async def _window(device: str, title: str, at: int) -> None:
+    await state.publish({"op": "window", "device": device, "title": title, "time": at})
+
+def test_now_window_etag(run_api):
+    async def main(client):
+        assert (await client.get("/now_window", params={"device": "etag-pc"})).status_code == 404
+        await get_device("etag-pc")
+        # 还没有窗口数据
+        assert (await client.get("/now_window", params={"device": "etag-pc"})).status_code == 204
+
+        await _window("etag-pc", "Editor", 100)
+        first = await client.get("/now_window", params={"device": "etag-pc"})
+        etag = first.headers["ETag"]
+        cached = await client.get("/now_window", params={"device": "etag-pc"}, headers={"If-None-Match": f'"other", {etag}'})
+        wildcard = await client.get("/now_window", params={"device": "etag-pc"}, headers={"If-None-Match": "*"})
+
+        await _window("etag-pc", "Browser", 110)
+        changed = await client.get("/now_window", params={"device": "etag-pc"}, headers={"If-None-Match": etag})
+        # 同一窗口重复上报不改变版本
+        await _window("etag-pc", "Browser", 120)
+        same = await client.get("/now_window", params={"device": "etag-pc"}, headers={"If-None-Match": changed.headers["ETag"]})
+        return first, cached, wildcard, changed, same
+
+    first, cached, wildcard, changed, same = run_api(main)
+    assert first.status_code == 200 and first.json()["now_window"] == "Editor"
+    assert cached.status_code == 304 and cached.content == b""
+    assert cached.headers["ETag"] == first.headers["ETag"]
+    assert wildcard.status_code == 304
+    assert changed.status_code == 200 and changed.headers["ETag"] != first.headers["ETag"]
+    assert [item["title"] for item in changed.json()["window_list"]] == ["Editor", "Browser"]
+    assert same.status_code == 304
+
+def test_etag_differs_between_devices(run_api):
+    async def main(client):
+        for name in ("etag-a", "etag-b"):
+            await _window(name, "Editor", 100)
+        return [await client.get("/now_window", params={"device": name}) for name in ("etag-a", "etag-b")]
+
+    first, second = run_api(main)
+    # 版本号相同，ETag 仍然不同
+    assert first.content == second.content
+    assert first.headers["ETag"] != second.headers["ETag"]
+
+def test_snapshot_serialized_once_per_version(run_api):
+    async def main(client):
+        device = await get_device("etag-once")
+        calls = 0
+        build = device.window_snapshot._build
+
+        def counting():
+            nonlocal calls
+            calls += 1
+            return build()
+
+        device.window_snapshot._build = counting
+        # 推送给 /stream 时已经序列化过，HTTP 请求直接复用
+        await _window("etag-once", "编辑器", 100)
+        responses = [await client.get("/now_window", params={"device": "etag-once"}) for _ in range(3)]
+        return calls, responses
+
+    calls, responses = run_api(main)
+    assert calls == 1
+    # 非 ASCII 标题原样输出
+    assert "编辑器".encode() in responses[0].content
+    assert json.loads(responses[-1].content)["now_window"] == "编辑器"
+
+def test_now_app_etag_and_auth(run_api):
+    async def main(client):
+        await get_device("etag-phone")
+        unauthorized = await client.get("/now_app", params={"device": "etag-phone"}, headers={"Authorization": "wrong"})
+        empty = await client.get("/now_app", params={"device": "etag-phone"})
+        await client.post("/phone_webhook", params={"device": "etag-phone"}, json={
+            "name": "Chat", "status": "屏幕开启", "battery": 80, "power_status": "关闭",
+            "device_info": "Pixel", "android_version": "15", "uptime": "1h",
+        })
+        first = await client.get("/now_app", params={"device": "etag-phone"})
+        cached = await client.get("/now_app", params={"device": "etag-phone"}, headers={"If-None-Match": first.headers["ETag"]})
+        return unauthorized, empty, first, cached
+
+    unauthorized, empty, first, cached = run_api(main)
+    assert unauthorized.status_code == 401
+    assert empty.status_code == 204
+    assert first.status_code == 200 and first.json()["name"] == "Chat"
+    assert cached.status_code == 304
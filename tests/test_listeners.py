@@ -0,0 +1,135 @@
+import asyncio
+import json
+import time
+import socketio
+from telegram_monitoring.src.config import config
+from telegram_monitoring.src.devices import Listener, get_device
+from telegram_monitoring.src.socket_route import state
+
+async def _window(device: str, title: str, at: int) -> None:
+    await state.publish({"op": "window", "device": device, "title": title, "time": at})
+
+async def _listen(url: str, device: str, delta: bool) -> tuple[socketio.AsyncClient, asyncio.Queue]:
+    """连接一个监听客户端，收到的事件按顺序放入队列"""
+    client = socketio.AsyncClient()
+    received: asyncio.Queue = asyncio.Queue()
+
+    @client.on("*")
+    async def catch_all(event, data):
+        await received.put((event, data))
+
+    auth = {"token": config.token, "type": "listen_client", "device": device}
+    if delta:
+        auth["delta"] = "1"
+    await client.connect(url, auth=auth, transports=["websocket"], wait_timeout=5)
+    return client, received
+
+async def _next(received: asyncio.Queue, *events: str) -> dict:
+    """跳过其他事件，返回下一个指定事件的数据"""
+    while True:
+        event, data = await asyncio.wait_for(received.get(), 5)
+        if event in events:
+            return {"event": event, **data} if isinstance(data, dict) else {"event": event, "data": data}
+
+def test_listener_queue_overflow_falls_back_to_snapshot():
+    async def main():
+        listener = Listener("sid", True)
+        for seq in range(Listener.max_pending + 1):
+            listener.push_delta("window", "window_delta", {"seq": seq})
+        overflowed = (len(listener.deltas), set(listener.snapshots))
+        # 快照已包含之后的变化，不再排队
+        listener.push_delta("app", "app_delta", {"seq": 1})
+        return overflowed, len(listener.deltas)
+
+    (pending, snapshots), after = asyncio.run(main())
+    assert pending == 0 and snapshots == {"window", "app"}
+    assert after == 0
+
+def test_listener_resync_drops_only_that_kind():
+    async def main():
+        listener = Listener("sid", True)
+        listener.push_delta("window", "window_delta", {"seq": 1})
+        listener.push_delta("app", "app_delta", {"seq": 1})
+        listener.resync(("app",))
+        return [item[0] for item in listener.deltas], listener.snapshots
+
+    assert asyncio.run(main()) == (["window"], {"app"})
+
+def test_delta_protocol(run_server):
+    async def main(url):
+        await get_device("delta-pc")
+        await _window("delta-pc", "Editor", 100)
+        client, received = await _listen(url, "delta-pc", True)
+        try:
+            snapshot = await _next(received, "window_snapshot")
+            deltas = []
+            for index, title in enumerate(("Browser", "Terminal", "Mail")):
+                await _window("delta-pc", title, 110 + index)
+                deltas.append(await _next(received, "window_delta"))
+            # 客户端发现序号不连续时请求快照
+            await client.emit("resync")
+            resynced = await _next(received, "window_snapshot")
+        finally:
+            await client.disconnect()
+        return snapshot, deltas, resynced
+
+    snapshot, deltas, resynced = run_server(main)
+    assert snapshot["data"]["now_window"] == "Editor"
+    assert [delta["seq"] for delta in deltas] == [snapshot["seq"] + 1, snapshot["seq"] + 2, snapshot["seq"] + 3]
+    assert [delta["append"]["title"] for delta in deltas] == ["Browser", "Terminal", "Mail"]
+    # max_window 为 3，第三条增量挤掉了最旧的窗口
+    assert [delta["evict"] for delta in deltas] == [False, False, True]
+    assert resynced["seq"] == deltas[-1]["seq"]
+    assert [item["title"] for item in resynced["data"]["window_list"]] == ["Browser", "Terminal", "Mail"]
+
+def test_full_protocol_listener_still_gets_whole_list(run_server):
+    async def main(url):
+        await get_device("full-pc")
+        client, received = await _listen(url, "full-pc", False)
+        try:
+            await _window("full-pc", "Editor", 100)
+            first = await _next(received, "get_window")
+        finally:
+            await client.disconnect()
+        return first
+
+    first = run_server(main)
+    assert '"now_window": "Editor"' in first["data"]
+
+def test_slow_listener_is_coalesced_without_blocking_others(run_server, monkeypatch):
+    from telegram_monitoring.src import socket_route
+    slow_sids: set[str] = set()
+    backlog = socket_route._backlog
+    monkeypatch.setattr(socket_route, "_backlog", lambda sid: 1000 if sid in slow_sids else backlog(sid))
+
+    async def main(url):
+        await get_device("room-pc")
+        await get_device("room-other")
+        fast, fast_received = await _listen(url, "room-pc", False)
+        slow, slow_received = await _listen(url, "room-pc", False)
+        other, other_received = await _listen(url, "room-other", False)
+        try:
+            # Engine.IO 队列积压时暂停向该客户端发送
+            slow_sids.add(slow.get_sid())
+            fast_titles = []
+            for index, title in enumerate(("Editor", "Browser", "Terminal")):
+                started = time.monotonic()
+                await _window("room-pc", title, 100 + index)
+                assert time.monotonic() - started < 0.5
+                fast_titles.append(json.loads((await _next(fast_received, "get_window"))["data"])["now_window"])
+            assert slow_received.empty()
+            slow_sids.clear()
+            # 积压期间的变化合并为最新的一条
+            slow_first = json.loads((await _next(slow_received, "get_window"))["data"])["now_window"]
+            await asyncio.sleep(0.2)
+            slow_rest = slow_received.qsize()
+        finally:
+            for client in (fast, slow, other):
+                await client.disconnect()
+        return fast_titles, slow_first, slow_rest, other_received.empty()
+
+    fast_titles, slow_first, slow_rest, other_empty = run_server(main)
+    assert fast_titles == ["Editor", "Browser", "Terminal"]
+    assert slow_first == "Terminal" and slow_rest == 0
+    # 其他设备的监听客户端收不到这台设备的变化
+    assert other_empty
@@ -0,0 +1,54 @@
+import sqlite3
+from telegram_monitoring.src import sql
+from telegram_monitoring.src.maintenance import maintain_db, maintenance_stats
+from telegram_monitoring.src.metrics import render_metrics
+
+def _old_database(path) -> None:
+    """未开启增量回收模式的旧库"""
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE filler (data BLOB)")
+    con.commit()
+    con.close()
+
+def test_busy_maintenance_skips_blocking_steps(run_db, db_file):
+    _old_database(db_file)
+
+    async def main():
+        steps = await maintain_db(idle=False)
+        async with sql.read_con() as con:
+            cur = await con.execute("PRAGMA auto_vacuum")
+            return steps, (await cur.fetchone())[0]
+
+    steps, auto_vacuum = run_db(main)
+    assert "vacuum" not in steps and "wal_checkpoint" in steps
+    assert auto_vacuum == 0
+
+def test_idle_maintenance_converts_old_database(run_db, db_file):
+    _old_database(db_file)
+
+    async def main():
+        steps = await maintain_db(idle=True)
+        # 维护连接用完即关闭，写连接仍可继续写入
+        await sql.add_user_db(1, "@a", "A")
+        async with sql.read_con() as con:
+            cur = await con.execute("PRAGMA auto_vacuum")
+            return steps, (await cur.fetchone())[0]
+
+    steps, auto_vacuum = run_db(main)
+    assert {"auto_vacuum", "vacuum", "wal_checkpoint", "optimize"} <= steps.keys()
+    assert auto_vacuum == 2
+    assert maintenance_stats()["last_run"] > 0
+    body = render_metrics()
+    assert 'telegram_monitoring_db_maintenance_step_seconds{step="vacuum"}' in body
+    assert "telegram_monitoring_db_maintenance_last_run_timestamp_seconds " in body
+
+def test_maintenance_waits_for_open_write_transaction(run_db):
+    async def main():
+        con = await sql.get_con()
+        await con.execute("INSERT INTO users (user_id, username, full_name) VALUES (1, NULL, 'A')")
+        assert con.in_transaction
+        steps = await maintain_db()
+        await con.commit()
+        return steps
+
+    assert run_db(main) == {}
@@ -0,0 +1,43 @@
+import random
+from pathlib import Path
+import pytest
+from telegram_monitoring.src.matcher import PatternMatcher
+
+ROOT = Path(__file__).parents[1]
+
+def naive_search(terms: list[str], text: str) -> list[str]:
+    """逐词 in 扫描，作为对照"""
+    return [term for term in dict.fromkeys(terms) if term and term in text]
+
+@pytest.mark.parametrize(("terms", "text", "expected"), [
+    (["he", "she", "his", "hers"], "ushers", ["he", "she", "hers"]),
+    (["a", "ab", "bab", "bc", "bca", "c", "caa"], "abccab", ["a", "ab", "bc", "c"]),
+    (["广告", "加微信", "微信"], "请加微信看广告", ["广告", "加微信", "微信"]),
+    (["spam", "spam", ""], "no match here", []),
+    ([], "anything", []),
+])
+def test_search_examples(terms, text, expected):
+    matcher = PatternMatcher(terms)
+    assert matcher.search(text) == expected
+    assert matcher.contains(text) == bool(expected)
+
+def test_search_matches_naive_on_random_input():
+    rng = random.Random(1)
+    alphabet = "abc微信"
+    for _ in range(200):
+        terms = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 20))]
+        matcher = PatternMatcher(terms)
+        for _ in range(10):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+            assert matcher.search(text) == naive_search(terms, text)
+            assert matcher.contains(text) == bool(naive_search(terms, text))
+
+def test_prohibited_words_file_matches_naive():
+    with open(ROOT / "prohibited_words.txt", encoding="utf-8") as f:
+        terms = [line.rstrip("\r\n") for line in f]
+    matcher = PatternMatcher.from_file(ROOT / "prohibited_words.txt")
+    assert matcher.terms == tuple(dict.fromkeys(t for t in terms if t))
+    rng = random.Random(2)
+    for term in rng.sample(list(matcher.terms), min(50, len(matcher))):
+        text = f"前缀{term}后缀"
+        assert matcher.search(text) == naive_search(terms, text)
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from telegram_monitoring.src import metrics
+from telegram_monitoring.src.metrics import Counter, Gauge, Histogram, errors_total, instrument, render_metrics
+
+@pytest.fixture
+def registry(monkeypatch) -> list:
+    """测试中新建的指标不注册到全局列表"""
+    fresh: list = []
+    monkeypatch.setattr(metrics, "_metrics", fresh)
+    return fresh
+
+def test_counter_and_gauge_render(registry):
+    counter = Counter("test_events_total", "Events", ("kind",))
+    counter.inc("b")
+    counter.inc("a", amount=2.5)
+    counter.inc("b")
+    Gauge("test_queue", "Queue length", lambda: {("x\"y",): 3}, ("name",))
+    Gauge("test_up", "Up", lambda: {(): 1})
+    assert render_metrics().splitlines() == [
+        "# HELP telegram_monitoring_test_events_total Events",
+        "# TYPE telegram_monitoring_test_events_total counter",
+        'telegram_monitoring_test_events_total{kind="a"} 2.5',
+        'telegram_monitoring_test_events_total{kind="b"} 2',
+        "# HELP telegram_monitoring_test_queue Queue length",
+        "# TYPE telegram_monitoring_test_queue gauge",
+        'telegram_monitoring_test_queue{name="x\\"y"} 3',
+        "# HELP telegram_monitoring_test_up Up",
+        "# TYPE telegram_monitoring_test_up gauge",
+        "telegram_monitoring_test_up 1",
+    ]
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = Histogram("test_seconds", "Latency", ("function",), buckets=(0.1, 1.0))
+    # 等于上界的值计入该桶
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, "f")
+    assert histogram.render()[2:] == [
+        'telegram_monitoring_test_seconds_bucket{function="f",le="0.1"} 2',
+        'telegram_monitoring_test_seconds_bucket{function="f",le="1"} 3',
+        'telegram_monitoring_test_seconds_bucket{function="f",le="+Inf"} 4',
+        'telegram_monitoring_test_seconds_sum{function="f"} 2.650000',
+        'telegram_monitoring_test_seconds_count{function="f"} 4',
+    ]
+
+def test_instrument_records_latency_and_errors(registry):
+    histogram = Histogram("test_calls_seconds", "Calls", ("function",))
+
+    @instrument(histogram)
+    async def works():
+        await asyncio.sleep(0.01)
+        return 1
+
+    @instrument(histogram, "renamed")
+    async def fails():
+        raise ValueError("boom")
+
+    async def main():
+        assert await works() == 1
+        with pytest.raises(ValueError):
+            await fails()
+
+    before = errors_total.values.get(("test_calls", "renamed"), 0)
+    asyncio.run(main())
+    assert works.__name__ == "works"
+    assert histogram.values[("works",)][-1] >= 0.01
+    assert sum(histogram.values[("renamed",)][:-1]) == 1
+    assert errors_total.values[("test_calls", "renamed")] == before + 1
+    assert ("test_calls", "works") not in errors_total.values
+
+def test_metrics_endpoint(run_api):
+    async def main(client):
+        return await client.get("/metrics"), await client.get("/metrics", headers={"Authorization": "wrong"})
+
+    response, unauthorized = run_api(main)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE telegram_monitoring_db_seconds histogram" in response.text
+    assert 'telegram_monitoring_connections{type="pc"}' in response.text
+    assert unauthorized.status_code == 401
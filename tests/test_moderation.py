@@ -0,0 +1,52 @@
+import asyncio
+import os
+import pytest
+from telegram_monitoring.src.moderation import WordList
+
+def _write(path, words: list[str], mtime_ns: int | None = None) -> None:
+    path.write_text("\n".join(words) + "\n", encoding="utf-8")
+    if mtime_ns is not None:
+        # 部分文件系统的修改时间精度较低，手动设置保证变化能被发现
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_reload_swaps_matcher(tmp_path):
+    path = tmp_path / "words.txt"
+    _write(path, ["广告", "spam"])
+    words = WordList(path)
+    old = words.matcher
+    assert old.search("spam 广告") == ["广告", "spam"]
+
+    _write(path, ["加微信"])
+    count, build_time = asyncio.run(words.reload())
+    assert count == 1 and build_time >= 0
+    assert words.matcher.search("spam 加微信") == ["加微信"]
+    # 替换前取到的自动机保持不变
+    assert old.search("spam 广告") == ["广告", "spam"]
+
+def test_failed_reload_keeps_old_list(tmp_path):
+    path = tmp_path / "words.txt"
+    _write(path, ["spam"])
+    words = WordList(path)
+    path.unlink()
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(words.reload())
+    assert words.matcher.contains("spam")
+
+def test_watch_reloads_on_change(tmp_path):
+    path = tmp_path / "words.txt"
+    _write(path, ["spam"], 1_000_000_000)
+    words = WordList(path, interval=0.01)
+
+    async def main():
+        task = asyncio.create_task(words.watch())
+        try:
+            _write(path, ["eggs"], 2_000_000_000)
+            for _ in range(200):
+                if words.matcher.contains("eggs"):
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+
+    asyncio.run(main())
+    assert words.matcher.terms == ("eggs",)
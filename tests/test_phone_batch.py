@@ -0,0 +1,78 @@
+import time
+import pytest
+from telegram_monitoring.src import socket_route
+from telegram_monitoring.src.socket_route import PhoneEvent, _push_phone_events
+from telegram_monitoring.src.devices import get_device
+
+pytestmark = pytest.mark.usefixtures("memory_state")
+
+def _event(name: str, at: int, status: str = "屏幕开启") -> PhoneEvent:
+    return PhoneEvent(
+        name=name, status=status, battery=80, power_status="关闭",
+        device_info="Pixel", android_version="15", uptime="1h", time=at,
+    )
+
+def test_batch_sorts_and_drops_duplicates(run_db):
+    now = int(time.time())
+
+    async def main():
+        result = await _push_phone_events([
+            _event("Maps", now - 10),
+            _event("Chat", now - 30),
+            _event("Maps", now - 10),
+            _event("Mail", now - 20),
+        ], "phone-order")
+        device = await get_device("phone-order")
+        return result, list(device.app_list)
+
+    result, app_list = run_db(main)
+    assert result == {"accepted": 3, "duplicates": 1, "stale": 0, "rejected": 0}
+    assert app_list == [("Chat", now - 30), ("Mail", now - 20), ("Maps", now - 10)]
+
+def test_batch_replay_is_stale(run_db):
+    now = int(time.time())
+    events = [_event("Chat", now - 30), _event("Mail", now - 20)]
+
+    async def main():
+        await _push_phone_events(events, "phone-replay")
+        # 重试整批时只有最新一条（时间等于已应用的最新事件）会重复应用，且不会追加到列表
+        result = await _push_phone_events(events, "phone-replay")
+        device = await get_device("phone-replay")
+        return result, list(device.app_list)
+
+    result, app_list = run_db(main)
+    assert result == {"accepted": 1, "duplicates": 0, "stale": 1, "rejected": 0}
+    assert app_list == [("Chat", now - 30), ("Mail", now - 20)]
+
+def test_batch_rejects_ancient_timestamps(run_db):
+    now = int(time.time())
+
+    async def main():
+        result = await _push_phone_events([
+            _event("Epoch", 0),
+            _event("TooOld", now - socket_route.max_phone_event_age - 60),
+            _event("Chat", now - 5),
+        ], "phone-ancient")
+        device = await get_device("phone-ancient")
+        return result, list(device.app_list), device.phone_app["switch_app_time"]
+
+    result, app_list, last = run_db(main)
+    assert result == {"accepted": 1, "duplicates": 0, "stale": 0, "rejected": 2}
+    assert app_list == [("Chat", now - 5)]
+    assert last == now - 5
+
+def test_batch_future_clock_does_not_stall(run_db):
+    """手机时钟超前时按服务器时间记录，之后时钟正常的事件不会被当作重放"""
+    now = int(time.time())
+
+    async def main():
+        first = await _push_phone_events([_event("Chat", now + 3600)], "phone-future")
+        device = await get_device("phone-future")
+        assert device.phone_app["switch_app_time"] <= int(time.time())
+        second = await _push_phone_events([_event("Mail", int(time.time()))], "phone-future")
+        return first, second, [title for title, _ in device.app_list]
+
+    first, second, titles = run_db(main)
+    assert first["accepted"] == 1
+    assert second == {"accepted": 1, "duplicates": 0, "stale": 0, "rejected": 0}
+    assert titles == ["Chat", "Mail"]
@@ -0,0 +1,46 @@
+from telegram_monitoring.src.ratelimit import SlidingWindowLimiter
+
+def test_counts_within_window():
+    limiter = SlidingWindowLimiter(4.0)
+    assert [limiter.hit("a", now=100 + i * 0.1) for i in range(5)] == [1, 2, 3, 4, 5]
+    # 不同 key 分别计数
+    assert limiter.hit("b", now=100.5) == 1
+
+def test_previous_window_is_weighted():
+    limiter = SlidingWindowLimiter(4.0)
+    for i in range(8):
+        limiter.hit("a", now=100 + i * 0.1)
+    # 进入下一个窗口 1 秒后，上一窗口的 8 条按 3/4 计入
+    assert limiter.hit("a", now=105.0) == 6 + 1
+    # 两个窗口之后旧计数全部过期
+    assert limiter.hit("a", now=113.0) == 1
+
+def test_thresholds_for_steady_flood():
+    """每秒 3 条持续刷屏时，估算值稳定在窗口内的实际条数附近，超过封禁阈值 10"""
+    limiter = SlidingWindowLimiter(4.0)
+    counts = [limiter.hit("a", now=100 + i / 3) for i in range(60)]
+    assert max(counts) > 10
+    assert all(abs(count - 12) <= 3 for count in counts[24:])
+
+def test_slow_sender_never_reaches_warn():
+    limiter = SlidingWindowLimiter(4.0)
+    counts = [limiter.hit("a", now=100 + i * 1.0) for i in range(100)]
+    assert max(counts) < 7
+
+def test_memory_is_bounded():
+    limiter = SlidingWindowLimiter(4.0, max_keys=100)
+    for i in range(1000):
+        limiter.hit(i, now=100.0)
+    assert len(limiter) == 100
+    # 最近使用的 key 保留，最早的被淘汰
+    assert limiter.hit(999, now=100.0) == 2
+    assert limiter.hit(0, now=100.0) == 1
+
+def test_idle_keys_expire():
+    limiter = SlidingWindowLimiter(4.0)
+    for i in range(50):
+        limiter.hit(i, now=100.0)
+    limiter.hit("late", now=109.0)
+    assert len(limiter) == 1
+    limiter.reset("late")
+    assert len(limiter) == 0
@@ -0,0 +1,154 @@
+import sqlite3
+import time
+import pytest
+from telegram_monitoring.src import rollup, sql
+from telegram_monitoring.src.rollup import HOUR, DAY, switch_usage, close_usage, top_usage, persist_usage, load_usage
+
+KIND = 1
+
+@pytest.fixture(autouse=True)
+def clean_rollup():
+    for buckets in (rollup._current, rollup._hours, rollup._days, rollup._dirty):
+        buckets.clear()
+    yield
+    for buckets in (rollup._current, rollup._hours, rollup._days, rollup._dirty):
+        buckets.clear()
+
+def _hour_now() -> int:
+    now = int(time.time())
+    return now - now % HOUR
+
+def test_split_across_hours():
+    hour = _hour_now() - 3 * HOUR
+    switch_usage(KIND, "Editor", hour + HOUR - 600)
+    switch_usage(KIND, "Browser", hour + HOUR + 300)
+    close_usage(KIND, hour + HOUR + 900)
+    assert rollup._hours[(0, KIND, hour)] == {"Editor": 600}
+    assert rollup._hours[(0, KIND, hour + HOUR)] == {"Editor": 300, "Browser": 600}
+    assert sum(sum(counter.values()) for counter in rollup._days.values()) == 1500
+
+def test_ancient_start_is_clamped_to_retention():
+    """时间戳为 0 时不能从 1970 年开始逐小时生成桶"""
+    now = int(time.time())
+    switch_usage(KIND, "Epoch", 0)
+    close_usage(KIND, now)
+    assert len(rollup._days) <= rollup.day_retention // DAY + 2
+    assert all(key[2] >= now - rollup.hour_retention - HOUR for key in rollup._hours)
+    assert all(key[3] >= rollup.local_day(now - rollup.day_retention) for key in rollup._dirty)
+    assert sum(rollup._days[key]["Epoch"] for key in rollup._days) <= rollup.day_retention
+
+def test_empty_interval_adds_nothing():
+    now = int(time.time())
+    switch_usage(KIND, "Editor", now)
+    close_usage(KIND, now - 100)
+    assert not rollup._hours and not rollup._days and not rollup._dirty
+
+def test_top_usage_clips_first_hour_bucket():
+    hour = _hour_now() - 2 * HOUR
+    # 整个小时都在使用，查询从半小时开始时只计入一半
+    switch_usage(KIND, "Editor", hour)
+    close_usage(KIND, hour + HOUR)
+    assert top_usage(KIND, hour + HOUR // 2) == [("Editor", HOUR // 2)]
+    assert top_usage(KIND, hour) == [("Editor", HOUR)]
+    assert top_usage(KIND, hour + HOUR) == []
+
+def test_persist_is_bounded_per_pass(run_db, monkeypatch):
+    monkeypatch.setattr(rollup, "persist_batch", 3)
+    hour = _hour_now() - 10 * HOUR
+    for i in range(6):
+        switch_usage(KIND, f"App{i}", hour + i * HOUR)
+    close_usage(KIND, hour + 6 * HOUR)
+    dirty = len(rollup._dirty)
+    assert dirty > 3
+
+    async def main():
+        await persist_usage(3)
+        first_pass = len(rollup._dirty)
+        await persist_usage()
+        con = await sql.get_con()
+        cur = await con.execute("SELECT COUNT(*) FROM usage_rollup WHERE granularity = ?", (HOUR,))
+        rows = (await cur.fetchone())[0]
+        hours = dict(rollup._hours)
+        rollup._hours.clear()
+        rollup._days.clear()
+        await load_usage()
+        return first_pass, rows, hours
+
+    first_pass, rows, hours = run_db(main)
+    assert first_pass == dirty - 3
+    assert not rollup._dirty
+    assert rows == 6
+    assert rollup._hours == hours
+
+def test_failed_persist_keeps_other_writes(run_db, monkeypatch):
+    hour = _hour_now() - 2 * HOUR
+    switch_usage(KIND, "Editor", hour)
+    close_usage(KIND, hour + 600)
+    dirty = set(rollup._dirty)
+
+    async def main():
+        con = await sql.get_con()
+        # 其他协程在共享的写连接上尚未提交的写入
+        await con.execute("INSERT INTO ban_users (user_id) VALUES (42)")
+        executemany = con.executemany
+
+        async def failing(*args, **kwargs):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        monkeypatch.setattr(con, "executemany", failing)
+        with pytest.raises(sqlite3.OperationalError):
+            await persist_usage()
+        requeued = set(rollup._dirty)
+        monkeypatch.setattr(con, "executemany", executemany)
+        await con.commit()
+        cur = await con.execute("SELECT user_id FROM ban_users")
+        banned = await cur.fetchall()
+        await persist_usage()
+        cur = await con.execute("SELECT SUM(seconds) FROM usage_rollup WHERE granularity = ?", (HOUR,))
+        return requeued, banned, (await cur.fetchone())[0]
+
+    assert run_db(main) == (dirty, [(42,)], 600)
+
+def test_leader_failover_counts_only_leader_time(run_db, memory_state, monkeypatch):
+    from telegram_monitoring.src import devices, socket_route
+    from telegram_monitoring.src.activity import WINDOW
+    from telegram_monitoring.src.devices import DEFAULT_DEVICE, Device, get_device
+    # 成为 leader 时会恢复所有设备的计时，不能带上其他测试登记的设备
+    monkeypatch.setattr(devices, "_devices", {DEFAULT_DEVICE: Device(DEFAULT_DEVICE, 0)})
+    clock = [rollup.local_day(int(time.time())) + HOUR]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+
+    async def window(device: str, title: str) -> None:
+        await memory_state.publish({"op": "connect", "device": device, "sid": f"{device}-sid"})
+        await memory_state.publish({"op": "window", "device": device, "title": title, "time": clock[0]})
+
+    async def main():
+        await window("failover-pc", "Editor")
+        await window("failover-gone", "Game")
+        clock[0] += 600
+        # 租约被其他进程抢走，之后的变更不由本进程计时
+        await socket_route._set_leader(False, False)
+        monkeypatch.setattr(memory_state, "is_leader", False)
+        await memory_state.publish({"op": "disconnect", "device": "failover-gone", "sid": "failover-gone-sid", "time": clock[0] + 100})
+        clock[0] += 1200
+        monkeypatch.setattr(memory_state, "is_leader", True)
+        await socket_route._set_leader(False, True)
+        current = set(rollup._current)
+        clock[0] += 300
+        await socket_route._set_leader(False, False)
+        con = await sql.get_con()
+        cur = await con.execute(
+            """
+            SELECT activity_titles.title, SUM(usage_rollup.seconds) FROM usage_rollup
+            INNER JOIN activity_titles ON usage_rollup.title_id = activity_titles.id
+            WHERE usage_rollup.granularity = ? GROUP BY activity_titles.title
+            """,
+            (DAY,)
+        )
+        return current, dict(await cur.fetchall()), (await get_device("failover-pc")).key
+
+    current, totals, key = run_db(main)
+    # 重新成为 leader 时只恢复仍然连接的设备
+    assert current == {(key, WINDOW)}
+    assert totals == {"Editor": 900, "Game": 600}
+    assert not rollup._current
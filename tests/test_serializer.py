@@ -0,0 +1,121 @@
+import asyncio
+import pytest
+import socketio
+import uvicorn
+from socketio import packet
+from telegram_monitoring.src.serializer import NegotiatedPacket, NegotiatedServer
+
+msgpack = pytest.importorskip("msgpack")
+
+async def _serve(sio: socketio.AsyncServer) -> tuple[uvicorn.Server, asyncio.Task, str]:
+    server = uvicorn.Server(uvicorn.Config(socketio.ASGIApp(sio), host="127.0.0.1", port=0, log_config=None, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, task, f"http://127.0.0.1:{port}"
+
+def _server() -> NegotiatedServer:
+    # polling 断开时要等长轮询结束，缩短心跳间隔让测试更快
+    sio = NegotiatedServer(async_mode="asgi", ping_interval=1, ping_timeout=1)
+
+    @sio.event
+    async def connect(sid, environ, auth):
+        await sio.enter_room(sid, "listeners")
+
+    @sio.event
+    async def echo(sid, data):
+        return data
+
+    return sio
+
+def test_packet_msgpack_round_trip():
+    pkt = NegotiatedPacket(packet.EVENT, data=["shot", b"\x89PNG"], namespace="/", id=7)
+    # JSON 模式下带二进制数据是 BINARY_EVENT，msgpack 中直接携带字节
+    assert pkt.packet_type == packet.BINARY_EVENT
+    decoded = NegotiatedPacket(encoded_packet=pkt.encode_msgpack())
+    assert decoded.packet_type == packet.EVENT
+    assert decoded.data == ["shot", b"\x89PNG"]
+    assert decoded.id == 7
+    assert decoded.namespace == "/"
+
+def test_packet_json_unchanged():
+    pkt = NegotiatedPacket(packet.EVENT, data=["get_window", {"a": 1}], namespace="/")
+    assert pkt.encode() == packet.Packet(packet.EVENT, data=["get_window", {"a": 1}], namespace="/").encode()
+
+@pytest.mark.parametrize("transport", ["websocket", "polling"])
+def test_json_and_msgpack_clients_side_by_side(transport):
+    async def main():
+        sio = _server()
+        server, task, url = await _serve(sio)
+        json_client = socketio.AsyncClient()
+        msgpack_client = socketio.AsyncClient(serializer="msgpack")
+        received: dict[str, list] = {"json": [], "msgpack": []}
+        json_client.on("get_window", lambda data: received["json"].append(data))
+        msgpack_client.on("get_window", lambda data: received["msgpack"].append(data))
+
+        @msgpack_client.on("screenshot")
+        async def screenshot():
+            return b"\x89PNG\x00\xff"
+
+        try:
+            await json_client.connect(url, transports=[transport])
+            await msgpack_client.connect(url, transports=[transport])
+            assert len(sio._msgpack_sids) == 1
+
+            # 广播只编码一次，两种客户端收到相同的内容
+            await sio.emit("get_window", {"now_window": "Editor", "n": 1}, room="listeners")
+            await sio.emit("get_window", '{\n  "now_window": "Editor"\n}', room="listeners")
+            for _ in range(100):
+                if len(received["json"]) == 2 and len(received["msgpack"]) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert received["json"] == received["msgpack"] == [{"now_window": "Editor", "n": 1}, '{\n  "now_window": "Editor"\n}']
+
+            # 服务端调用 msgpack 客户端，回复的字节原样返回
+            assert await sio.call("screenshot", to=msgpack_client.get_sid(), timeout=5) == b"\x89PNG\x00\xff"
+            # 两种客户端调用服务端
+            assert await json_client.call("echo", b"\x00bin", timeout=5) == b"\x00bin"
+            assert await msgpack_client.call("echo", {"x": [1, 2]}, timeout=5) == {"x": [1, 2]}
+
+            await msgpack_client.disconnect()
+            for _ in range(100):
+                if not sio._msgpack_sids:
+                    break
+                await asyncio.sleep(0.01)
+            assert not sio._msgpack_sids
+        finally:
+            await json_client.disconnect()
+            await msgpack_client.disconnect()
+            server.should_exit = True
+            await task
+
+    asyncio.run(main())
+
+def _client_config_model():
+    """client.py 依赖 Windows 库无法导入，只取出 default_config 和 Config 来测试"""
+    import ast
+    from pathlib import Path
+    from typing import Literal
+    from pydantic import BaseModel, field_validator
+
+    tree = ast.parse((Path(__file__).parents[1] / "client.py").read_text(encoding="utf-8"))
+    nodes = [
+        node for node in tree.body
+        if isinstance(node, ast.ClassDef) and node.name == "Config"
+        or isinstance(node, ast.AnnAssign) and getattr(node.target, "id", None) == "default_config"
+    ]
+    namespace = {"BaseModel": BaseModel, "Literal": Literal, "field_validator": field_validator}
+    exec(compile(ast.Module(body=nodes, type_ignores=[]), "client.py", "exec"), namespace)
+    return namespace["default_config"], namespace["Config"]
+
+def test_client_default_serializer_is_accepted_by_socketio():
+    default_config, Config = _client_config_model()
+    config = Config(**default_config)
+    assert config.serializer == "default"
+    # 以前的默认值 json 会被 python-socketio 当作数据包类，创建客户端时报错
+    socketio.AsyncClient(serializer=config.serializer)
+    assert Config(**{**default_config, "serializer": "json"}).serializer == "default"
+    assert Config(**{**default_config, "serializer": "msgpack"}).serializer == "msgpack"
+    with pytest.raises(ValueError):
+        Config(**{**default_config, "serializer": "pickle"})
@@ -0,0 +1,281 @@
+import asyncio
+import sqlite3
+import pytest
+from telegram_monitoring.src import sql
+from telegram_monitoring.src.metrics import render_metrics
+
+def test_read_pool_lends_least_busy_reader(run_db):
+    async def main():
+        await sql.add_user_db(1, "@a", "A")
+        async with sql.read_con() as first:
+            async with sql.read_con() as second:
+                busy = list(sql._reader_busy)
+        # 只读连接不能写入
+        async with sql.read_con() as con:
+            with pytest.raises(sqlite3.OperationalError):
+                await con.execute("DELETE FROM users")
+        return first is not second, busy, list(sql._reader_busy), await sql.get_all_user_db()
+
+    different, busy, idle, users = run_db(main)
+    assert different and sorted(busy) == [0] * (sql.read_pool_size - 2) + [1, 1]
+    assert idle == [0] * sql.read_pool_size
+    assert users == [(1, "@a", "A")]
+
+def test_pool_stats_in_metrics(run_db):
+    async def main():
+        await sql.add_user_db(1, "@a", "A")
+        async with sql.read_con():
+            # 借用期间该连接的查询数为 1
+            busy = render_metrics()
+        await sql.get_all_user_db()
+        return busy, sql.pool_stats_db()
+
+    busy, stats = run_db(main)
+    assert stats["readers"] == sql.read_pool_size
+    assert stats["in_flight"] == [0] * sql.read_pool_size
+    assert f"telegram_monitoring_db_pool_readers {sql.read_pool_size}" in busy
+    assert 'telegram_monitoring_db_pool_in_flight{reader="0"} 1' in busy
+    body = render_metrics()
+    assert f'telegram_monitoring_db_pool_acquired{{type="read"}} {stats["reads"]}' in body
+    assert f'telegram_monitoring_db_pool_acquired{{type="write"}} {stats["writes"]}' in body
+
+def test_cache_follows_writes_and_reload(run_db):
+    async def main():
+        assert await sql.add_user_db(1, "@a", "A")
+        assert not await sql.add_user_db(1, "@a", "A")
+        assert not await sql.add_ban_user_db(2)
+        assert await sql.add_allow_user_db(1)
+        assert await sql.add_ban_user_db(1)
+        assert await sql.get_user_db(1) == (1, "@a", "A")
+        assert await sql.check_allow_user_db(1) and await sql.check_ban_user_db(1)
+
+        # 缓存与数据库一致，重新加载后不变
+        await sql.load_cache()
+        assert await sql.get_user_db(1) == (1, "@a", "A")
+        assert await sql.check_allow_user_db(1) and await sql.check_ban_user_db(1)
+
+        assert await sql.del_allow_user_db(1)
+        assert await sql.del_ban_user_db(1)
+        await sql.del_user_db(1)
+        assert await sql.get_user_db(1) is None
+        assert not await sql.check_allow_user_db(1) and not await sql.check_ban_user_db(1)
+        await sql.load_cache()
+        return await sql.get_user_db(1), sql._allow_users, sql._ban_users
+
+    assert run_db(main) == (None, set(), set())
+
+async def _stored_user(user_id: int):
+    con = await sql.get_con()
+    cur = await con.execute("SELECT username, full_name FROM users WHERE user_id = ?", (user_id,))
+    return await cur.fetchone()
+
+def test_profile_updates_are_batched(run_db, monkeypatch):
+    monkeypatch.setattr(sql, "flush_interval", 0.05)
+
+    async def main():
+        await sql.add_user_db(1, "@a", "A")
+        await sql.add_user_db(2, "@b", "B")
+        await sql.update_user_db(1, "@a", "A 1")
+        await sql.update_user_db(1, "@a", "A 2")
+        await sql.update_user_db(2, "@bb", "B")
+        # 未写入数据库前缓存已是新值
+        assert await sql.get_user_db(1) == (1, "@a", "A 2")
+        assert await _stored_user(1) == ("@a", "A")
+        assert len(sql._pending_updates) == 2
+        await asyncio.sleep(0.2)
+        return await _stored_user(1), await _stored_user(2), dict(sql._pending_updates)
+
+    assert run_db(main) == (("@a", "A 2"), ("@bb", "B"), {})
+
+def test_profile_update_flushes_at_batch_size(run_db, monkeypatch):
+    monkeypatch.setattr(sql, "flush_size", 3)
+    monkeypatch.setattr(sql, "flush_interval", 60.0)
+
+    async def main():
+        for user_id in range(1, 4):
+            await sql.add_user_db(user_id, None, "Old")
+        await sql.update_user_db(1, None, "New")
+        await sql.update_user_db(2, None, "New")
+        # 未变化的资料不进入队列
+        await sql.update_user_db(3, None, "Old")
+        before = await _stored_user(1)
+        await sql.update_user_db(3, None, "New")
+        return before, [await _stored_user(user_id) for user_id in range(1, 4)]
+
+    before, after = run_db(main)
+    assert before == (None, "Old")
+    assert after == [(None, "New")] * 3
+
+def test_deleted_user_drops_pending_update(run_db):
+    async def main():
+        await sql.add_user_db(1, None, "A")
+        await sql.update_user_db(1, None, "B")
+        await sql.del_user_db(1)
+        await sql.flush_user_updates()
+        return await _stored_user(1), dict(sql._pending_updates)
+
+    assert run_db(main) == (None, {})
+
+def test_failed_flush_requeues_updates(run_db, monkeypatch):
+    monkeypatch.setattr(sql, "flush_interval", 60.0)
+
+    async def main():
+        await sql.add_user_db(1, None, "A")
+        await sql.add_user_db(2, None, "B")
+        await sql.update_user_db(1, None, "A 1")
+        await sql.update_user_db(2, None, "B 1")
+        con = await sql.get_con()
+        executemany = con.executemany
+
+        async def failing(*args, **kwargs):
+            # 写入失败前又收到一次更新
+            await sql.update_user_db(2, None, "B 2")
+            raise sqlite3.OperationalError("database is locked")
+
+        monkeypatch.setattr(con, "executemany", failing)
+        with pytest.raises(sqlite3.OperationalError):
+            await sql.flush_user_updates()
+        requeued = dict(sql._pending_updates)
+        monkeypatch.setattr(con, "executemany", executemany)
+        await sql.flush_user_updates()
+        return requeued, await _stored_user(1), await _stored_user(2)
+
+    requeued, first, second = run_db(main)
+    assert requeued == {1: (None, "A 1"), 2: (None, "B 2")}
+    assert first == (None, "A 1") and second == (None, "B 2")
+
+def _v0_database(path) -> None:
+    """迁移之前的结构：自增 id，未设置 user_version"""
+    con = sqlite3.connect(path)
+    con.executescript(sql.migrations[0])
+    con.executemany("INSERT INTO users (user_id, username, full_name) VALUES (?, ?, ?)", [(10, "@a", "A"), (20, None, "B")])
+    con.execute("INSERT INTO allow_users (user_id) VALUES (10)")
+    con.execute("INSERT INTO ban_users (user_id) VALUES (20)")
+    con.commit()
+    con.close()
+
+def test_migrations_upgrade_old_database(run_db, db_file):
+    _v0_database(db_file)
+
+    async def main():
+        con = await sql.get_con()
+        cur = await con.execute("PRAGMA user_version")
+        version = (await cur.fetchone())[0]
+        cur = await con.execute("SELECT sql FROM sqlite_master WHERE name IN ('allow_users', 'ban_users')")
+        schemas = [row[0] for row in await cur.fetchall()]
+        cur = await con.execute("SELECT user_id, username, full_name FROM users ORDER BY user_id")
+        users = await cur.fetchall()
+        cur = await con.execute("SELECT id, name FROM devices")
+        devices = await cur.fetchall()
+        return version, schemas, users, devices
+
+    version, schemas, users, devices = run_db(main)
+    assert version == len(sql.migrations)
+    assert all("WITHOUT ROWID" in schema for schema in schemas)
+    assert users == [(10, "@a", "A"), (20, None, "B")]
+    assert devices == [(0, "default")]
+    assert sql._allow_users == {10} and sql._ban_users == {20}
+
+def test_migrations_are_idempotent(run_db, db_file):
+    run_db(lambda: sql.add_user_db(1, None, "A"))
+
+    async def main():
+        # 再次启动时没有需要执行的迁移，数据保持不变
+        await sql.migrate_db(await sql.get_con())
+        return await sql.get_user_db(1)
+
+    assert run_db(main) == (1, None, "A")
+
+def test_failed_migration_rolls_back(run_db, db_file, monkeypatch):
+    run_db(lambda: sql.add_user_db(1, None, "A"))
+    monkeypatch.setattr(sql, "migrations", [*sql.migrations, "CREATE TABLE broken (id INTEGER); INSERT INTO missing VALUES (1);"])
+
+    async def main():
+        con = await sql.get_con()
+        with pytest.raises(sqlite3.OperationalError):
+            await sql.migrate_db(con)
+        cur = await con.execute("PRAGMA user_version")
+        version = (await cur.fetchone())[0]
+        cur = await con.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'broken'")
+        return version, (await cur.fetchone())[0]
+
+    async def run():
+        try:
+            return await main()
+        finally:
+            await sql.close_con()
+
+    assert asyncio.run(run()) == (len(sql.migrations) - 1, 0)
+
+def test_user_ids_are_primary_keys(run_db):
+    async def main():
+        async with sql.read_con() as con:
+            cur = await con.execute("EXPLAIN QUERY PLAN SELECT username, full_name FROM users WHERE user_id = 1")
+            return " ".join(row[-1] for row in await cur.fetchall())
+
+    assert "INTEGER PRIMARY KEY" in run_db(main)
+
+def test_bulk_ban_and_unban(run_db):
+    async def main():
+        for user_id in (1, 2, 3):
+            await sql.add_user_db(user_id, None, str(user_id))
+        await sql.add_ban_user_db(3)
+        added = await sql.add_ban_users_db([1, 2, 2, 3, 4])
+        removed = await sql.del_ban_users_db([2, 4, 5])
+        async with sql.read_con() as con:
+            cur = await con.execute("SELECT user_id FROM ban_users ORDER BY user_id")
+            stored = [row[0] for row in await cur.fetchall()]
+        return added, removed, stored
+
+    added, removed, stored = run_db(main)
+    assert added == ([1, 2], [3], [4])
+    assert removed == ([2], [], [4, 5])
+    assert stored == [1, 3]
+    assert sql._ban_users == {1, 3}
+
+def test_pages_walk_forward_and_back(run_db):
+    async def main():
+        for user_id in range(1, 8):
+            await sql.add_user_db(user_id * 10, None, str(user_id))
+        await sql.add_ban_users_db([20, 40, 60])
+        pages = []
+        rows, has_prev, has_next = await sql.page_user_db(limit=3)
+        pages.append(([row[0] for row in rows], has_prev, has_next))
+        while has_next:
+            rows, has_prev, has_next = await sql.page_user_db(rows[-1][0], limit=3)
+            pages.append(([row[0] for row in rows], has_prev, has_next))
+        back = await sql.page_user_db(70, backward=True, limit=3)
+        bans = await sql.page_ban_user_db(limit=2)
+        return pages, ([row[0] for row in back[0]], *back[1:]), ([row[0] for row in bans[0]], *bans[1:])
+
+    pages, back, bans = run_db(main)
+    assert pages == [([10, 20, 30], False, True), ([40, 50, 60], True, True), ([70], True, False)]
+    assert back == ([40, 50, 60], True, True)
+    assert bans == ([20, 40], False, True)
+
+def test_user_changes_since_version(run_db, monkeypatch):
+    monkeypatch.setattr(sql, "flush_interval", 60.0)
+
+    async def main():
+        await sql.add_user_db(1, None, "A")
+        await sql.add_user_db(2, None, "B")
+        full = await sql.get_user_changes_db(0)
+        version = full[0]
+        await sql.update_user_db(1, "@a", "A")
+        await sql.flush_user_updates()
+        await sql.del_user_db(2)
+        await sql.add_user_db(3, None, "C")
+        delta = await sql.get_user_changes_db(version)
+        unchanged = await sql.get_user_changes_db(delta[0])
+        # 客户端的版本号大于当前版本时（数据库被替换过）返回全量
+        replaced = await sql.get_user_changes_db(delta[0] + 100)
+        return full, delta, unchanged, replaced
+
+    full, delta, unchanged, replaced = run_db(main)
+    assert full[1:] == (True, [(1, None, "A"), (2, None, "B")], [])
+    version, is_full, upserts, deletes = delta
+    assert version == full[0] + 3 and not is_full
+    assert sorted(upserts) == [(1, "@a", "A"), (3, None, "C")]
+    assert deletes == [2]
+    assert unchanged == (version, False, [], [])
+    assert replaced[1] is True and sorted(replaced[2]) == [(1, "@a", "A"), (3, None, "C")]
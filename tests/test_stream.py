@@ -0,0 +1,121 @@
+import asyncio
+import httpx
+from telegram_monitoring.src.devices import get_device
+from telegram_monitoring.src.socket_route import state
+from telegram_monitoring.src.stream import Broadcaster
+
+HEADERS = {"Authorization": "Bearer test-token"}
+
+def test_broadcaster_since_and_coalescing():
+    changes = Broadcaster()
+    changes.publish("window", b"1")
+    changes.publish("app", b"2")
+    changes.publish("window", b"3")
+    # 每种类型只保留最新的一条，按版本号升序
+    assert changes.since(0) == [("app", 2, b"2"), ("window", 3, b"3")]
+    assert changes.since(2) == [("window", 3, b"3")]
+    assert changes.since(3) == []
+    # 版本号比当前还大，说明服务端重启过
+    assert changes.since(99) == [("app", 2, b"2"), ("window", 3, b"3")]
+
+    subscriber = changes.subscribe()
+    assert not subscriber.event.is_set()
+    for data in (b"4", b"5", b"6"):
+        changes.publish("window", data)
+    assert subscriber.take() == [("window", 6, b"6")]
+    assert not subscriber.event.is_set() and len(changes) == 1
+    changes.unsubscribe(subscriber)
+    assert len(changes) == 0
+
+def test_broadcaster_wait():
+    async def main():
+        changes = Broadcaster()
+        changes.publish("window", b"1")
+        immediate = await changes.wait(0, 10)
+        timed_out = await changes.wait(1, 0.05)
+        waiter = asyncio.create_task(changes.wait(1, 10))
+        await asyncio.sleep(0.05)
+        changes.publish("app", b"2")
+        woken = await asyncio.wait_for(waiter, 1)
+        return immediate, timed_out, woken, len(changes)
+
+    immediate, timed_out, woken, subscribers = asyncio.run(main())
+    assert immediate == [("window", 1, b"1")]
+    assert timed_out == []
+    assert woken == [("app", 2, b"2")]
+    assert subscribers == 0
+
+def test_poll(run_api):
+    async def main(client):
+        await get_device("poll-pc")
+        empty = await client.get("/poll", params={"device": "poll-pc", "timeout": 0.05})
+        await state.publish({"op": "window", "device": "poll-pc", "title": "Editor", "time": 100})
+        first = await client.get("/poll", params={"device": "poll-pc"})
+        version = first.json()["version"]
+        waiter = asyncio.create_task(client.get("/poll", params={"device": "poll-pc", "since": version, "timeout": 10}))
+        await asyncio.sleep(0.05)
+        await state.publish({"op": "window", "device": "poll-pc", "title": "Browser", "time": 110})
+        second = await asyncio.wait_for(waiter, 5)
+        idle = await client.get("/poll", params={"device": "poll-pc", "since": second.json()["version"], "timeout": 0.05})
+        return empty, first, second, idle
+
+    empty, first, second, idle = run_api(main)
+    assert empty.status_code == 204 and empty.headers["X-Version"] == "0"
+    assert first.json()["window"]["now_window"] == "Editor"
+    assert "app" not in first.json()
+    assert second.json()["version"] == first.json()["version"] + 1
+    assert second.json()["window"]["now_window"] == "Browser"
+    assert idle.status_code == 204 and idle.headers["X-Version"] == str(second.json()["version"])
+
+def test_poll_sees_disconnect(run_api):
+    async def main(client):
+        await get_device("poll-gone")
+        await state.publish({"op": "connect", "device": "poll-gone", "sid": "poll-gone-sid"})
+        await state.publish({"op": "window", "device": "poll-gone", "title": "Editor", "time": 100})
+        first = await client.get("/poll", params={"device": "poll-gone"})
+        await state.publish({"op": "disconnect", "device": "poll-gone", "sid": "poll-gone-sid", "time": 200})
+        return first, await client.get("/poll", params={"device": "poll-gone", "since": first.json()["version"]})
+
+    first, cleared = run_api(main)
+    assert first.json()["window"]["now_window"] == "Editor"
+    # 电脑客户端断开后窗口被清空
+    assert cleared.json() == {"version": first.json()["version"] + 1, "window": {}}
+
+async def _read_events(lines, count: int) -> list[dict[str, str]]:
+    """从 aiter_lines 中读取 count 个 SSE 事件"""
+    events: list[dict[str, str]] = []
+    event: dict[str, str] = {}
+    while len(events) < count:
+        line = await asyncio.wait_for(anext(lines), 5)
+        if not line:
+            if event:
+                events.append(event)
+                event = {}
+        elif not line.startswith(":"):
+            key, _, value = line.partition(": ")
+            event[key] = value
+    return events
+
+def test_stream_resumes_from_last_event_id(run_server):
+    async def main(url):
+        await get_device("stream-pc")
+        for title, at in (("Editor", 100), ("Browser", 110)):
+            await state.publish({"op": "window", "device": "stream-pc", "title": title, "time": at})
+        async with httpx.AsyncClient(base_url=url, headers=HEADERS) as client:
+            async with client.stream("GET", "/stream", params={"device": "stream-pc"}) as response:
+                # 订阅前的变化只发送最新的一条
+                lines = response.aiter_lines()
+                backlog = await _read_events(lines, 1)
+                await state.publish({"op": "window", "device": "stream-pc", "title": "Terminal", "time": 120})
+                live = await _read_events(lines, 1)
+            headers = {"Last-Event-ID": backlog[0]["id"]}
+            async with client.stream("GET", "/stream", params={"device": "stream-pc"}, headers=headers) as response:
+                resumed = await _read_events(response.aiter_lines(), 1)
+        return response.headers, backlog, live, resumed
+
+    headers, backlog, live, resumed = run_server(main)
+    assert headers["content-type"].startswith("text/event-stream")
+    assert backlog[0]["event"] == "window" and '"now_window":"Browser"' in backlog[0]["data"]
+    assert int(live[0]["id"]) == int(backlog[0]["id"]) + 1
+    assert '"now_window":"Terminal"' in live[0]["data"]
+    assert resumed == live
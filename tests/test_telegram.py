@@ -0,0 +1,173 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from telegram_monitoring.src import telegram
+from telegram_monitoring.src.config import config
+from telegram_monitoring.src.ratelimit import SlidingWindowLimiter
+from telegram_monitoring.src.tracing import recent_traces
+
+def _message(text: str, user_id: int = 1, reply=None):
+    return SimpleNamespace(
+        text=text,
+        message_id=10,
+        chat=SimpleNamespace(id=user_id, type="private"),
+        from_user=SimpleNamespace(id=user_id, is_bot=False, full_name="Admin", username="admin"),
+        reply_to_message=reply,
+        entities=None,
+    )
+
+@pytest.fixture
+def fake_bot(monkeypatch):
+    """记录机器人发出的 API 调用，不访问网络"""
+    calls: list[tuple] = []
+
+    async def get_me():
+        return SimpleNamespace(id=999, username="bot")
+
+    async def send_message(chat_id, text, **kwargs):
+        calls.append(("send_message", chat_id, text))
+        return SimpleNamespace(message_id=len(calls) + 100)
+
+    async def send_photo(chat_id, photo, **kwargs):
+        calls.append(("send_photo", chat_id, photo))
+        return SimpleNamespace(message_id=200)
+
+    async def delete_message(chat_id, message_id):
+        calls.append(("delete_message", chat_id, message_id))
+
+    for name, func in (("get_me", get_me), ("send_message", send_message), ("send_photo", send_photo), ("delete_message", delete_message)):
+        monkeypatch.setattr(telegram.bot, name, func)
+    return calls
+
+def test_screenshot_deletes_photo_in_background(fake_bot, monkeypatch):
+    async def client_screenshot(full_name, user_id, device):
+        return b"\x89PNG", True
+
+    monkeypatch.setattr(telegram, "get_client_sid", lambda device: "sid")
+    monkeypatch.setattr(telegram, "client_screenshot", client_screenshot)
+    monkeypatch.setattr(config.telegram.screenshot, "delete_time", 0.3)
+
+    async def main():
+        await telegram.screenshot(_message("/screenshot"))
+        # 命令处理结束时还没有删除，trace 不包含等待删除的时间
+        assert ("delete_message", 1, 200) not in fake_bot
+        trace = recent_traces(1)[0]
+        assert trace["name"] == "screenshot"
+        assert trace["duration_ms"] < 300
+        assert len(telegram._delete_tasks) == 1
+        await asyncio.gather(*telegram._delete_tasks)
+        assert fake_bot[-1] == ("delete_message", 1, 200)
+        assert not telegram._delete_tasks
+
+    asyncio.run(main())
+
+def _reply(text: str, sender_id: int = 7, forwarded_from: int | None = None, hidden: bool = False):
+    if forwarded_from is not None:
+        origin = SimpleNamespace(sender_user=SimpleNamespace(id=forwarded_from))
+    elif hidden:
+        origin = SimpleNamespace(sender_user_name="Hidden")
+    else:
+        origin = None
+    return SimpleNamespace(text=text, from_user=SimpleNamespace(id=sender_id), forward_origin=origin)
+
+@pytest.mark.parametrize(("text", "reply", "expected"), [
+    ("/ban 1 2,3，2", None, ([1, 2, 3], [])),
+    ("/ban 12 abc", None, ([12], ["abc"])),
+    # 回复普通消息时作用于其发送者，不解析文本中的数字
+    ("/ban", _reply("I have 3 cats", sender_id=55), ([55], [])),
+    # 参数与被回复的消息不合并
+    ("/ban 8", _reply("I have 3 cats", sender_id=55), ([8], [])),
+    ("/ban 8", _reply("", forwarded_from=66), ([8], [])),
+    ("/ban", _reply("hello 3", forwarded_from=66), ([66], [])),
+    # 转发的 ID 列表
+    ("/ban", _reply("101, 102\n103", forwarded_from=66), ([101, 102, 103], [])),
+    ("/ban", _reply("spam 4 u", hidden=True), ([], [])),
+])
+def test_parse_user_ids(text, reply, expected):
+    assert telegram.parse_user_ids(_message(text, reply=reply)) == expected
+
+def test_ban_by_reply_bans_sender_not_numbers_in_text(fake_bot, run_db, monkeypatch):
+    changes: list[dict] = []
+
+    async def publish(op: dict) -> None:
+        changes.append(op)
+
+    monkeypatch.setattr(telegram.state, "publish", publish)
+
+    async def main():
+        for user_id in (3, 55):
+            await telegram.add_user_db(user_id, f"@u{user_id}", f"User {user_id}")
+        await telegram.ban_user(_message("/ban", reply=_reply("I have 3 cats", sender_id=55)))
+        return await telegram.check_ban_user_db(3), await telegram.check_ban_user_db(55)
+
+    assert run_db(main) == (False, True)
+    assert fake_bot[-1] == ("send_message", 1, telegram.itr.telegram.ban_user_success.format(user=55))
+    assert changes and changes[-1]["op"] == "users"
+
+def test_bulk_result_uses_empty_list_text(fake_bot, run_db, monkeypatch):
+    async def publish(op: dict) -> None:
+        pass
+
+    monkeypatch.setattr(telegram.state, "publish", publish)
+
+    async def main():
+        await telegram.add_user_db(5, "@u5", "User 5")
+        await telegram.ban_user(_message("/ban 5 6"))
+
+    run_db(main)
+    itr = telegram.itr.telegram
+    empty = itr.empty_list
+    assert fake_bot[-1][2] == itr.bulk_result.format(applied="5", skipped=empty, missing="6", invalid=empty)
+
+def test_flood_thresholds_warn_then_ban(fake_bot, run_db, monkeypatch):
+    changes: list[dict] = []
+
+    async def publish(op: dict) -> None:
+        changes.append(op)
+
+    async def no_reply(full_name, msg):
+        return ""
+
+    async def emit(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(telegram.state, "publish", publish)
+    monkeypatch.setattr(telegram.state, "flood", SlidingWindowLimiter(60.0))
+    monkeypatch.setattr(telegram, "client_toast_with_input", no_reply)
+    monkeypatch.setattr(telegram.sio, "emit", emit)
+    flood = config.telegram.flood
+    itr = telegram.itr.telegram
+
+    async def main():
+        await telegram.add_user_db(1, "@admin", "Admin")
+        replies = []
+        for _ in range(flood.ban + 1):
+            fake_bot.clear()
+            await telegram.all_msg(_message("hello"))
+            replies.append(fake_bot[-1][2] if fake_bot else None)
+        return replies, await telegram.check_ban_user_db(1)
+
+    replies, banned = run_db(main)
+    assert replies[:flood.warn - 1] == [None] * (flood.warn - 1)
+    assert replies[flood.warn - 1:flood.ban] == [itr.ready_flood_message] * (flood.ban - flood.warn + 1)
+    assert replies[flood.ban] == itr.flood_message
+    assert banned
+    assert changes[-1]["op"] == "users"
+
+def test_render_page_buttons(run_db, monkeypatch):
+    monkeypatch.setattr(telegram, "PAGE_SIZE", 2)
+
+    async def main():
+        for user_id in (1, 2, 3):
+            await telegram.add_user_db(user_id, None, f"User {user_id}")
+        first = await telegram.render_page("list")
+        second = await telegram.render_page("list", 2)
+        empty = await telegram.render_page("ban")
+        return first, second, empty
+
+    (first_text, first_markup), (second_text, second_markup), empty = run_db(main)
+    assert first_text.splitlines()[1:] == ["User 1 - 1", "User 2 - 2"]
+    assert [button.callback_data for button in first_markup.keyboard[0]] == ["page:list:n:2"]
+    assert second_text.splitlines()[1:] == ["User 3 - 3"]
+    assert [button.callback_data for button in second_markup.keyboard[0]] == ["page:list:p:3"]
+    assert empty == (telegram.itr.telegram.no_user, None)
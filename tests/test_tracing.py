@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import pytest
+from telegram_monitoring.src import metrics, tracing
+from telegram_monitoring.src.config import config
+from telegram_monitoring.src.metrics import Histogram, instrument
+from telegram_monitoring.src.tracing import annotate, begin_trace, end_trace, recent_traces, span, traced
+
+@pytest.fixture(autouse=True)
+def empty_buffer(monkeypatch):
+    monkeypatch.setattr(tracing, "_finished", type(tracing._finished)(maxlen=config.trace.buffer))
+
+def test_nested_spans_and_errors():
+    @traced()
+    async def query():
+        await asyncio.sleep(0)
+
+    @traced("reply")
+    async def send():
+        with span("format"):
+            pass
+        raise RuntimeError("send failed")
+
+    async def main():
+        handle = begin_trace("command", chat=1)
+        await query()
+        annotate(user=2)
+        try:
+            await send()
+        except RuntimeError as e:
+            end_trace(handle, e)
+
+    asyncio.run(main())
+    trace = recent_traces(1)[0]
+    assert trace["name"] == "command"
+    assert trace["attrs"] == {"chat": 1, "user": 2}
+    assert [(s["name"], s["parent"]) for s in trace["spans"]] == [("command", -1), ("query", 0), ("reply", 0), ("format", 2)]
+    assert trace["spans"][2]["error"] == "RuntimeError('send failed')"
+    assert trace["spans"][3]["error"] is None
+    assert trace["spans"][0]["error"] == "RuntimeError('send failed')"
+
+def test_spans_without_trace_are_ignored():
+    @traced()
+    async def query():
+        annotate(user=1)
+        return 1
+
+    assert asyncio.run(query()) == 1
+    assert recent_traces(10) == []
+
+def test_background_task_does_not_change_finished_trace():
+    async def main():
+        release = asyncio.Event()
+
+        async def later():
+            await release.wait()
+            with span("late"):
+                pass
+
+        handle = begin_trace("command")
+        # 任务复制了当前的上下文，trace 结束后才进入 span
+        task = asyncio.create_task(later())
+        end_trace(handle)
+        release.set()
+        await task
+
+    asyncio.run(main())
+    assert [s["name"] for s in recent_traces(1)[0]["spans"]] == ["command"]
+
+def test_instrument_root_starts_trace_and_slow_trace_is_logged(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "_metrics", [])
+    histogram = Histogram("trace_test_seconds", "Test", ("handler",))
+    monkeypatch.setattr(config.trace, "slow", 10)
+
+    @instrument(histogram)
+    async def db_call():
+        await asyncio.sleep(0.02)
+
+    @instrument(histogram, "handler", root=True)
+    async def handler():
+        await db_call()
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(handler())
+    trace = recent_traces(1)[0]
+    assert [(s["name"], s["parent"]) for s in trace["spans"]] == [("handler", -1), ("db_call", 0)]
+    assert trace["duration_ms"] >= 20
+    assert any(f"Slow trace {trace['trace_id']} handler" in record.getMessage() for record in caplog.records)
+
+def test_recent_traces_order_limit_and_min_ms():
+    durations = {"fast": 0.0, "slow": 0.03, "newest": 0.0}
+
+    async def main():
+        for name, delay in durations.items():
+            handle = begin_trace(name)
+            await asyncio.sleep(delay)
+            end_trace(handle)
+
+    asyncio.run(main())
+    assert [t["name"] for t in recent_traces(10)] == ["newest", "slow", "fast"]
+    assert [t["name"] for t in recent_traces(2)] == ["newest", "slow"]
+    assert [t["name"] for t in recent_traces(10, min_ms=20)] == ["slow"]
+
+def test_traces_endpoint(run_api):
+    async def main(client):
+        end_trace(begin_trace("command"))
+        return await client.get("/traces", params={"limit": 0}), await client.get("/traces", headers={"Authorization": "wrong"})
+
+    response, unauthorized = run_api(main)
+    assert [t["name"] for t in response.json()["traces"]] == ["command"]
+    assert unauthorized.status_code == 401